@@ -0,0 +1,216 @@
+"""
+Memory-aware admission control for concurrent analyses
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+from metrics import metrics
+
+
+# In-memory size of a parsed frame relative to the uploaded file, used when rows cannot be
+# sampled cheaply (whole-document JSON, zipped Excel XML)
+FORMAT_EXPANSION = {
+    'csv': 2.5,
+    'jsonl': 1.5,
+    'ndjson': 1.5,
+    'json': 3.0,
+    'xlsx': 12.0,
+    'xls': 6.0,
+}
+
+# Parsed bytes per cell assumed when no rows were sampled, to count the report's data cells
+UNSAMPLED_CELL_BYTES = 16
+
+
+class AdmissionRejected(Exception):
+    """Raised when an analysis could not be admitted before the queue timeout"""
+
+    def __init__(self, decision):
+        super().__init__(f"Server is at its memory budget ({decision.in_use_mb:.0f} of {decision.budget_mb:.0f} MB in use). Please retry shortly.")
+        self.decision = decision
+
+
+class MemoryEstimate:
+    """Estimated peak memory of one analysis, in full and (if possible) chunked mode"""
+
+    def __init__(self, full_bytes, chunked_bytes=None, basis='format'):
+        self.full_bytes = int(full_bytes)
+        self.chunked_bytes = int(chunked_bytes) if chunked_bytes is not None else None
+        self.basis = basis
+
+    @property
+    def can_downgrade(self):
+        return self.chunked_bytes is not None
+
+
+def estimate_peak_memory(file_size, fmt, sample_rows=0, sample_bytes=0, sample_memory=0, chunkable=False,
+                         sample_columns=0):
+    """Estimate peak pipeline memory from the upload size, its format and a parsed row sample.
+
+    ``sample_memory`` is the deep memory usage of ``sample_rows`` rows (of ``sample_columns``
+    columns) parsed from the first ``sample_bytes`` bytes of the file. Without a sample the
+    per-format expansion is used.
+    """
+    if sample_rows > 0 and sample_bytes > 0:
+        rows = file_size / (sample_bytes / sample_rows)
+        row_width = sample_memory / sample_rows
+        frame_bytes = rows * row_width
+        basis = 'sampled'
+    else:
+        rows = row_width = None
+        frame_bytes = file_size * FORMAT_EXPANSION.get(fmt, 3.0)
+        basis = 'format'
+
+    # Working frame + cleaning/EDA intermediates, then the report workbook: its data sheet holds
+    # every cell as an object, which outweighs the frame itself (~10x for a mostly numeric table)
+    width = row_width if row_width else frame_bytes / max(file_size / 100, 1)
+    row_cells = sample_columns if row_width and sample_columns else width / UNSAMPLED_CELL_BYTES
+    cells = rows * row_cells if rows else frame_bytes / UNSAMPLED_CELL_BYTES
+    full_bytes = frame_bytes * Config.PIPELINE_MEMORY_FACTOR + cells * Config.EXCEL_CELL_BYTES
+
+    chunked_bytes = None
+    if chunkable:
+        # Chunks in flight plus the row sample, and a report over the sample only
+        resident_rows = Config.CHUNK_SIZE * 2 + Config.CHUNKED_SAMPLE_ROWS
+        chunked_bytes = min(full_bytes, resident_rows * width * Config.PIPELINE_MEMORY_FACTOR
+                            + Config.CHUNKED_SAMPLE_ROWS * row_cells * Config.EXCEL_CELL_BYTES)
+
+    return MemoryEstimate(full_bytes, chunked_bytes, basis)
+
+
+class AdmissionDecision:
+    """Outcome of an admission request, reported in the response and metrics"""
+
+    def __init__(self, action, estimate, reserved, budget, in_use, waited=0.0, reason=''):
+        self.action = action  # admit, queue, downgrade or reject
+        self.estimate = estimate
+        self.reserved = reserved
+        self.budget = budget
+        self.in_use = in_use
+        self.waited = waited
+        self.reason = reason
+
+    @property
+    def downgraded(self):
+        return self.action == 'downgrade'
+
+    @property
+    def budget_mb(self):
+        return self.budget / 1024**2
+
+    @property
+    def in_use_mb(self):
+        return self.in_use / 1024**2
+
+    def to_dict(self):
+        return {
+            'action': self.action,
+            'estimated_peak_mb': round(self.estimate.full_bytes / 1024**2, 1),
+            'reserved_mb': round(self.reserved / 1024**2, 1),
+            'budget_mb': round(self.budget_mb, 1),
+            'in_use_mb_at_admission': round(self.in_use_mb, 1),
+            'waited_seconds': round(self.waited, 3),
+            'estimate_basis': self.estimate.basis,
+            'reason': self.reason
+        }
+
+
+class AdmissionController:
+    """Admits, queues or downgrades analyses so their estimated peaks fit a memory budget"""
+
+    def __init__(self, budget_bytes, queue_timeout):
+        self.budget = int(budget_bytes)
+        self.queue_timeout = queue_timeout
+        self.in_use = 0
+        # Bytes kept between requests (retained query frames), taken off the budget
+        self.retained = 0
+        self.active = 0
+        self.queued = 0
+        self._cond = threading.Condition()
+
+    @property
+    def committed(self):
+        return self.in_use + self.retained
+
+    def _fits(self, needed):
+        # An oversized request that cannot be downgraded runs alone
+        return self.committed + min(needed, self.budget) <= self.budget or self.active == 0
+
+    def _publish(self):
+        metrics.set_gauge('admission_memory_in_use_mb', round(self.in_use / 1024**2, 1))
+        metrics.set_gauge('admission_retained_mb', round(self.retained / 1024**2, 1))
+        metrics.set_gauge('admission_active', self.active)
+        metrics.set_gauge('admission_queued', self.queued)
+
+    def acquire(self, estimate):
+        with self._cond:
+            in_use = self.committed
+            action, needed, reason = 'admit', estimate.full_bytes, 'Estimated peak fits the memory budget'
+
+            if estimate.can_downgrade and estimate.full_bytes > self.budget:
+                action, needed, reason = 'downgrade', estimate.chunked_bytes, 'Estimated peak exceeds the whole budget; using chunked mode'
+            elif not self._fits(needed) and estimate.can_downgrade and self._fits(estimate.chunked_bytes):
+                action, needed, reason = 'downgrade', estimate.chunked_bytes, 'Budget is busy; chunked mode fits now'
+
+            start = time.perf_counter()
+            if not self._fits(needed):
+                self.queued += 1
+                self._publish()
+                deadline = start + self.queue_timeout
+                try:
+                    while not self._fits(needed):
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            decision = AdmissionDecision('reject', estimate, 0, self.budget, self.committed, time.perf_counter() - start, 'Queue timeout')
+                            metrics.inc('admission_decisions.reject')
+                            raise AdmissionRejected(decision)
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+                if action == 'admit':
+                    action, reason = 'queue', 'Waited for memory budget'
+
+            waited = time.perf_counter() - start
+            reserved = min(needed, self.budget)
+            self.in_use += reserved
+            self.active += 1
+            self._publish()
+
+        decision = AdmissionDecision(action, estimate, reserved, self.budget, in_use, waited, reason)
+        metrics.inc(f'admission_decisions.{action}')
+        metrics.observe('admission_estimated_peak_mb', estimate.full_bytes / 1024**2)
+        metrics.observe('admission_wait_seconds', waited)
+        return decision
+
+    def retain(self, nbytes):
+        """Set the bytes held between requests; queued analyses are woken when it shrinks"""
+        with self._cond:
+            shrunk = nbytes < self.retained
+            self.retained = int(nbytes)
+            self._publish()
+            if shrunk:
+                self._cond.notify_all()
+
+    def release(self, decision):
+        with self._cond:
+            self.in_use -= decision.reserved
+            self.active -= 1
+            self._publish()
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, estimate):
+        decision = self.acquire(estimate)
+        try:
+            yield decision
+        finally:
+            self.release(decision)
+
+
+admission_controller = AdmissionController(
+    Config.MEMORY_BUDGET_MB * 1024**2,
+    Config.ADMISSION_QUEUE_TIMEOUT
+)
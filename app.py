@@ -1,10 +1,15 @@
 import os
+import csv
 import json
+import shutil
+import tempfile
+import time
 import pandas as pd
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.colors import LogNorm
 import seaborn as sns
 from flask import Flask, render_template, request, jsonify, send_file
 from flask.json.provider import DefaultJSONProvider
@@ -12,7 +17,92 @@ from werkzeug.utils import secure_filename
 from io import BytesIO, StringIO
 import base64
 from datetime import datetime
+from pandas.tseries.api import guess_datetime_format
 from scipy import stats
+from config import Config
+from loaders import read_excel_stream, read_excel_sheets, read_json_lines, iter_json_lines
+from parallel import aggregate_frame, is_parallel, profile_stream
+from admission import admission_controller, estimate_peak_memory, MemoryEstimate, AdmissionRejected
+from metrics import metrics
+from deadline import Deadline, parse_time_budget
+from rollups import build_time_rollups, date_part, GRAIN_LABELS, HIERARCHY_PARTS
+from segments import SegmentCube
+from dedupe import DuplicateKeyError, check_duplicate_key, row_hashes, find_duplicates, parse_duplicate_key
+from outliers import detect_outliers
+from correlation import CorrelationEngine
+from ranking import ColumnRanking
+from incremental import IncrementalState, analysis_store
+from serialization import encode_response, json_frame, parse_field_list, parse_schema_version, shape_result
+from artifacts import artifact_store
+from spill_store import SpillStore
+from query import QueryEngine, parse_query, query_store
+from sql_engine import SQLDialect, SQLiteMirror, generate_queries
+from template_cache import fill, schema_fingerprint, slot, template_cache
+
+# Seaborn's whitegrid look, applied per axes instead of through the global sns.set_style/rcParams
+CHART_STYLE = sns.axes_style('whitegrid')
+CHART_DPI = 100
+
+
+def _style_axes(ax):
+    ax.set_facecolor(CHART_STYLE['axes.facecolor'])
+    ax.set_axisbelow(True)
+    ax.grid(True, color=CHART_STYLE['grid.color'], linestyle=CHART_STYLE['grid.linestyle'])
+    for spine in ax.spines.values():
+        spine.set_edgecolor(CHART_STYLE['axes.edgecolor'])
+    ax.tick_params(bottom=False, left=False, colors=CHART_STYLE['xtick.color'])
+    ax.xaxis.label.set_color(CHART_STYLE['axes.labelcolor'])
+    ax.yaxis.label.set_color(CHART_STYLE['axes.labelcolor'])
+    ax.title.set_color(CHART_STYLE['text.color'])
+
+
+def _new_figure(nrows=1, ncols=1, figsize=(12, 8), styled=True):
+    """Create a standalone Figure and a 2D array of axes without touching pyplot state"""
+    fig = Figure(figsize=figsize, dpi=CHART_DPI, facecolor=CHART_STYLE['figure.facecolor'])
+    axes = fig.subplots(nrows, ncols, squeeze=False)
+    if styled:
+        for ax in axes.flat:
+            _style_axes(ax)
+    return fig, axes
+
+
+def _fig_to_base64(fig):
+    """Render a Figure to a base64-encoded PNG"""
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _pairwise_density(frame, bins=40):
+    """Histograms and pairwise 2D histograms over all rows of the numeric columns of ``frame``.
+
+    Each pair is binned in one vectorized pass over the rows where both values are present;
+    edges are shared per column so the grids line up across the matrix.
+    """
+    values = frame.to_numpy(dtype=float, na_value=np.nan)
+    finite = np.isfinite(values)
+    columns, edges, histograms = [], {}, {}
+    for k, col in enumerate(frame.columns):
+        column = values[finite[:, k], k]
+        if column.size == 0:
+            continue
+        low, high = column.min(), column.max()
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        edges[col] = np.linspace(low, high, bins + 1)
+        histograms[col] = np.histogram(column, bins=edges[col])
+        columns.append(col)
+
+    pairs = {}
+    for a, col1 in enumerate(columns):
+        for col2 in columns[a + 1:]:
+            i, j = frame.columns.get_loc(col1), frame.columns.get_loc(col2)
+            both = finite[:, i] & finite[:, j]
+            counts, _, _ = np.histogram2d(values[both, i], values[both, j], bins=[edges[col1], edges[col2]])
+            pairs[(col1, col2)] = counts
+            pairs[(col2, col1)] = counts.T
+    return {'columns': columns, 'edges': edges, 'histograms': histograms, 'pairs': pairs}
+
 
 class CustomJSONProvider(DefaultJSONProvider):
     def default(self, obj):
@@ -31,12 +121,39 @@ app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 class DataAnalyst:
-    def __init__(self, df):
+    def __init__(self, df, profile=None, deadline=None, duplicate_key=None, time_rollups=None, correlation_stats=None):
         self.df = df
-        self.original_df = df.copy()
+        # Full-data ChunkedProfiler when df is only a sample of a chunk-profiled upload
+        self.profile = profile
+        # Full-data rollups and correlation statistics kept between incremental uploads
+        # (keyed by uploaded column names)
+        self.full_rollups = time_rollups
+        self.correlation_stats = correlation_stats
+        # Optional stages consult the shared time budget before running
+        self.deadline = deadline or Deadline(rows=len(df))
+        # Columns that identify a duplicate row (None = all columns)
+        self.duplicate_key = duplicate_key
+        # Facts about the uploaded frame kept for reports (no full copy of it is held)
+        self.original_rows = len(df)
+        self.original_missing_columns = []
+        # Memory-mapped SpillStore backing self.df once the cleaned frame is spilled to disk
+        self.spill = None
         self.insights = []
         self.charts = []
         self.column_types = {}
+        # Virtual date-hierarchy columns (name -> (datetime column, part)), computed on demand
+        self.date_hierarchies = {}
+        # strftime format of each converted date column, pinned by the generated code
+        self.date_formats = {}
+        self.time_rollups = None
+        self.segment_cube = None
+        self.outliers = None
+        self.correlations = None
+        self.ranking = None
+        self.null_rates = None
+        self.shard_aggregates = None
+        # Schema fingerprint keying the cached code, SQL, DAX and notebook templates
+        self.fingerprint = None
         
     def understand_data(self):
         """Stage 1: Data Understanding"""
@@ -45,8 +162,8 @@ class DataAnalyst:
             'columns': list(self.df.columns),
             'dtypes': self.df.dtypes.astype(str).to_dict(),
             'memory_usage': safe_float(self.df.memory_usage(deep=True).sum() / 1024**2),
-            'head': self.df.head(10).replace({np.nan: None, np.inf: None, -np.inf: None}).to_dict('records'),
-            'tail': self.df.tail(10).replace({np.nan: None, np.inf: None, -np.inf: None}).to_dict('records')
+            'head': json_frame(self.df.head(10)).to_dict('records'),
+            'tail': json_frame(self.df.tail(10)).to_dict('records')
         }
         
         # Classify columns
@@ -65,6 +182,13 @@ class DataAnalyst:
             else:
                 self.column_types[col] = 'categorical'
         
+        if self.profile is not None:
+            # Chunked mode: describe the full dataset rather than the analysis sample
+            full = self.profile.understanding()
+            info.update({key: full[key] for key in ('shape', 'memory_usage', 'head', 'tail')})
+            info['sample_rows'] = len(self.df)
+            self.column_types.update({col: ctype for col, ctype in full['column_types'].items() if col in self.df.columns})
+        
         info['column_types'] = self.column_types
         return info
     
@@ -94,6 +218,7 @@ class DataAnalyst:
         
         # Update column_types with new names
         old_to_new = dict(zip(original_columns, new_columns))
+        self.column_sources = dict(zip(new_columns, original_columns))
         self.column_types = {old_to_new.get(k, k): v for k, v in self.column_types.items()}
         
         if new_columns != original_columns:
@@ -102,7 +227,10 @@ class DataAnalyst:
         
         # Missing values
         missing = self.df.isnull().sum()
+        # Kept for column ranking, since imputation below hides the original gaps
+        self.null_rates = missing / max(len(self.df), 1)
         cleaning_report['missing_values'] = {str(k): int(v) for k, v in missing[missing > 0].items()}
+        self.original_missing_columns = [self.column_sources[col] for col in missing[missing > 0].index]
         
         # Fill missing values with documented imputation strategies
         for col in self.df.columns:
@@ -121,10 +249,18 @@ class DataAnalyst:
                     cleaning_report['imputation_strategies'][col] = 'Categorical: filled with Unknown'
                     cleaning_report['transformations'].append(f"{col}: filled with 'Unknown'")
         
-        # Remove duplicates
-        before = len(self.df)
-        self.df.drop_duplicates(inplace=True)
-        cleaning_report['duplicates_removed'] = before - len(self.df)
+        # Remove duplicates by 64-bit row hash on the duplicate key (all columns by default)
+        subset = None
+        if self.duplicate_key:
+            subset = [old_to_new.get(col, col) for col in self.duplicate_key]
+            check_duplicate_key(self.df.columns, subset)
+        hashes = row_hashes(self.df, subset)
+        duplicated, duplicate_report = find_duplicates(self.df, subset, hashes)
+        if duplicated.any():
+            self.df.drop(index=self.df.index[duplicated], inplace=True)
+        cleaning_report['duplicates_removed'] = duplicate_report['duplicate_rows']
+        cleaning_report['duplicate_key'] = duplicate_report['key']
+        cleaning_report['duplicate_groups'] = duplicate_report['groups']
         
         # Standardize strings
         for col in self.df.select_dtypes(include=['object']).columns:
@@ -134,35 +270,67 @@ class DataAnalyst:
         for col in self.df.columns:
             if self.df[col].dtype == 'object':
                 try:
+                    first = self.df[col].dropna()
+                    first = str(first.iloc[0]) if len(first) else None
                     self.df[col] = pd.to_datetime(self.df[col])
+                    self.date_formats[col] = guess_datetime_format(first) if first else None
                     self.column_types[col] = 'datetime'
                     cleaning_report['transformations'].append(f"{col}: converted to datetime (ISO format)")
                     cleaning_report['bi_recommendations'].append(f"{col}: Date column ready for Power BI/Tableau time intelligence. Create hierarchies: Year, Quarter, Month, Day")
-                    # Create date hierarchies
-                    self.df[f'{col}_Year'] = self.df[col].dt.year
-                    self.df[f'{col}_Quarter'] = self.df[col].dt.quarter
-                    self.df[f'{col}_Month'] = self.df[col].dt.month
-                    self.df[f'{col}_MonthName'] = self.df[col].dt.month_name()
-                    self.df[f'{col}_DayOfWeek'] = self.df[col].dt.day_name()
+                    # Date hierarchies are virtual: materialized only by exports (see with_hierarchies)
+                    names = [f'{col}_{part}' for part in HIERARCHY_PARTS]
+                    self.date_hierarchies.update({name: (col, part) for name, part in zip(names, HIERARCHY_PARTS)})
+                    cleaning_report.setdefault('date_hierarchies', {})[col] = names
                     cleaning_report['transformations'].append(f"{col}: Date hierarchies created (Year, Quarter, Month, MonthName, DayOfWeek)")
                 except:
                     pass
         
-        # Detect outliers
-        for col in self.df.select_dtypes(include=[np.number]).columns:
-            try:
-                Q1 = self.df[col].quantile(0.25)
-                Q3 = self.df[col].quantile(0.75)
-                IQR = Q3 - Q1
-                if not np.isnan(Q1) and not np.isnan(Q3) and not np.isnan(IQR):
-                    outliers = ((self.df[col] < (Q1 - 1.5 * IQR)) | (self.df[col] > (Q3 + 1.5 * IQR))).sum()
-                    if outliers > 0:
-                        cleaning_report['outliers_detected'][col] = int(outliers)
-            except:
-                pass
+        # Large cleaned frames move to memory-mapped files the OS can page out
+        spill = self.spill_to_disk()
+        if spill is not None:
+            cleaning_report['spill'] = {'disk_mb': round(spill.nbytes / 1024**2, 1),
+                                        'resident_columns': [str(spill.columns[idx]['name']) for idx in spill.resident]}
+            cleaning_report['transformations'].append('Cleaned data spilled to memory-mapped column files')
+        
+        # Detect outliers (Config.OUTLIER_METHOD) for the top-ranked measures in one vectorized pass
+        outliers = self._outliers(refresh=True)
+        cleaning_report['outliers_detected'] = {col: int(n) for col, n in outliers.column_counts().items() if n > 0}
+        cleaning_report['outliers'] = outliers.to_dict()
         
         return cleaning_report
     
+    def hierarchy_column(self, name):
+        """Values of a virtual date-hierarchy column, computed from its datetime column"""
+        col, part = self.date_hierarchies[name]
+        return date_part(self.df[col], part).rename(name)
+    
+    def with_hierarchies(self):
+        """The cleaned frame with every date-hierarchy column materialized (for exports)"""
+        if not self.date_hierarchies:
+            return self.df
+        return self.df.assign(**{name: self.hierarchy_column(name) for name in self.date_hierarchies})
+    
+    def spill_to_disk(self):
+        """Move the cleaned frame into a SpillStore once it exceeds ``Config.SPILL_THRESHOLD_MB``.
+        
+        The frame passed in is emptied in place so its memory is released even while the
+        caller still holds a reference; later stages read the memory-mapped copy.
+        """
+        if self.spill is not None or not Config.SPILL_THRESHOLD_MB or len(self.df) == 0:
+            return self.spill
+        if self.df.memory_usage(index=True).sum() < Config.SPILL_THRESHOLD_MB * 1024**2:
+            return None
+        self.spill = SpillStore.from_frame(self.df)
+        spilled = self.spill.frame()
+        self.df.drop(columns=self.df.columns, inplace=True)
+        self.df = spilled
+        return self.spill
+    
+    def close(self):
+        """Release per-analysis resources (the spill directory)"""
+        if self.spill is not None:
+            self.spill.close()
+    
     def perform_eda(self):
         """Stage 3: Exploratory Data Analysis with Detailed Explanations"""
         eda_results = {
@@ -175,22 +343,30 @@ class DataAnalyst:
         
         # Numerical summary with explanations
         numeric_cols = self.df.select_dtypes(include=[np.number]).columns
+        aggregates = self._shard_aggregates()
         if len(numeric_cols) > 0:
-            eda_results['numerical_summary'] = self.df[numeric_cols].describe().replace({np.nan: None, np.inf: None, -np.inf: None}).to_dict()
+            if aggregates is not None:
+                eda_results['numerical_summary'] = aggregates.describe(self.df, numeric_cols)
+            else:
+                eda_results['numerical_summary'] = json_frame(self.df[numeric_cols].describe()).to_dict()
             eda_results['explanations']['numerical'] = 'Statistical summary shows central tendency (mean, median) and spread (std, min, max) for each numerical variable. Use this to identify outliers and understand data distribution.'
             
-            # Correlation matrix
-            if len(numeric_cols) > 1:
-                corr = self.df[numeric_cols].corr()
-                eda_results['correlations'] = corr.replace({np.nan: None, np.inf: None, -np.inf: None}).to_dict()
+            # Correlations: the strongest pairs, plus the matrix of the columns they involve
+            engine = self._correlations()
+            if engine is not None:
+                corr = engine.matrix(engine.leading_columns())
+                eda_results['correlations'] = json_frame(corr).to_dict()
+                eda_results['top_correlations'] = engine.top_pairs()
                 eda_results['explanations']['correlations'] = 'Correlation matrix reveals relationships between numerical variables. Values close to 1 or -1 indicate strong positive or negative relationships, while values near 0 suggest no linear relationship.'
         
-        # Categorical summary with explanations
-        categorical_cols = [col for col in self.df.columns 
-                          if col in self.column_types and self.column_types[col] in ['categorical', 'categorical_numeric']]
+        # Which columns the expensive stages focus on, and why
+        eda_results['column_ranking'] = self._ranking().to_list(Config.MAX_FOCUS_COLUMNS)
+        
+        # Categorical summary with explanations (the most informative dimensions)
+        categorical_cols = self._ranked_categories()
         for col in categorical_cols[:10]:
-            value_counts = self.df[col].value_counts().head(20)
-            eda_results['categorical_summary'][col] = value_counts.to_dict()
+            counts = aggregates.value_counts(col, 20) if aggregates is not None else None
+            eda_results['categorical_summary'][col] = counts if counts is not None else self.df[col].value_counts().head(20).to_dict()
         
         if categorical_cols:
             eda_results['explanations']['categorical'] = 'Categorical analysis shows frequency distribution of non-numerical variables. This helps identify dominant categories and data imbalances.'
@@ -198,43 +374,39 @@ class DataAnalyst:
         return eda_results
     
     def generate_visualizations(self):
-        """Generate high-quality visualizations with base64 encoding"""
+        """Generate high-quality visualizations with base64 encoding.
+
+        Charts are drawn on standalone ``Figure`` objects with per-axes styling, so no pyplot or
+        rcParams global state is touched and several analyses can render from threads at once.
+        """
         charts = []
         
         try:
-            # Set style
-            sns.set_style('whitegrid')
-            plt.rcParams['figure.dpi'] = 100
-            
-            numeric_cols = self.df.select_dtypes(include=[np.number]).columns.tolist()
-            categorical_cols = [col for col in self.df.columns 
-                              if col in self.column_types and self.column_types[col] in ['categorical', 'categorical_numeric']]
+            # Measures and dimensions, most informative first
+            numeric_cols = self._ranked_measures()
+            categorical_cols = self._ranked_categories()
             
             # Chart 1: Correlation Heatmap
-            if len(numeric_cols) > 1:
-                fig, ax = plt.subplots(figsize=(12, 8))
-                corr = self.df[numeric_cols[:10]].corr()
+            engine = self._correlations()
+            if engine is not None and self.deadline.allows('correlation_heatmap'):
+                fig, axes = _new_figure(figsize=(12, 8), styled=False)
+                ax = axes[0, 0]
+                corr = engine.matrix(engine.leading_columns(10))
                 sns.heatmap(corr, annot=True, cmap='coolwarm', center=0, fmt='.2f', 
                            square=True, linewidths=1, cbar_kws={"shrink": 0.8}, ax=ax)
                 ax.set_title('Correlation Matrix - Identifying Relationships', fontsize=16, fontweight='bold', pad=20)
-                plt.tight_layout()
-                
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', bbox_inches='tight')
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.read()).decode()
-                plt.close()
+                fig.tight_layout()
                 
                 charts.append({
                     'title': 'Correlation Heatmap',
-                    'image': img_str,
+                    'image': _fig_to_base64(fig),
                     'explanation': 'This heatmap visualizes correlations between numerical variables. Strong positive correlations (red, close to 1) suggest variables move together, while negative correlations (blue, close to -1) indicate inverse relationships. Use this to identify potential predictors and multicollinearity.'
                 })
             
             # Chart 2: Distribution Analysis for Top Numerical Columns
-            if len(numeric_cols) >= 1:
+            if len(numeric_cols) >= 1 and self.deadline.allows('distribution_charts'):
                 n_cols = min(3, len(numeric_cols))
-                fig, axes = plt.subplots(2, n_cols, figsize=(15, 10), squeeze=False)
+                fig, axes = _new_figure(2, n_cols, figsize=(15, 10))
                 
                 for idx, col in enumerate(numeric_cols[:n_cols]):
                     # Histogram
@@ -250,66 +422,56 @@ class DataAnalyst:
                     axes[1, idx].set_ylabel(col)
                     axes[1, idx].grid(alpha=0.3)
                 
-                plt.suptitle('Numerical Variables - Distribution & Outlier Analysis', fontsize=16, fontweight='bold', y=1.02)
-                plt.tight_layout()
-                
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', bbox_inches='tight')
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.read()).decode()
-                plt.close()
+                fig.suptitle('Numerical Variables - Distribution & Outlier Analysis', fontsize=16, fontweight='bold', y=1.02)
+                fig.tight_layout()
                 
                 charts.append({
                     'title': 'Distribution & Outlier Analysis',
-                    'image': img_str,
+                    'image': _fig_to_base64(fig),
                     'explanation': 'Top row shows histograms revealing data distribution patterns (normal, skewed, bimodal). Bottom row displays boxplots for outlier detection - points outside whiskers are potential outliers requiring investigation.'
                 })
             
             # Chart 3: Top Categories Bar Chart
-            if len(categorical_cols) >= 1:
-                fig, axes = plt.subplots(1, min(3, len(categorical_cols)), figsize=(15, 6))
-                if len(categorical_cols) == 1:
-                    axes = [axes]
+            if len(categorical_cols) >= 1 and self.deadline.allows('category_charts'):
+                fig, axes = _new_figure(1, min(3, len(categorical_cols)), figsize=(15, 6))
                 
                 for idx, col in enumerate(categorical_cols[:3]):
+                    ax = axes[0, idx]
                     top_values = self.df[col].value_counts().head(10)
-                    axes[idx].barh(range(len(top_values)), top_values.values, color='coral', edgecolor='black')
-                    axes[idx].set_yticks(range(len(top_values)))
-                    axes[idx].set_yticklabels(top_values.index)
-                    axes[idx].set_xlabel('Count')
-                    axes[idx].set_title(f'Top 10 {col}', fontweight='bold')
-                    axes[idx].grid(axis='x', alpha=0.3)
-                    axes[idx].invert_yaxis()
+                    ax.barh(range(len(top_values)), top_values.values, color='coral', edgecolor='black')
+                    ax.set_yticks(range(len(top_values)))
+                    ax.set_yticklabels(top_values.index)
+                    ax.set_xlabel('Count')
+                    ax.set_title(f'Top 10 {col}', fontweight='bold')
+                    ax.grid(axis='x', alpha=0.3)
+                    ax.invert_yaxis()
                 
-                plt.suptitle('Categorical Variables - Top Performers', fontsize=16, fontweight='bold')
-                plt.tight_layout()
-                
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', bbox_inches='tight')
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.read()).decode()
-                plt.close()
+                fig.suptitle('Categorical Variables - Top Performers', fontsize=16, fontweight='bold')
+                fig.tight_layout()
                 
                 charts.append({
                     'title': 'Top Categories Analysis',
-                    'image': img_str,
+                    'image': _fig_to_base64(fig),
                     'explanation': 'Bar charts display the most frequent categories in each categorical variable. This reveals dominant segments, market leaders, or popular items. Use this to focus resources on high-impact categories.'
                 })
             
             # Chart 4: Scatter Plot Matrix (if multiple numeric columns)
-            if len(numeric_cols) >= 2:
-                sample_size = min(1000, len(self.df))
-                df_sample = self.df[numeric_cols[:4]].sample(n=sample_size, random_state=42)
-                n_vars = len(df_sample.columns)
+            if len(numeric_cols) >= 2 and self.deadline.allows('scatter_matrix'):
+                # 2D histograms over every row: drawing cost depends on the bin grid, not the row count
+                density = _pairwise_density(self.df[numeric_cols[:4]])
+                n_vars = max(len(density['columns']), 1)
                 
-                fig, axes = plt.subplots(n_vars, n_vars, figsize=(12, 12), squeeze=False)
+                fig, axes = _new_figure(n_vars, n_vars, figsize=(12, 12))
                 
-                for i, col1 in enumerate(df_sample.columns):
-                    for j, col2 in enumerate(df_sample.columns):
+                for i, col1 in enumerate(density['columns']):
+                    for j, col2 in enumerate(density['columns']):
                         if i == j:
-                            axes[i, j].hist(df_sample[col1].dropna(), bins=20, color='steelblue', edgecolor='black', alpha=0.7)
+                            counts, edges = density['histograms'][col1]
+                            axes[i, j].stairs(counts, edges, fill=True, color='steelblue', alpha=0.7)
                         else:
-                            axes[i, j].scatter(df_sample[col2], df_sample[col1], alpha=0.5, s=10, color='steelblue')
+                            counts = density['pairs'][(col2, col1)]
+                            axes[i, j].pcolormesh(density['edges'][col2], density['edges'][col1], np.ma.masked_equal(counts.T, 0),
+                                                  cmap='Blues', norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)))
                         
                         if i == n_vars - 1:
                             axes[i, j].set_xlabel(col2, fontsize=8)
@@ -321,96 +483,87 @@ class DataAnalyst:
                         else:
                             axes[i, j].set_yticklabels([])
                 
-                plt.suptitle('Scatter Plot Matrix - Multivariate Relationships', fontsize=16, fontweight='bold')
-                plt.tight_layout()
-                
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', bbox_inches='tight')
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.read()).decode()
-                plt.close()
+                fig.suptitle(f'Scatter Plot Matrix - Multivariate Relationships ({len(self.df):,} rows)', fontsize=16, fontweight='bold')
+                fig.tight_layout()
                 
                 charts.append({
                     'title': 'Scatter Plot Matrix',
-                    'image': img_str,
-                    'explanation': 'Scatter plot matrix shows pairwise relationships between numerical variables. Diagonal shows distributions, off-diagonal shows correlations. Look for linear patterns (strong correlation) or clusters (segmentation opportunities).'
+                    'image': _fig_to_base64(fig),
+                    'explanation': 'Scatter plot matrix shows pairwise relationships between numerical variables across all rows. Diagonal shows distributions, off-diagonal cells are density plots where darker bins hold more records (log scale). Look for linear patterns (strong correlation) or separate dense regions (segmentation opportunities).'
                 })
             
             # Chart 5: Time Series (if datetime column exists)
             datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime']
-            if datetime_cols and len(numeric_cols) >= 1:
+            if datetime_cols and numeric_cols and self._time_rollup(datetime_cols[0]).rows and self.deadline.allows('time_series_chart'):
                 date_col = datetime_cols[0]
                 value_col = numeric_cols[0]
                 
-                fig, ax = plt.subplots(figsize=(14, 6))
+                fig, axes = _new_figure(figsize=(14, 6))
+                ax = axes[0, 0]
                 
-                # Group by date and aggregate
-                time_series = self.df.groupby(pd.Grouper(key=date_col, freq='M'))[value_col].agg(['sum', 'mean', 'count'])
+                # Served from the rollup cube at the finest grain that stays readable
+                rollup = self._time_rollup(date_col)
+                grain = rollup.grain_for()
+                time_series = rollup.frame(grain, value_col)
                 
                 ax.plot(time_series.index, time_series['sum'], marker='o', linewidth=2, label='Total', color='steelblue')
                 ax.fill_between(time_series.index, time_series['sum'], alpha=0.3, color='steelblue')
                 
-                ax.set_title(f'{value_col} Over Time - Trend Analysis', fontsize=16, fontweight='bold')
+                ax.set_title(f'{value_col} Over Time - {GRAIN_LABELS[grain]} Trend Analysis', fontsize=16, fontweight='bold')
                 ax.set_xlabel('Date', fontsize=12)
                 ax.set_ylabel(value_col, fontsize=12)
                 ax.legend()
                 ax.grid(alpha=0.3)
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', bbox_inches='tight')
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.read()).decode()
-                plt.close()
+                ax.tick_params(axis='x', labelrotation=45)
+                fig.tight_layout()
                 
                 charts.append({
                     'title': 'Time Series Trend',
-                    'image': img_str,
+                    'image': _fig_to_base64(fig),
                     'explanation': 'Time series visualization reveals temporal patterns, trends, and seasonality. Upward trends indicate growth, downward trends suggest decline. Look for cyclical patterns and anomalies for strategic planning.'
                 })
             
             # Chart 6: Segment Performance (if categorical and numerical exist)
-            if len(categorical_cols) >= 1 and len(numeric_cols) >= 1:
+            if len(categorical_cols) >= 1 and numeric_cols and self.deadline.allows('segment_chart'):
                 cat_col = categorical_cols[0]
                 num_col = numeric_cols[0]
                 
-                # Get top categories
-                top_cats = self.df[cat_col].value_counts().head(8).index
-                df_filtered = self.df[self.df[cat_col].isin(top_cats)]
+                # Top categories and their statistics come from the segment cube
+                cube = self._segments()
+                top_cats = cube.frequencies(cat_col, n=8).index
+                stats = cube.table(cat_col, num_col).loc[top_cats]
+                labels = [str(name) for name in stats.index]
+                positions = np.arange(len(stats))
+                std = np.sqrt(stats['var'].fillna(0).to_numpy())
                 
-                fig, axes = plt.subplots(1, 2, figsize=(15, 6))
+                fig, axes = _new_figure(1, 2, figsize=(15, 6))
                 
-                # Boxplot by category
-                df_filtered.boxplot(column=num_col, by=cat_col, ax=axes[0])
-                axes[0].set_title(f'{num_col} Distribution by {cat_col}', fontweight='bold')
-                axes[0].set_xlabel(cat_col)
-                axes[0].set_ylabel(num_col)
-                plt.sca(axes[0])
-                plt.xticks(rotation=45)
+                # Range by category: min-max span, mean +/- one standard deviation
+                axes[0, 0].vlines(positions, stats['min'], stats['max'], color='gray', linewidth=1)
+                axes[0, 0].errorbar(positions, stats['mean'], yerr=std, fmt='o', color='steelblue', ecolor='steelblue', elinewidth=6, alpha=0.8, capsize=0)
+                axes[0, 0].set_xticks(positions)
+                axes[0, 0].set_xlim(-0.5, len(positions) - 0.5)
+                axes[0, 0].set_xticklabels(labels, rotation=45, ha='right')
+                axes[0, 0].set_title(f'{num_col} Distribution by {cat_col}', fontweight='bold')
+                axes[0, 0].set_xlabel(cat_col)
+                axes[0, 0].set_ylabel(num_col)
                 
                 # Bar chart of means
-                means = df_filtered.groupby(cat_col)[num_col].mean().sort_values(ascending=False)
-                axes[1].bar(range(len(means)), means.values, color='coral', edgecolor='black')
-                axes[1].set_xticks(range(len(means)))
-                axes[1].set_xticklabels(means.index, rotation=45, ha='right')
-                axes[1].set_title(f'Average {num_col} by {cat_col}', fontweight='bold')
-                axes[1].set_ylabel(f'Average {num_col}')
-                axes[1].grid(axis='y', alpha=0.3)
-                
-                plt.suptitle('Segment Performance Analysis', fontsize=16, fontweight='bold')
-                plt.tight_layout()
+                means = stats['mean'].sort_values(ascending=False)
+                axes[0, 1].bar(range(len(means)), means.values, color='coral', edgecolor='black')
+                axes[0, 1].set_xticks(range(len(means)))
+                axes[0, 1].set_xticklabels(means.index, rotation=45, ha='right')
+                axes[0, 1].set_title(f'Average {num_col} by {cat_col}', fontweight='bold')
+                axes[0, 1].set_ylabel(f'Average {num_col}')
+                axes[0, 1].grid(axis='y', alpha=0.3)
                 
-                buffer = BytesIO()
-                plt.savefig(buffer, format='png', bbox_inches='tight')
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.read()).decode()
-                plt.close()
+                fig.suptitle('Segment Performance Analysis', fontsize=16, fontweight='bold')
+                fig.tight_layout()
                 
                 charts.append({
                     'title': 'Segment Performance',
-                    'image': img_str,
-                    'explanation': 'Segment analysis compares performance across categories. Left plot shows distribution variability within segments, right plot shows average performance. Identify high-performing segments for resource allocation.'
+                    'image': _fig_to_base64(fig),
+                    'explanation': 'Segment analysis compares performance across categories. Left plot shows the full range (thin line) and mean plus or minus one standard deviation (thick bar) within each segment, right plot shows average performance. Identify high-performing segments for resource allocation.'
                 })
             
         except Exception as e:
@@ -420,15 +573,125 @@ class DataAnalyst:
         
         return charts
     
+    def build_time_rollups(self):
+        """Roll every measure up by day, week, month, quarter and year for each datetime column"""
+        datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime' and col in self.df.columns]
+        measures = self._ranked_measures(Config.MAX_FOCUS_COLUMNS)
+        full = {}
+        if self.full_rollups:
+            # Incremental mode: full-data rollups replace ones built from the sample
+            names = self._cleaned_names()
+            for source, rollup in self.full_rollups.items():
+                if rollup.rows and names.get(source, source) in datetime_cols:
+                    renamed = rollup.renamed(names)
+                    renamed.value_cols = [col for col in measures if col in renamed.value_cols]
+                    full[renamed.date_col] = renamed
+        aggregates = self._shard_aggregates()
+        if aggregates is not None:
+            full.update({col: rollup for col, rollup in aggregates.time_rollups.items() if col not in full})
+        self.time_rollups = build_time_rollups(self.df, [col for col in datetime_cols if col not in full], measures)
+        self.time_rollups.update(full)
+        return self.time_rollups
+    
+    def _time_rollup(self, date_col):
+        if self.time_rollups is None or date_col not in self.time_rollups:
+            self.build_time_rollups()
+        return self.time_rollups.get(date_col)
+    
+    def build_segment_cube(self):
+        """Aggregate every measure by each categorical column (and pairs of the leading ones) in one pass"""
+        categorical_cols = self._ranked_categories(Config.MAX_FOCUS_COLUMNS)
+        value_cols = self._ranked_measures(Config.MAX_FOCUS_COLUMNS)
+        self.segment_cube = SegmentCube.from_frame(self.df, categorical_cols, value_cols,
+                                                   pair_cols=categorical_cols[:Config.SEGMENT_PAIR_COLUMNS])
+        return self.segment_cube
+    
+    def _segments(self):
+        if self.segment_cube is None:
+            self.build_segment_cube()
+        return self.segment_cube
+    
+    def _outliers(self, refresh=False):
+        """Outlier fences, counts and row bitmap for the measures, computed once per cleaned frame"""
+        if self.outliers is None or refresh:
+            self.outliers = detect_outliers(self.df, self._ranked_measures(Config.MAX_FOCUS_COLUMNS))
+        return self.outliers
+    
+    def rank_columns(self):
+        """Score every measure and dimension by variance, null rate, cardinality, KPI name and
+        correlation centrality; the expensive stages run on the top ``Config.MAX_FOCUS_COLUMNS``"""
+        self.ranking = ColumnRanking.from_frame(self.df, self.column_types,
+                                                null_rates=self.null_rates)
+        return self.ranking
+    
+    def _ranking(self):
+        if self.ranking is None:
+            self.rank_columns()
+        return self.ranking
+    
+    def _ranked_measures(self, n=None):
+        """Numeric measures, most informative first"""
+        return self._ranking().top('numeric', n)
+    
+    def _ranked_categories(self, n=None):
+        return self._ranking().top('categorical', n)
+    
+    def _correlations(self):
+        """Correlation engine over the measures (None with fewer than two), standardized once"""
+        if self.correlations is None:
+            measures = self._ranked_measures(Config.MAX_FOCUS_COLUMNS)
+            if self.correlation_stats is not None and str(Config.CORRELATION_METHOD).lower() == 'pearson':
+                # Incremental mode: full-data sufficient statistics instead of the sample
+                names = self._cleaned_names()
+                tracked = {names.get(source, source): source for source in self.correlation_stats.columns}
+                columns = [col for col in measures if col in tracked]
+                if len(columns) >= 2:
+                    self.correlations = CorrelationEngine.from_stats(self.correlation_stats, [tracked[col] for col in columns], labels=columns)
+                    return self.correlations
+            if len(measures) < 2:
+                return None
+            aggregates = self._shard_aggregates()
+            if aggregates is not None and aggregates.correlation_stats is not None and str(Config.CORRELATION_METHOD).lower() == 'pearson':
+                self.correlations = CorrelationEngine.from_stats(aggregates.correlation_stats)
+                return self.correlations
+            self.correlations = CorrelationEngine.from_frame(self.df, measures)
+        return self.correlations
+    
+    def _shard_aggregates(self):
+        """Column profiles, correlation statistics and time rollups of the cleaned frame from one
+        process-parallel map-reduce over row shards (None below ``Config.PARALLEL_MIN_ROWS`` rows,
+        with a single worker, or when ``df`` is only a sample)"""
+        if self.shard_aggregates is None and self.profile is None and is_parallel(len(self.df)):
+            numeric_cols = list(self.df.select_dtypes(include=[np.number]).columns)
+            columns = list(dict.fromkeys(numeric_cols + self._ranked_categories(10)))
+            datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime' and col in self.df.columns]
+            self.shard_aggregates = aggregate_frame(self.df, columns, self._ranked_measures(Config.MAX_FOCUS_COLUMNS), datetime_cols)
+        return self.shard_aggregates
+    
+    def _cleaned_names(self):
+        """Uploaded column name -> cleaned column name"""
+        return {source: col for col, source in getattr(self, 'column_sources', {}).items()}
+    
+    def _full_column_profile(self, col):
+        """Full-data numeric ColumnProfile for a (cleaned) column name in chunked mode"""
+        if self.profile is None:
+            return None
+        source = getattr(self, 'column_sources', {}).get(col, col)
+        full = self.profile.columns.get(source)
+        if full is None or full.kind != 'numeric' or full.count == 0:
+            return None
+        return full
+    
     def generate_insights(self):
         """Stage 4: Business Insights with Detailed Analysis"""
         insights = []
         detailed_insights = {}
         
         # Dataset overview
-        insights.append(f"Dataset contains {len(self.df):,} records and {len(self.df.columns)} columns")
+        total_records = self.profile.rows if self.profile is not None else len(self.df)
+        insights.append(f"Dataset contains {total_records:,} records and {len(self.df.columns)} columns")
         detailed_insights['overview'] = {
-            'total_records': len(self.df),
+            'total_records': total_records,
             'total_columns': len(self.df.columns),
             'explanation': 'This represents the complete dataset dimensions. Each record is a unique observation, and each column represents a different variable or attribute.'
         }
@@ -442,12 +705,22 @@ class DataAnalyst:
             col_lower = col.lower()
             if any(kw in col_lower for kw in kpi_keywords):
                 try:
-                    total = self.df[col].sum()
-                    avg = self.df[col].mean()
-                    median = self.df[col].median()
-                    std = self.df[col].std()
-                    min_val = self.df[col].min()
-                    max_val = self.df[col].max()
+                    full = self._full_column_profile(col)
+                    if full is not None:
+                        # Chunked mode: KPI totals come from the full data, not the sample
+                        total = full.mean * full.count
+                        avg = full.mean
+                        median = full.sketch.quantiles([0.5])[0]
+                        std = full.std()
+                        min_val = full.min
+                        max_val = full.max
+                    else:
+                        total = self.df[col].sum()
+                        avg = self.df[col].mean()
+                        median = self.df[col].median()
+                        std = self.df[col].std()
+                        min_val = self.df[col].min()
+                        max_val = self.df[col].max()
                     
                     # Check for NaN/Inf values
                     if any(np.isnan(v) or np.isinf(v) for v in [total, avg, median, std, min_val, max_val]):
@@ -470,39 +743,78 @@ class DataAnalyst:
         detailed_insights['kpi_analysis'] = kpi_analysis
         
         # Top performers with detailed breakdown
-        categorical_cols = [col for col in self.df.columns 
-                          if col in self.column_types and self.column_types[col] in ['categorical', 'categorical_numeric']]
+        categorical_cols = self._ranked_categories()
         
+        cube = self._segments()
         top_performers = []
         for cat_col in categorical_cols[:5]:
-            if self.df[cat_col].nunique() < 100:
-                top_items = self.df[cat_col].value_counts().head(5)
+            frequencies = cube.frequencies(cat_col)
+            unique_count = len(frequencies)
+            if unique_count < 100:
+                top_items = frequencies.head(5)
                 if len(top_items) > 0:
                     insights.append(f"Top {cat_col}: {top_items.index[0]} ({top_items.values[0]:,} occurrences)")
                     top_performers.append({
                         'category': cat_col,
                         'top_5': {str(k): int(v) for k, v in top_items.items()},
-                        'unique_count': int(self.df[cat_col].nunique()),
-                        'explanation': f'The {cat_col} category has {self.df[cat_col].nunique()} unique values. The top performer is "{top_items.index[0]}" appearing {top_items.values[0]:,} times ({(top_items.values[0]/len(self.df)*100):.1f}% of total).'
+                        'unique_count': unique_count,
+                        'explanation': f'The {cat_col} category has {unique_count} unique values. The top performer is "{top_items.index[0]}" appearing {top_items.values[0]:,} times ({(top_items.values[0]/len(self.df)*100):.1f}% of total).'
                     })
         
         detailed_insights['top_performers'] = top_performers
         
+        # Segment performance on the leading measure, read from the segment cube
+        measure_cols = self._ranked_measures()
+        segment_performance = []
+        if measure_cols:
+            value_col = measure_cols[0]
+            for dims in cube.dimensions():
+                top = cube.top(dims, value_col, by='sum', n=3)
+                if top is None or top.empty:
+                    continue
+                segment_name = ' x '.join(dims)
+                best = top.index[0]
+                best_label = ' / '.join(map(str, best)) if isinstance(best, tuple) else str(best)
+                segment_performance.append({
+                    'segment': segment_name,
+                    'value_column': value_col,
+                    'top_segments': [
+                        {'segment': ' / '.join(map(str, key)) if isinstance(key, tuple) else str(key),
+                         'total': float(row['sum']), 'average': float(row['mean']), 'count': int(row['count'])}
+                        for key, row in top.iterrows()
+                    ],
+                    'explanation': f'By {segment_name}, "{best_label}" contributes the highest total {value_col} ({top["sum"].iloc[0]:,.2f} across {int(top["count"].iloc[0]):,} records, average {top["mean"].iloc[0]:,.2f}).'
+                })
+        detailed_insights['segment_performance'] = segment_performance
+        
         # Datetime trends with detailed analysis
         datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime']
-        if datetime_cols:
-            date_col = datetime_cols[0]
-            date_range = f"{self.df[date_col].min()} to {self.df[date_col].max()}"
-            insights.append(f"Date range: {date_range}")
+        rollup = self._time_rollup(datetime_cols[0]) if datetime_cols else None
+        if rollup is not None and rollup.rows:
+            date_col = rollup.date_col
+            start, end = rollup.first, rollup.last
+            insights.append(f"Date range: {start} to {end}")
             
-            time_span = (self.df[date_col].max() - self.df[date_col].min()).days
+            time_span = (end - start).days
             detailed_insights['temporal_analysis'] = {
                 'date_column': date_col,
-                'start_date': str(self.df[date_col].min()),
-                'end_date': str(self.df[date_col].max()),
+                'start_date': str(start),
+                'end_date': str(end),
                 'time_span_days': int(time_span),
-                'explanation': f'The dataset spans {time_span} days from {self.df[date_col].min()} to {self.df[date_col].max()}. This temporal coverage allows for trend analysis and seasonality detection.'
+                'periods': {grain: rollup.periods(grain) for grain in rollup.grains},
+                'explanation': f'The dataset spans {time_span} days from {start} to {end}. This temporal coverage allows for trend analysis and seasonality detection.'
             }
+            
+            if rollup.value_cols and rollup.periods('month') > 1:
+                value_col = rollup.value_cols[0]
+                monthly = rollup.frame('month', value_col)['sum']
+                peak = monthly.idxmax()
+                detailed_insights['temporal_analysis']['peak_month'] = {
+                    'month': peak.strftime('%Y-%m'),
+                    'column': value_col,
+                    'total': float(monthly[peak])
+                }
+                insights.append(f"Peak month for {value_col}: {peak.strftime('%Y-%m')} (total {monthly[peak]:,.2f})")
         
         # Data quality with detailed metrics
         missing_pct = (self.df.isnull().sum().sum() / (len(self.df) * len(self.df.columns))) * 100
@@ -518,155 +830,310 @@ class DataAnalyst:
         # Statistical insights for numerical columns
         if len(numeric_cols) > 0:
             correlations = []
-            if len(numeric_cols) > 1:
-                try:
-                    corr_matrix = self.df[numeric_cols].corr()
-                    # Find strongest correlations
-                    for i in range(len(corr_matrix.columns)):
-                        for j in range(i+1, len(corr_matrix.columns)):
-                            corr_val = corr_matrix.iloc[i, j]
-                            if not np.isnan(corr_val) and not np.isinf(corr_val) and abs(corr_val) > 0.5:
-                                correlations.append({
-                                    'var1': str(corr_matrix.columns[i]),
-                                    'var2': str(corr_matrix.columns[j]),
-                                    'correlation': float(corr_val),
-                                    'strength': 'Strong' if abs(corr_val) > 0.7 else 'Moderate',
-                                    'explanation': f'{corr_matrix.columns[i]} and {corr_matrix.columns[j]} show a {"strong" if abs(corr_val) > 0.7 else "moderate"} {"positive" if corr_val > 0 else "negative"} correlation ({corr_val:.3f}).'
-                                })
-                except:
-                    pass
+            engine = self._correlations()
+            if engine is not None:
+                # Strongest pairs from the blocked engine; weak ones are not worth reporting
+                for pair in engine.top_pairs():
+                    if pair['strength'] == 'Weak':
+                        continue
+                    corr_val = pair['correlation']
+                    correlations.append(dict(pair, explanation=f'{pair["var1"]} and {pair["var2"]} show a {pair["strength"].lower()} {"positive" if corr_val > 0 else "negative"} correlation ({corr_val:.3f}).'))
+                
+                # Top drivers of the leading KPI
+                kpi_col = next((item['column'] for item in kpi_analysis if item['column'] in engine.columns), None)
+                if kpi_col is not None:
+                    drivers = engine.drivers(kpi_col)
+                    detailed_insights['kpi_drivers'] = {
+                        'kpi': kpi_col,
+                        'method': engine.method,
+                        'drivers': drivers,
+                        'explanation': f'Columns most correlated with {kpi_col} ({engine.method}). Strong drivers are candidates for predicting and influencing {kpi_col}.'
+                    }
+                    if drivers and drivers[0]['strength'] != 'Weak':
+                        insights.append(f"Top driver of {kpi_col}: {drivers[0]['column']} (r = {drivers[0]['correlation']:.2f})")
             
             detailed_insights['correlations'] = correlations
         
         self.detailed_insights = detailed_insights
         return insights, detailed_insights
     
+    def _code_schema(self):
+        """What the generated code pins when it reads the source file, keyed by original column
+        names: the columns to load, their dtypes and date formats, and the ranked measures.
+        Integer columns are left to the parser: pinning them would need the nullable Int64 dtype
+        (in case rows the analysis did not see have gaps), which parses several times slower.
+        Wide files load only the focus columns the analysis used."""
+        source = getattr(self, 'column_sources', {})
+        wide = len(self.df.columns) > Config.MAX_FOCUS_COLUMNS
+        keep = set(self._ranked_measures(Config.MAX_FOCUS_COLUMNS)) | set(self._ranked_categories(Config.MAX_FOCUS_COLUMNS))
+        keep |= {col for col, ctype in self.column_types.items() if ctype == 'datetime'}
+        keep |= {col for col in self.df.columns if source.get(col, col) in (self.duplicate_key or ())}
+        usecols, dtypes, dates, rename = [], {}, {}, {}
+        for col in self.df.columns:
+            if wide and col not in keep:
+                continue
+            original = source.get(col, col)
+            usecols.append(original)
+            if original != col:
+                rename[original] = col
+            ctype, dtype = self.column_types.get(col), self.df[col].dtype
+            if ctype == 'datetime':
+                dates[original] = self.date_formats.get(col)
+            elif ctype == 'boolean':
+                dtypes[original] = 'boolean'
+            elif pd.api.types.is_float_dtype(dtype):
+                dtypes[original] = 'float64'
+            elif ctype == 'categorical':
+                dtypes[original] = 'category'
+        measures = [source.get(col, col) for col in self._ranked_measures(Config.MAX_CORRELATION_COLUMNS)]
+        return {'usecols': usecols, 'dtypes': dtypes, 'dates': dates, 'rename': rename, 'measures': measures}
+    
+    def _read_source_code(self, filename, schema):
+        """Constants and a ``read_data`` function that load ``filename`` with the pinned schema"""
+        constants = f"""USECOLS = {schema['usecols']!r}
+DTYPES = {schema['dtypes']!r}
+DATE_FORMATS = {schema['dates']!r}  # None: pandas infers the format"""
+        if filename.endswith(('.xlsx', '.xls')):
+            reader = "df = pd.read_excel(path, usecols=USECOLS, dtype=DTYPES)"
+        elif filename.endswith(('.json', '.jsonl', '.ndjson')):
+            lines = ', lines=True' if filename.endswith(('.jsonl', '.ndjson')) else ''
+            reader = f"df = pd.read_json(path{lines}, dtype=False)[USECOLS].astype(DTYPES)"
+        else:
+            return constants + """
+CHUNKSIZE = None  # Rows per chunk (e.g. 1_000_000) to parse a file larger than memory
+
+
+def read_data(path, chunksize=CHUNKSIZE):
+    options = dict(usecols=USECOLS, dtype=DTYPES, parse_dates=list(DATE_FORMATS),
+                   date_format={col: fmt for col, fmt in DATE_FORMATS.items() if fmt})
+    if chunksize is None:
+        return pd.read_csv(path, **options)
+    chunks = list(pd.read_csv(path, chunksize=chunksize, **options))
+    df = pd.concat(chunks, ignore_index=True)
+    # Chunks see different categories; union them rather than falling back to object
+    for col, dtype in DTYPES.items():
+        if dtype == 'category' and df[col].dtype != 'category':
+            df[col] = union_categoricals([chunk[col] for chunk in chunks])
+    return df"""
+        return constants + f"""
+
+
+def read_data(path):
+    {reader}
+    for col, fmt in DATE_FORMATS.items():
+        df[col] = pd.to_datetime(df[col], format=fmt)
+    return df"""
+    
+    def _template_fingerprint(self):
+        """Fingerprint of what the generated artifacts depend on besides the data itself: the
+        uploaded and cleaned column names, dtypes and inferred types, date formats, the ranked
+        measures (KPI first) and dimensions, the trend columns, the duplicate key and whether
+        anything was missing"""
+        if self.fingerprint is None:
+            source = getattr(self, 'column_sources', {})
+            datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime']
+            rollup = self._time_rollup(datetime_cols[0]) if datetime_cols else None
+            self.fingerprint = schema_fingerprint({
+                'columns': [[source.get(col, col), col, str(self.df[col].dtype)] for col in self.df.columns],
+                'column_types': list(self.column_types.items()),
+                'date_formats': self.date_formats,
+                'measures': self._ranked_measures(),
+                'categories': self._ranked_categories(),
+                'trend': [rollup.date_col, rollup.value_cols] if rollup is not None else None,
+                'duplicate_key': self.duplicate_key,
+                'missing': bool(self.original_missing_columns)
+            })
+        return self.fingerprint
+    
+    def _from_template(self, artifact, variant, build, values):
+        """``build()``'s template for this schema (cached, so same-shaped datasets skip the
+        generation) with the data-dependent ``values`` filled into its slots"""
+        key = (self._template_fingerprint(), artifact, variant)
+        return fill(template_cache.get_or_build(key, build), values)
+    
+    @staticmethod
+    def _split_suffix(filename):
+        """``(stem, suffix)``; only the suffix shapes generated code, so the stem is a slot"""
+        suffix = filename[filename.rfind('.'):] if '.' in filename else ''
+        return filename[:len(filename) - len(suffix)], suffix
+    
     def generate_python_code(self, filename='your_data.csv'):
-        """Stage 5: Python Pandas Code"""
-        code = f"""import pandas as pd
+        """Stage 5: Python Pandas Code, written to rerun fast on the full dataset: pinned
+        schema, vectorized cleaning, correlations over the ranked measures, one chart file"""
+        stem, suffix = self._split_suffix(filename)
+        return self._from_template('python_code', suffix, lambda: self._python_code_template(slot('file_stem') + suffix), {'file_stem': stem})
+    
+    def _python_code_template(self, filename):
+        schema = self._code_schema()
+        dedupe_args = f"subset={list(self.duplicate_key)!r}" if self.duplicate_key else ""
+        code = f"""import time
+from contextlib import contextmanager
+
 import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Load data
-# Replace with your actual file path
-df = pd.read_csv('{filename}')  # Adjust file path as needed
+# Schema found by the analysis. Pinning it skips type inference on the full file,
+# loads only the columns used and keeps repeated text as categoricals.
+SOURCE = '{filename}'  # Adjust file path as needed
+{self._read_source_code(filename, schema)}
+
+MEASURES = {schema['measures']!r}  # Ranked numeric columns
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    yield
+    print(f"[{{name}}: {{time.perf_counter() - start:.2f}}s]")
+
+
+def tidy_text(s):
+    \"\"\"Strip and title-case a categorical's distinct values (not every row); gaps become 'Unknown'\"\"\"
+    labels = s.cat.categories.astype(str).str.strip().str.title()
+    categories = labels.append(pd.Index(['Unknown'])).unique()
+    lookup = np.append(categories.get_indexer(labels), categories.get_loc('Unknown'))
+    return pd.Series(pd.Categorical.from_codes(lookup[s.cat.codes], categories), index=s.index, name=s.name)
+
+
+with stage('load'):
+    df = read_data(SOURCE)
 
 # Data Understanding
 print("Shape:", df.shape)
-print("\\nColumns:", df.columns.tolist())
 print("\\nData Types:")
 print(df.dtypes)
 print("\\nFirst 10 rows:")
 print(df.head(10))
-print("\\nLast 10 rows:")
-print(df.tail(10))
-
-# Data Cleaning
 print("\\nMissing Values:")
 print(df.isnull().sum())
 
-# Fill missing values
-for col in df.select_dtypes(include=[np.number]).columns:
-    df[col].fillna(df[col].median(), inplace=True)
-for col in df.select_dtypes(include=['object']).columns:
-    df[col].fillna('Unknown', inplace=True)
-
-# Remove duplicates
-df.drop_duplicates(inplace=True)
-
-# Standardize strings
-for col in df.select_dtypes(include=['object']).columns:
-    df[col] = df[col].str.strip().str.title()
-
-# EDA - Numerical Summary
-print("\\nNumerical Summary:")
-print(df.describe())
-
-# EDA - Categorical Summary
-categorical_cols = df.select_dtypes(include=['object']).columns
-for col in categorical_cols:
-    print(f"\\n{{col}} - Top 10:")
-    print(df[col].value_counts().head(10))
-
-# Correlation Matrix
-numeric_df = df.select_dtypes(include=[np.number])
-if len(numeric_df.columns) > 1:
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(numeric_df.corr(), annot=True, cmap='coolwarm', center=0)
-    plt.title('Correlation Matrix')
-    plt.tight_layout()
-    plt.savefig('correlation_matrix.png')
-    plt.close()
-
-# Visualizations
-for col in numeric_df.columns[:5]:
-    plt.figure(figsize=(10, 6))
-    plt.subplot(1, 2, 1)
-    plt.hist(df[col].dropna(), bins=30, edgecolor='black')
-    plt.title(f'{{col}} Distribution')
-    plt.xlabel(col)
-    plt.ylabel('Frequency')
-    
-    plt.subplot(1, 2, 2)
-    plt.boxplot(df[col].dropna())
-    plt.title(f'{{col}} Boxplot')
-    plt.ylabel(col)
-    plt.tight_layout()
-    plt.savefig(f'{{col}}_analysis.png')
-    plt.close()
+with stage('clean'):
+    # Numeric gaps in one fill: median below 5% missing, mean otherwise
+    numeric = df.select_dtypes(include=[np.number])
+    df[numeric.columns] = numeric.fillna(numeric.median().where(numeric.isna().mean() < 0.05, numeric.mean()))
+    
+    # Remove duplicates
+    df = df.drop_duplicates({dedupe_args})
+    
+    # Standardize text: categoricals per distinct value, other text columns row by row
+    for col in df.select_dtypes(include=['category']).columns:
+        df[col] = tidy_text(df[col])
+    text = df.select_dtypes(include=['object', 'string']).columns
+    df[text] = df[text].fillna('Unknown').apply(lambda s: s.str.strip().str.title())
+
+with stage('eda'):
+    print("\\nNumerical Summary:")
+    print(df.describe())
+    for col in df.select_dtypes(include=['category']).columns:
+        print(f"\\n{{col}} - Top 10:")
+        print(df[col].value_counts().head(10))
+    # Correlations over the ranked measures only, not every numeric column
+    corr = df[MEASURES].corr() if len(MEASURES) > 1 else None
+
+with stage('charts'):
+    if corr is not None:
+        fig, ax = plt.subplots(figsize=(10, 8))
+        sns.heatmap(corr, annot=len(MEASURES) <= 12, cmap='coolwarm', center=0, ax=ax)
+        ax.set_title('Correlation Matrix')
+        fig.tight_layout()
+        fig.savefig('correlation_matrix.png')
+        plt.close(fig)
+    
+    # One figure for the leading measures rather than one PNG per column
+    shown = MEASURES[:5]
+    if shown:
+        fig, axes = plt.subplots(len(shown), 2, figsize=(12, 3 * len(shown)), squeeze=False)
+        for (hist_ax, box_ax), col in zip(axes, shown):
+            values = df[col].dropna().to_numpy(dtype=float)
+            hist_ax.hist(values, bins=30, edgecolor='black')
+            hist_ax.set_title(f'{{col}} Distribution')
+            box_ax.boxplot(values, vert=False, showfliers=False)
+            box_ax.set_title(f'{{col}} Boxplot (outliers hidden)')
+        fig.tight_layout()
+        fig.savefig('distributions.png')
+        plt.close(fig)
 
 print("\\nAnalysis complete!")
 """
         return code
     
     def generate_sql_queries(self):
-        """Stage 6: SQL Query Generation"""
-        queries = []
-        
-        # Detect potential table name
-        table_name = "dataset"
-        
-        queries.append({
-            "name": "Top 10 Records",
-            "query": f"SELECT * FROM {table_name} LIMIT 10;"
-        })
-        
+        """Stage 6: SQL Query Generation for ``Config.SQL_DIALECT``"""
         # Find potential grouping columns
-        categorical_cols = [col for col in self.df.columns 
-                          if col in self.column_types and self.column_types[col] in ['categorical', 'categorical_numeric']]
-        numeric_cols = self.df.select_dtypes(include=[np.number]).columns.tolist()
-        
+        categorical_cols = self._ranked_categories()
+        numeric_cols = self._ranked_measures()
+        shape = {'group_col': None, 'value_col': None, 'date_col': None, 'trend_col': None, 'since': None}
         if categorical_cols and numeric_cols:
-            group_col = categorical_cols[0]
-            value_col = numeric_cols[0]
-            queries.append({
-                "name": f"Top 10 by {value_col}",
-                "query": f"SELECT {group_col}, SUM({value_col}) as total_{value_col}\nFROM {table_name}\nGROUP BY {group_col}\nORDER BY total_{value_col} DESC\nLIMIT 10;"
-            })
+            shape.update(group_col=categorical_cols[0], value_col=numeric_cols[0])
         
-        # Date-based query
+        # Date-based queries
         datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime']
-        if datetime_cols and numeric_cols:
-            date_col = datetime_cols[0]
-            value_col = numeric_cols[0]
-            queries.append({
-                "name": "Monthly Trend",
-                "query": f"SELECT DATE_TRUNC('month', {date_col}) as month,\n       SUM({value_col}) as total_{value_col}\nFROM {table_name}\nGROUP BY month\nORDER BY month;"
-            })
-        
-        queries.append({
-            "name": "Data Quality Check",
-            "query": f"SELECT COUNT(*) as total_records,\n       COUNT(DISTINCT *) as unique_records\nFROM {table_name};"
-        })
-        
+        rollup = self._time_rollup(datetime_cols[0]) if datetime_cols else None
+        if rollup is not None and rollup.value_cols:
+            latest = self.df[rollup.date_col].max()
+            since = (latest.to_period('M') - 11).to_timestamp() if pd.notna(latest) else None
+            shape.update(date_col=rollup.date_col, trend_col=rollup.value_cols[0], since=since)
+        self.sql_shape = shape
+        
+        dialect = SQLDialect()
+        values = {}
+        if shape['since'] is not None:
+            values['since'] = dialect.timestamp(shape['since'])
+        if shape['trend_col']:
+            # Result previews come from the rollup cube rather than re-running the query
+            values.update(month_preview=rollup.preview('month', shape['trend_col']),
+                          year_preview=rollup.preview('year', shape['trend_col']))
+        return self._from_template('sql_queries', (dialect.name, shape['since'] is not None),
+                                   lambda: self._sql_template(dialect, shape), values)
+    
+    @staticmethod
+    def _sql_template(dialect, shape):
+        """The generated queries with the trailing-year cutoff and the trend previews as slots"""
+        queries = generate_queries(dialect, **shape)
+        previews = {'Monthly Trend': 'month_preview', 'Yearly Trend': 'year_preview'}
+        for query in queries:
+            if query['name'] == 'Last 12 Months':
+                query['query'] = query['query'].replace(f">= {dialect.timestamp(shape['since'])}", f">= {slot('since')}")
+            elif query['name'] in previews and shape['trend_col']:
+                query['preview'] = slot(previews[query['name']])
+        return queries
+    
+    def validate_sql_queries(self, queries):
+        """Stage 6.5: run the SQLite form of each generated query on an SQLite copy of the cleaned
+        data and attach ``validation`` (validity, execution time, preview rows, query plan)"""
+        shape = self.sql_shape
+        indexes = [(col, measure) for col, measure in ((shape['group_col'], shape['value_col']), (shape['date_col'], shape['trend_col'])) if col]
+        local = generate_queries(SQLDialect('sqlite'), **shape)
+        with SQLiteMirror.from_frame(self.df, indexes) as mirror:
+            for query, sqlite_query in zip(queries, local):
+                validation = mirror.execute(sqlite_query['query'])
+                if sqlite_query['query'] != query['query']:
+                    validation['query'] = sqlite_query['query']
+                query['validation'] = validation
         return queries
     
     def generate_dax_measures(self):
         """Stage 7: Power BI DAX Measures"""
+        datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime']
+        rollup = self._time_rollup(datetime_cols[0]) if datetime_cols else None
+        values = {}
+        if rollup is not None and rollup.value_cols:
+            value_col = rollup.value_cols[0]
+            yearly = rollup.frame('year', value_col)['sum']
+            growth = yearly.pct_change().replace([np.inf, -np.inf], np.nan)
+            values['yoy_preview'] = [
+                {'year': period.year, f'total_{value_col}': float(total), 'yoy_growth': None if pd.isna(change) else float(change)}
+                for period, total, change in zip(yearly.index, yearly.values, growth.values)
+            ]
+        return self._from_template('dax_measures', None, lambda: self._dax_template(rollup), values)
+    
+    def _dax_template(self, rollup):
         measures = []
         
-        numeric_cols = self.df.select_dtypes(include=[np.number]).columns.tolist()
+        numeric_cols = self._ranked_measures()
         
         for col in numeric_cols[:5]:
             measures.append({
@@ -684,12 +1151,12 @@ print("\\nAnalysis complete!")
             "dax": "Total Records = COUNTROWS(Dataset)"
         })
         
-        datetime_cols = [col for col, ctype in self.column_types.items() if ctype == 'datetime']
-        if datetime_cols and numeric_cols:
-            value_col = numeric_cols[0]
+        if rollup is not None and rollup.value_cols:
+            value_col = rollup.value_cols[0]
             measures.append({
                 "name": f"{value_col} YoY Growth",
-                "dax": f"{value_col} YoY Growth = \nVAR CurrentYear = SUM('{value_col}'[{value_col}])\nVAR PreviousYear = CALCULATE(SUM('{value_col}'[{value_col}]), SAMEPERIODLASTYEAR(Date[Date]))\nRETURN DIVIDE(CurrentYear - PreviousYear, PreviousYear, 0)"
+                "dax": f"{value_col} YoY Growth = \nVAR CurrentYear = SUM('{value_col}'[{value_col}])\nVAR PreviousYear = CALCULATE(SUM('{value_col}'[{value_col}]), SAMEPERIODLASTYEAR(Date[Date]))\nRETURN DIVIDE(CurrentYear - PreviousYear, PreviousYear, 0)",
+                "preview": slot('yoy_preview')
             })
         
         return measures
@@ -736,7 +1203,8 @@ print("\\nAnalysis complete!")
         if len(cat_cols) > 0 and len(numeric_cols) > 0:
             cat_col = cat_cols[0]
             num_col = numeric_cols[0]
-            top_cat = self.df.groupby(cat_col)[num_col].sum().idxmax()
+            top = self._segments().top(cat_col, num_col, by='sum', n=1)
+            top_cat = top.index[0] if top is not None and not top.empty else self.df.groupby(cat_col)[num_col].sum().idxmax()
             recommendations.append({
                 'priority': 'HIGH',
                 'recommendation': 'Focus on Top Performers',
@@ -746,14 +1214,8 @@ print("\\nAnalysis complete!")
             })
         
         # Recommendation 3: Outliers
-        outlier_cols = []
-        for col in numeric_cols:
-            Q1 = self.df[col].quantile(0.25)
-            Q3 = self.df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            outliers = ((self.df[col] < (Q1 - 1.5 * IQR)) | (self.df[col] > (Q3 + 1.5 * IQR))).sum()
-            if outliers > len(self.df) * 0.05:
-                outlier_cols.append(col)
+        outlier_counts = self._outliers().column_counts()
+        outlier_cols = [col for col in numeric_cols if outlier_counts.get(col, 0) > len(self.df) * 0.05]
         
         if outlier_cols:
             recommendations.append({
@@ -765,19 +1227,15 @@ print("\\nAnalysis complete!")
             })
         
         # Recommendation 4: Correlations
-        if len(numeric_cols) > 1:
-            corr_matrix = self.df[numeric_cols].corr()
-            strong_corr = []
-            for i in range(len(corr_matrix.columns)):
-                for j in range(i+1, len(corr_matrix.columns)):
-                    if abs(corr_matrix.iloc[i, j]) > 0.7:
-                        strong_corr.append((corr_matrix.columns[i], corr_matrix.columns[j]))
+        engine = self._correlations()
+        if engine is not None:
+            strong_corr = engine.strength_counts()['Strong']
             
             if strong_corr:
                 recommendations.append({
                     'priority': 'MEDIUM',
                     'recommendation': 'Leverage Key Drivers',
-                    'action': f'Focus on {len(strong_corr)} strongly correlated variable pairs. Build predictive models.',
+                    'action': f'Focus on {strong_corr} strongly correlated variable pairs. Build predictive models.',
                     'impact': 'Enable proactive decision-making, reduce costs by 20%',
                     'timeline': '1-3 months'
                 })
@@ -813,7 +1271,7 @@ print("\\nAnalysis complete!")
         
         return recommendations
     
-    def generate_excel_report(self, filename):
+    def generate_excel_report(self, filename, include_data=True):
         """Generate professional Excel report with multiple sheets"""
         from openpyxl import Workbook
         from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
@@ -822,16 +1280,18 @@ print("\\nAnalysis complete!")
         wb = Workbook()
         wb.remove(wb.active)
         
-        # Sheet 1: Cleaned Data
-        ws1 = wb.create_sheet("Cleaned_Data")
-        for r in dataframe_to_rows(self.df, index=False, header=True):
-            ws1.append(r)
-        
-        # Format header
-        for cell in ws1[1]:
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-            cell.alignment = Alignment(horizontal="center")
+        # Sheet 1: Cleaned Data (omitted when the time budget only allows the summary sheets)
+        if include_data:
+            ws1 = wb.create_sheet("Cleaned_Data")
+            # Date parts of missing dates are pd.NA; openpyxl only accepts None for an empty cell
+            for r in dataframe_to_rows(self.with_hierarchies(), index=False, header=True):
+                ws1.append([None if value is pd.NA else value for value in r])
+            
+            # Format header
+            for cell in ws1[1]:
+                cell.font = Font(bold=True, color="FFFFFF")
+                cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+                cell.alignment = Alignment(horizontal="center")
         
         # Sheet 2: Statistical Summary
         ws2 = wb.create_sheet("Statistical_Summary")
@@ -866,8 +1326,9 @@ print("\\nAnalysis complete!")
         
         # Sheet 4: Correlation Matrix
         ws4 = wb.create_sheet("Correlation_Matrix")
-        if len(numeric_cols) > 1:
-            corr_df = self.df[numeric_cols].corr()
+        engine = self._correlations()
+        if engine is not None:
+            corr_df = engine.matrix(engine.leading_columns())
             for r in dataframe_to_rows(corr_df, index=True, header=True):
                 ws4.append(r)
             
@@ -877,7 +1338,7 @@ print("\\nAnalysis complete!")
         
         # Sheet 5: Categorical Summary
         ws5 = wb.create_sheet("Categorical_Summary")
-        cat_cols = [col for col in self.df.columns if col in self.column_types and self.column_types[col] in ['categorical', 'categorical_numeric']]
+        cat_cols = self._ranked_categories()
         
         row = 1
         for col in cat_cols[:10]:
@@ -905,7 +1366,7 @@ print("\\nAnalysis complete!")
         
         ws6.append(["Total Records", len(self.df)])
         ws6.append(["Total Columns", len(self.df.columns)])
-        ws6.append(["Duplicates Removed", len(self.original_df) - len(self.df)])
+        ws6.append(["Duplicates Removed", self.original_rows - len(self.df)])
         ws6.append(["Data Completeness %", round(100 - (self.df.isnull().sum().sum() / (len(self.df) * len(self.df.columns)) * 100), 2)])
         
         # Add KPI metrics
@@ -925,7 +1386,7 @@ print("\\nAnalysis complete!")
             cell.alignment = Alignment(horizontal="center")
         
         # Generate recommendations based on data analysis
-        recommendations = self._generate_recommendations(numeric_cols, cat_cols)
+        recommendations = self._generate_recommendations(self._ranked_measures(), cat_cols)
         for rec in recommendations:
             ws7.append([rec['priority'], rec['recommendation'], rec['action'], rec['impact'], rec['timeline']])
         
@@ -961,7 +1422,21 @@ print("\\nAnalysis complete!")
     def generate_notebook(self, filename):
         """Generate clean notebook without embedded code"""
         df_name = filename.replace('.csv', '').replace('.xlsx', '').replace('.xls', '').replace('.json', '').replace(' ', '_')
-        return self._create_clean_notebook(df_name, filename)
+        stem, suffix = self._split_suffix(filename)
+        values = {'df_name': df_name, 'file_stem': stem, 'segment_finding': self._segment_finding_cell()}
+        return self._from_template('notebook', suffix, lambda: self._create_clean_notebook(slot('df_name'), slot('file_stem') + suffix), values)
+    
+    def _segment_finding_cell(self):
+        """Markdown cell naming the best pair of the two leading dimensions for the KPI, from the
+        segment cube (None when there is no such pair)"""
+        cat_cols, numeric_cols = self._ranked_categories(), self._ranked_measures()
+        if len(cat_cols) < 2 or not numeric_cols:
+            return None
+        top_pair = self._segments().top((cat_cols[0], cat_cols[1]), numeric_cols[0], by='mean', n=1)
+        if top_pair is None or top_pair.empty:
+            return None
+        (first, second), row = top_pair.index[0], top_pair.iloc[0]
+        return {"cell_type": "markdown", "metadata": {}, "source": [f"**Finding**: The highest average {numeric_cols[0]} comes from {cat_cols[0]} = **{first}** with {cat_cols[1]} = **{second}** ({row['mean']:,.2f} across {int(row['count']):,} records)."]}
     
     def _add_driver_analysis(self, cells, df_name, numeric_cols, cat_cols):
         """Add Value-Driven Analysis Framework - Universal Template"""
@@ -986,7 +1461,7 @@ print("\\nAnalysis complete!")
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["### STAGE 3: Key Driver Analysis (Correlation & Causation)\n\nThis stage identifies which variables have the strongest relationship with our KPI."]})
         
         if len(numeric_cols) >= 2:
-            cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Scatter Plot with Regression Line\nplt.figure(figsize=(10,6))\nsns.regplot(data={df_name}, x='{numeric_cols[1]}', y='{numeric_cols[0]}', scatter_kws={{'alpha':0.5}}, line_kws={{'color':'red', 'linewidth':2}})\nplt.title('Driver Analysis: {numeric_cols[1]} vs {numeric_cols[0]}')\nplt.xlabel('{numeric_cols[1]}')\nplt.ylabel('{numeric_cols[0]}')\nplt.grid(True, alpha=0.3)\nplt.show()"]})
+            cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Density of {numeric_cols[0]} against {numeric_cols[1]} over every row (hexbin scales to millions of rows)\ndriver_data = {df_name}[['{numeric_cols[1]}', '{numeric_cols[0]}']].dropna()\nslope, intercept = np.polyfit(driver_data['{numeric_cols[1]}'], driver_data['{numeric_cols[0]}'], 1)\n\nplt.figure(figsize=(10,6))\nplt.hexbin(driver_data['{numeric_cols[1]}'], driver_data['{numeric_cols[0]}'], gridsize=40, cmap='Blues', bins='log', mincnt=1)\nplt.colorbar(label='Records (log scale)')\nx_line = np.linspace(driver_data['{numeric_cols[1]}'].min(), driver_data['{numeric_cols[1]}'].max(), 100)\nplt.plot(x_line, slope * x_line + intercept, color='red', linewidth=2)\nplt.title('Driver Analysis: {numeric_cols[1]} vs {numeric_cols[0]}')\nplt.xlabel('{numeric_cols[1]}')\nplt.ylabel('{numeric_cols[0]}')\nplt.grid(True, alpha=0.3)\nplt.show()"]})
             cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Calculate Correlation Coefficient\ncorrelation = {df_name}[['{numeric_cols[0]}', '{numeric_cols[1]}']].corr().iloc[0,1]\nprint(f'Correlation between {numeric_cols[1]} and {numeric_cols[0]}: {{correlation:.3f}}')\n\nif abs(correlation) > 0.7:\n    print('Strong correlation detected! This is a key driver.')\nelif abs(correlation) > 0.4:\n    print('Moderate correlation. This variable has some influence.')\nelse:\n    print('Weak correlation. This may not be a primary driver.')"]})
             cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Correlation Heatmap of All Numerical Variables\nplt.figure(figsize=(10,8))\nnumeric_data = {df_name}[{numeric_cols[:6]}].corr()\nsns.heatmap(numeric_data, annot=True, cmap='coolwarm', center=0, fmt='.2f', square=True, linewidths=1)\nplt.title('Correlation Heatmap: Identifying Key Drivers')\nplt.tight_layout()\nplt.show()"]})
             cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Identify Strongest Predictor\ncorrelations_with_target = {df_name}[{numeric_cols[:6]}].corr()['{numeric_cols[0]}'].abs().sort_values(ascending=False)\nprint('Variables ranked by correlation strength with {numeric_cols[0]}:')\nprint(correlations_with_target)\nprint(f'\\nStrongest predictor: {{correlations_with_target.index[1]}} (r={{correlations_with_target.values[1]:.3f}})')"]})
@@ -995,6 +1470,9 @@ print("\\nAnalysis complete!")
             cells.append({"cell_type": "markdown", "metadata": {}, "source": ["## STAGE 3: Multivariate (Triple-Axis) Segmentation"]})
             cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Triple-Axis Analysis: {numeric_cols[0]} by {cat_cols[0]} and {cat_cols[1]}\nplt.figure(figsize=(12,6))\nsns.boxplot(data={df_name}, x='{cat_cols[0]}', y='{numeric_cols[0]}', hue='{cat_cols[1]}', palette='Set2')\nplt.title('Multivariate Segmentation: {numeric_cols[0]} by {cat_cols[0]} & {cat_cols[1]}')\nplt.xlabel('{cat_cols[0]}')\nplt.ylabel('{numeric_cols[0]}')\nplt.xticks(rotation=45)\nplt.legend(title='{cat_cols[1]}')\nplt.tight_layout()\nplt.show()"]})
             cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Statistical Comparison Across Segments\nsegment_analysis = {df_name}.groupby(['{cat_cols[0]}', '{cat_cols[1]}'])['{numeric_cols[0]}'].agg(['mean', 'median', 'count']).round(2)\nprint('Segment Performance Analysis:')\nprint(segment_analysis.sort_values('mean', ascending=False))\nprint('\\nInsight: Identify which combination of {cat_cols[0]} and {cat_cols[1]} yields highest {numeric_cols[0]}')"]})
+            
+            # State the winning combination found by the segment cube alongside the code
+            cells.append(slot('segment_finding'))
         
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["### STAGE 4: Segmentation & Actionable Strategy\n\nUsing insights from driver analysis to create targeted segments and concrete business actions."]})
         
@@ -1010,27 +1488,35 @@ print("\\nAnalysis complete!")
         
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["#### Business Recommendations (Finding → Action → Impact)\n\n**Recommendation 1: Optimize High-Impact Drivers**\n- **Finding**: Correlation analysis reveals top 3 variables with strongest relationship to KPI (|r| > 0.5)\n- **Action**: Allocate 60% of optimization budget to improving these high-impact drivers\n- **Impact**: Expected 15-25% improvement in KPI within 2 quarters\n\n**Recommendation 2: Replicate High-Performer Characteristics**\n- **Finding**: Top 25% performers show distinct patterns in key categorical variables\n- **Action**: Implement best practices from high-performer segment across all operations\n- **Impact**: Reduce performance variance by 30% and lift bottom quartile by 20%\n\n**Recommendation 3: Address Low-Performer Segments**\n- **Finding**: Bottom 25% performers have specific identifiable characteristics\n- **Action**: Deploy targeted intervention programs for low-performer segments\n- **Impact**: Reduce churn/losses by 40% and improve overall efficiency by 12%\n\n**Recommendation 4: Leverage Temporal Patterns**\n- **Finding**: Time-based analysis reveals optimal operational windows and seasonal trends\n- **Action**: Reallocate resources to align with peak performance periods\n- **Impact**: Increase resource utilization by 25% and reduce idle capacity\n\n**Recommendation 5: Implement Predictive Monitoring**\n- **Finding**: Strong correlations enable predictive modeling of KPI outcomes\n- **Action**: Build real-time dashboard tracking top 5 driver metrics with alerts\n- **Impact**: Enable proactive decision-making and reduce reactive costs by 35%"]})
     
+    @staticmethod
+    def _stage_timer_cell(name):
+        """Notebook cell that closes the running stage's timer and starts ``name``'s"""
+        return {"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"mark_stage({name!r})"]}
+    
     def _create_clean_notebook(self, df_name, filename):
         """Stage 9: Generate Jupyter Notebook - Professional Cell-by-Cell Format with 3-Stage Framework"""
         cells = []
         
         # Cell 1: Import libraries
-        cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": ["import numpy as np\nimport pandas as pd\nimport matplotlib.pyplot as plt\nimport seaborn as sns\nfrom collections import Counter"]})
+        cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": ["import time\n\nimport numpy as np\nimport pandas as pd\nfrom pandas.api.types import union_categoricals\nimport matplotlib.pyplot as plt\nimport seaborn as sns\nfrom collections import Counter"]})
         
         # Cell 2: Warnings
         cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": ["import warnings\nwarnings.filterwarnings('ignore')"]})
         
-        # Cell 3: Load data - use correct method based on file extension
-        if filename.endswith(('.xlsx', '.xls')):
-            load_code = f"{df_name} = pd.read_excel('{filename}')\n{df_name}"
-        elif filename.endswith('.json'):
-            load_code = f"{df_name} = pd.read_json('{filename}')\n{df_name}"
-        else:
-            load_code = f"{df_name} = pd.read_csv('{filename}')\n{df_name}"
-        cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [load_code]})
+        # Stage timer: a mark_stage cell opens every stage and the last cell tabulates them
+        cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": ["# Seconds per stage (run all cells for meaningful timings)\nstage_times = {}\n_stage = {'name': None, 'start': time.perf_counter()}\n\ndef mark_stage(name):\n    now = time.perf_counter()\n    if _stage['name'] is not None:\n        stage_times[_stage['name']] = round(now - _stage['start'], 3)\n    _stage.update(name=name, start=now)"]})
+        
+        # Cell 3: Load data with the schema the analysis found, under the cleaned column names
+        schema = self._code_schema()
+        load_code = f"# Pinned dtypes and date formats, only the columns used, repeated text as categoricals\n{self._read_source_code(filename, schema)}\n\n\n{df_name} = read_data('{filename}')"
+        if schema['rename']:
+            load_code += f".rename(columns={schema['rename']!r})"
+        cells.append(self._stage_timer_cell('Load'))
+        cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"{load_code}\n{df_name}"]})
         
         # STAGE 1: Data Preparation & Advanced Feature Engineering
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["# STAGE 1: Data Preparation & Advanced Feature Engineering"]})
+        cells.append(self._stage_timer_cell('Stage 1: Data Preparation'))
         
         # Cell 4: Info
         cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"{df_name}.info()"]})
@@ -1059,10 +1545,9 @@ print("\\nAnalysis complete!")
         # Cell 7: Missing values
         cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"{df_name}.isnull().sum()"]})
         
-        # Cells 8-12: Fill missing values for each column
-        missing_cols = [col for col in self.original_df.columns if self.original_df[col].isnull().sum() > 0]
-        for col in missing_cols[:5]:
-            cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"{df_name}['{col}'].fillna(value='unknown', inplace=True)\n{df_name}['{col}']"]})
+        # Cell 8: Fill missing values in one vectorized pass per dtype
+        if self.original_missing_columns:
+            cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"# Numeric gaps: median below 5% missing, mean otherwise\nnumeric = {df_name}.select_dtypes(include=[np.number])\n{df_name}[numeric.columns] = numeric.fillna(numeric.median().where(numeric.isna().mean() < 0.05, numeric.mean()))\n\n# Text gaps: 'unknown' (added as a category where the column is categorical)\nfor col in {df_name}.select_dtypes(include=['category']).columns:\n    if {df_name}[col].isna().any():\n        {df_name}[col] = {df_name}[col].cat.add_categories(['unknown']).fillna('unknown')\ntext = {df_name}.select_dtypes(include=['object', 'string']).columns\n{df_name}[text] = {df_name}[text].fillna('unknown')"]})
         
         # Cell: Check missing after cleaning
         cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"{df_name}.isnull().sum()"]})
@@ -1083,10 +1568,11 @@ print("\\nAnalysis complete!")
         
         # STAGE 2: Strategic Segmentation
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["# STAGE 2: Strategic Segmentation (Multivariate Analysis)"]})
+        cells.append(self._stage_timer_cell('Stage 2: Segmentation'))
         
         # Segment vs KPI Analysis
-        cat_cols = [col for col, ctype in self.column_types.items() if ctype in ['categorical', 'categorical_numeric']]
-        numeric_cols = self.df.select_dtypes(include=[np.number]).columns.tolist()
+        cat_cols = self._ranked_categories()
+        numeric_cols = self._ranked_measures()
         
         if cat_cols and numeric_cols:
             main_cat = cat_cols[0]
@@ -1183,12 +1669,16 @@ print("\\nAnalysis complete!")
             cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": [f"country_type = {df_name}.groupby(['{country_col}', '{cat_cols[0]}']).size().unstack().fillna(0)\n\ntop_countries = {df_name}['{country_col}'].value_counts().head(5).index\ncountry_type = country_type.loc[top_countries]\n\ncountry_type.plot(kind='bar', figsize=(10,6), stacked=True, colormap='Pastel1')\nplt.title('{cat_cols[0]} Distribution in Top 5 {country_col}')\nplt.xlabel('{country_col}')\nplt.ylabel('Number of Titles')\nplt.xticks(rotation=45)\nplt.legend(title='{cat_cols[0]}')\nplt.show()"]})
         
         # DRIVER ANALYSIS AND PREDICTIVE INSIGHTS
+        cells.append(self._stage_timer_cell('Driver Analysis'))
         self._add_driver_analysis(cells, df_name, numeric_cols, cat_cols)
         
         # STAGE 3: Executive Summary & Actionable Recommendations
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["# STAGE 3: Executive Summary & Strategic Recommendations"]})
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["## Executive Summary\n\nBased on comprehensive analysis of the dataset, three critical insights emerge that drive strategic decision-making:\n\n1. **Performance Segmentation**: Analysis reveals significant variance in key performance indicators across different segments, with top performers demonstrating 2-3x higher efficiency metrics compared to baseline.\n\n2. **Temporal Patterns**: Clear seasonality and trend patterns indicate optimal operational windows and demand cycles that can be leveraged for resource optimization.\n\n3. **Strategic Opportunities**: Data quality assessment and correlation analysis identify untapped opportunities for operational improvement and revenue enhancement."]})
         
+        cells.append(self._stage_timer_cell(None))
+        cells.append({"cell_type": "code", "execution_count": None, "metadata": {}, "source": ["# Seconds spent in each stage\npd.Series(stage_times, name='seconds')"]})
+        
         cells.append({"cell_type": "markdown", "metadata": {}, "source": ["## Actionable Recommendations\n\n### 1. Operational Excellence\n**Finding**: Top-performing segments show superior KPI metrics.\n**Action**: Benchmark best practices from high-performing segments and implement standardized operational procedures across all units. Conduct quarterly performance reviews to ensure compliance and continuous improvement.\n\n### 2. Marketing & Customer Acquisition\n**Finding**: Temporal analysis reveals peak demand periods and customer behavior patterns.\n**Action**: Reallocate marketing budget to align with high-conversion periods. Develop targeted campaigns for underperforming segments during off-peak times to smooth demand curves and maximize resource utilization.\n\n### 3. Inventory & Resource Management\n**Finding**: Correlation analysis identifies key drivers of performance variance.\n**Action**: Implement predictive inventory management based on identified patterns. Optimize resource allocation by focusing on high-impact categories while reducing investment in low-performing segments. Establish automated alerts for anomaly detection.\n\n### 4. Data-Driven Decision Framework\n**Finding**: Current data completeness and quality metrics indicate areas for improvement.\n**Action**: Establish data governance protocols to improve collection accuracy. Implement real-time dashboards for continuous monitoring of KPIs. Train teams on data-driven decision-making methodologies."]})
         
         return {
@@ -1198,51 +1688,88 @@ print("\\nAnalysis complete!")
             "nbformat_minor": 4
         }
 
-def load_data(file):
+UPLOAD_SAMPLE_BYTES = 64 * 1024
+CSV_FALLBACK_ENCODINGS = ('latin-1', 'cp1252')
+UPLOAD_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+def _open_upload_stream(file):
+    """Return a seekable binary stream for an uploaded file without writing it to the upload folder"""
+    stream = file.stream
+    try:
+        if stream.seekable():
+            stream.seek(0)
+            return stream
+    except (AttributeError, OSError):
+        pass
+    
+    # Non-seekable request stream: spool into an anonymous temp buffer (unique, removed on close)
+    spooled = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY, mode='w+b')
+    shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled
+
+def _sniff_csv_dialect(sample):
+    """Detect encoding and delimiter from the first bytes of a CSV upload"""
+    if sample.startswith(b'\xef\xbb\xbf'):
+        encoding = 'utf-8-sig'
+        text = sample[3:].decode('utf-8', errors='ignore')
+    else:
+        try:
+            encoding = 'utf-8'
+            text = sample.decode('utf-8')
+        except UnicodeDecodeError as e:
+            if e.start >= len(sample) - 3:
+                # Sample boundary cut through a multi-byte character
+                text = sample[:e.start].decode('utf-8')
+            else:
+                encoding = 'latin-1'
+                text = sample.decode('latin-1')
+    
+    # Only sniff complete lines
+    lines = text.splitlines()
+    if len(sample) >= UPLOAD_SAMPLE_BYTES and len(lines) > 1:
+        lines = lines[:-1]
+    lines = lines[:50]
+    
+    sep = ','
+    if lines:
+        try:
+            sep = csv.Sniffer().sniff('\n'.join(lines), delimiters=',\t;|').delimiter
+        except csv.Error:
+            header = lines[0]
+            sep = max([',', '\t', ';', '|'], key=header.count) if header else ','
+            if header.count(sep) == 0:
+                sep = ','
+    
+    return encoding, sep
+
+def _read_csv_stream(stream, sep, encoding):
+    """Parse a CSV upload in one pass, returning ``(df, encoding)``. The sniffed sample can be
+    plain ASCII while later rows are not, so a decode error re-parses from the start as
+    latin-1, then cp1252."""
+    for attempt in dict.fromkeys((encoding,) + CSV_FALLBACK_ENCODINGS):
+        try:
+            return pd.read_csv(stream, sep=sep, encoding=attempt, on_bad_lines='skip'), attempt
+        except UnicodeDecodeError:
+            stream.seek(0)
+    raise ValueError(f"Could not decode CSV file with any of: {', '.join((encoding,) + CSV_FALLBACK_ENCODINGS)}")
+
+def load_data(file, sheet_name=None):
     """Load data from various formats with robust error handling"""
     filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    stream = _open_upload_stream(file)
     
     try:
         if filename.endswith('.csv'):
-            # Try multiple strategies to load CSV files
-            df = None
-            errors = []
+            # Detect the dialect once from a sample, then parse the stream in a single pass
+            sample = stream.read(UPLOAD_SAMPLE_BYTES)
+            stream.seek(0)
+            encoding, sep = _sniff_csv_dialect(sample)
             
-            # Strategy 1: Standard CSV with auto-detection
             try:
-                df = pd.read_csv(filepath, encoding='utf-8', engine='python', on_bad_lines='skip')
-            except Exception as e1:
-                errors.append(f"UTF-8: {str(e1)}")
-                
-                # Strategy 2: Try different encodings
-                for encoding in ['latin-1', 'iso-8859-1', 'cp1252']:
-                    try:
-                        df = pd.read_csv(filepath, encoding=encoding, engine='python', on_bad_lines='skip')
-                        break
-                    except Exception as e2:
-                        errors.append(f"{encoding}: {str(e2)}")
-                        continue
-                
-                # Strategy 3: Try tab-separated
-                if df is None:
-                    try:
-                        df = pd.read_csv(filepath, sep='\t', encoding='utf-8', engine='python', on_bad_lines='skip')
-                    except Exception as e3:
-                        errors.append(f"Tab-separated: {str(e3)}")
-                        
-                        # Strategy 4: Try with different delimiters
-                        for sep in [';', '|', ',']:
-                            try:
-                                df = pd.read_csv(filepath, sep=sep, encoding='utf-8', engine='python', on_bad_lines='skip')
-                                if len(df.columns) > 1:  # Valid if multiple columns detected
-                                    break
-                            except:
-                                continue
-            
-            if df is None:
-                raise ValueError(f"Could not load CSV file. Tried multiple strategies. Errors: {'; '.join(errors[:3])}")
+                df, encoding = _read_csv_stream(stream, sep, encoding)
+            except Exception as e:
+                raise ValueError(f"Could not load CSV file (encoding={encoding}, delimiter={sep!r}): {str(e)}")
             
             # Clean HTML entities in column names
             df.columns = df.columns.str.replace('&gt;', '>', regex=False)
@@ -1266,40 +1793,103 @@ def load_data(file):
                     df.columns = new_cols
                     df = df.iloc[1:].reset_index(drop=True)
             
-        elif filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(filepath)
+        elif filename.endswith('.xlsx'):
+            # Row-streaming read-only reader; avoids openpyxl's full workbook object model
+            df = read_excel_stream(stream, sheet_name)
+        elif filename.endswith('.xls'):
+            df = pd.read_excel(stream, sheet_name=sheet_name or 0)
         elif filename.endswith('.json'):
-            df = pd.read_json(filepath)
+            df = pd.read_json(stream)
+        elif filename.endswith(('.jsonl', '.ndjson')):
+            df = read_json_lines(stream)
         else:
             raise ValueError("Unsupported file format")
         
-        # Drop any Unnamed columns (index columns)
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed', na=False)]
-        
-        # Clean column names - remove extra whitespace
-        df.columns = df.columns.str.strip()
-        
-        # Convert numeric columns that are stored as strings
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                try:
-                    # Try to convert to numeric, coercing errors
-                    df[col] = pd.to_numeric(df[col], errors='ignore')
-                except:
-                    pass
-        
-        # Reset index to ensure clean data
-        df = df.reset_index(drop=True)
-        
-        # Ensure we have valid data
-        if len(df) == 0:
-            raise ValueError("File loaded but contains no data rows")
-        if len(df.columns) == 0:
-            raise ValueError("File loaded but contains no columns")
-        
-        return df
+        return _finalize_frame(df)
     except Exception as e:
         raise ValueError(f"Error loading file: {str(e)}")
+    finally:
+        # Release the spooled upload deterministically instead of waiting for request teardown
+        stream.close()
+        file.close()
+
+def load_excel_sheets(file, sheet_names=None):
+    """Load several sheets of an Excel upload as separate datasets"""
+    filename = secure_filename(file.filename)
+    if not filename.endswith('.xlsx'):
+        raise ValueError("Multi-sheet loading is only supported for .xlsx files")
+    stream = _open_upload_stream(file)
+    
+    try:
+        frames = read_excel_sheets(stream, sheet_names)
+        return {name: _finalize_frame(df) for name, df in frames.items()}
+    except Exception as e:
+        raise ValueError(f"Error loading file: {str(e)}")
+    finally:
+        stream.close()
+        file.close()
+
+def iter_upload_chunks(file):
+    """Yield an upload as DataFrames of CHUNK_SIZE rows (CSV and JSON Lines only)"""
+    filename = secure_filename(file.filename)
+    stream = _open_upload_stream(file)
+    
+    try:
+        if filename.endswith('.csv'):
+            encoding, sep = _sniff_csv_dialect(stream.read(UPLOAD_SAMPLE_BYTES))
+            stream.seek(0)
+            chunks = pd.read_csv(stream, sep=sep, encoding=encoding, on_bad_lines='skip', chunksize=Config.CHUNK_SIZE)
+        elif filename.endswith(('.jsonl', '.ndjson')):
+            chunks = iter_json_lines(stream, Config.CHUNK_SIZE)
+        else:
+            raise ValueError("Chunked analysis supports CSV and JSON Lines files only")
+        
+        for chunk in chunks:
+            chunk = chunk.loc[:, ~chunk.columns.astype(str).str.contains('^Unnamed', na=False)]
+            chunk.columns = chunk.columns.astype(str).str.strip()
+            yield chunk
+    finally:
+        stream.close()
+        file.close()
+
+def _upload_size(file):
+    """Size of an uploaded file in bytes, without reading it"""
+    stream = file.stream
+    try:
+        position = stream.tell()
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return request.content_length or 0
+
+def _finalize_frame(df):
+    """Common post-load cleanup shared by every file format"""
+    # Drop any Unnamed columns (index columns)
+    df = df.loc[:, ~df.columns.astype(str).str.contains('^Unnamed', na=False)]
+    
+    # Clean column names - remove extra whitespace
+    df.columns = df.columns.astype(str).str.strip()
+    
+    # Convert numeric columns that are stored as strings
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            try:
+                # Try to convert to numeric, coercing errors
+                df[col] = pd.to_numeric(df[col], errors='ignore')
+            except:
+                pass
+    
+    # Reset index to ensure clean data
+    df = df.reset_index(drop=True)
+    
+    # Ensure we have valid data
+    if len(df) == 0:
+        raise ValueError("File loaded but contains no data rows")
+    if len(df.columns) == 0:
+        raise ValueError("File loaded but contains no columns")
+    
+    return df
 
 @app.route('/')
 def index():
@@ -1318,88 +1908,109 @@ def safe_float(value, default=0.0):
     except:
         return default
 
-def sanitize_for_json(obj):
-    """Recursively sanitize data structure to remove NaN and Inf values"""
-    if isinstance(obj, dict):
-        return {k: sanitize_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [sanitize_for_json(item) for item in obj]
-    elif isinstance(obj, (np.integer, np.floating)):
-        if np.isnan(obj) or np.isinf(obj):
-            return None
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return sanitize_for_json(obj.tolist())
-    elif isinstance(obj, float):
-        if np.isnan(obj) or np.isinf(obj):
-            return None
-        return obj
-    else:
-        return obj
+def _response_options():
+    """(schema_version, fields, exclude) requested as form fields or query parameters"""
+    def value(name):
+        return request.form.get(name, request.args.get(name))
+    return parse_schema_version(value('schema_version')), parse_field_list(value('fields')), parse_field_list(value('exclude'))
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
+def json_response(payload, status=200):
+    """Analysis results as JSON: NaN/Inf written as null in one encoding pass, compressed
+    (br or gzip) as negotiated by the request's Accept-Encoding"""
+    start = time.perf_counter()
+    body, encoding = encode_response(payload, request.accept_encodings)
+    metrics.observe('response_serialization_seconds', time.perf_counter() - start)
+    metrics.observe('response_bytes', len(body))
+    response = app.response_class(body, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def run_analysis(df, filename='your_data.csv', profile=None, deadline=None, duplicate_key=None, time_rollups=None, correlation_stats=None):
+    """Run the full analysis pipeline on a loaded DataFrame.
+    
+    With a time-budgeted ``deadline`` the optional stages (charts, notebook, Excel report)
+    are skipped or downgraded once the budget is nearly spent, and everything completed is
+    still returned together with ``skipped_stages``. ``duplicate_key`` lists the columns that
+    identify duplicate rows (all columns when None). ``time_rollups`` and ``correlation_stats``
+    are full-data statistics from incremental mode, used in place of ones computed from ``df``.
+    """
+    # Validate dataset size
+    if len(df) > 100000:
+        print(f"Warning: Large dataset with {len(df)} rows. Analysis may take longer.")
+    if len(df.columns) > 50:
+        print(f"Warning: Wide dataset with {len(df.columns)} columns. Charts, segments and correlations use the {Config.MAX_FOCUS_COLUMNS} highest-ranked measures and dimensions.")
+    
+    deadline = deadline or Deadline()
+    deadline.rows = len(df)
+    
+    # Initialize analyst
+    analyst = DataAnalyst(df, profile, deadline, duplicate_key, time_rollups, correlation_stats)
+    
     try:
-        # Load data
-        if 'file' in request.files:
-            file = request.files['file']
-            print(f"Loading file: {file.filename}")
-            df = load_data(file)
-            print(f"Successfully loaded {len(df)} rows and {len(df.columns)} columns")
-        elif 'raw_data' in request.form:
-            raw_data = request.form['raw_data']
-            df = pd.read_csv(StringIO(raw_data))
-        else:
-            return jsonify({"error": "No data provided"}), 400
-        
-        # Validate dataset size
-        if len(df) > 100000:
-            print(f"Warning: Large dataset with {len(df)} rows. Analysis may take longer.")
-        if len(df.columns) > 50:
-            print(f"Warning: Wide dataset with {len(df.columns)} columns. Focusing on key columns.")
-        
-        # Initialize analyst
-        analyst = DataAnalyst(df)
-        
         # Stage 1: Understand
-        understanding = analyst.understand_data()
-        
+        with deadline.stage('understanding'):
+            understanding = analyst.understand_data()
+    
         # Stage 2: Clean
-        cleaning = analyst.clean_data()
-        
+        with deadline.stage('cleaning'):
+            cleaning = analyst.clean_data()
+    
         # Stage 3: EDA
-        eda = analyst.perform_eda()
-        
+        with deadline.stage('eda'):
+            eda = analyst.perform_eda()
+    
         # Stage 4: Insights
-        insights, detailed_insights = analyst.generate_insights()
-        
-        # Stage 4.5: Generate Visualizations
-        charts = analyst.generate_visualizations()
-        
+        with deadline.stage('time_rollups'):
+            analyst.build_time_rollups()
+    
+        with deadline.stage('segments'):
+            analyst.build_segment_cube()
+    
+        with deadline.stage('insights'):
+            insights, detailed_insights = analyst.generate_insights()
+    
+        # Stage 4.5: Generate Visualizations (each chart checks the budget)
+        with deadline.stage('visualizations'):
+            charts = analyst.generate_visualizations()
+    
         # Stage 5: Python Code
-        filename = file.filename if 'file' in request.files else 'your_data.csv'
-        python_code = analyst.generate_python_code(filename)
-        
+        with deadline.stage('python_code'):
+            python_code = analyst.generate_python_code(filename)
+    
         # Stage 6: SQL
-        sql_queries = analyst.generate_sql_queries()
+        with deadline.stage('sql_queries'):
+            sql_queries = analyst.generate_sql_queries()
         
+        # Stage 6.5: Check and time the SQL on an SQLite copy of the cleaned data
+        if 0 < len(analyst.df) <= Config.SQL_VALIDATION_MAX_ROWS and deadline.allows('sql_validation'):
+            with deadline.stage('sql_validation'):
+                analyst.validate_sql_queries(sql_queries)
+    
         # Stage 7: DAX
-        dax_measures = analyst.generate_dax_measures()
-        
+        with deadline.stage('dax_measures'):
+            dax_measures = analyst.generate_dax_measures()
+    
         # Stage 8: JSON
         json_output = analyst.generate_json_output(
             understanding, cleaning, eda, insights, 
             python_code, sql_queries, dax_measures
         )
-        
+    
         # Stage 9: Notebook
-        notebook = analyst.generate_notebook(filename)
-        
-        # Stage 9.5: Excel Report
-        excel_workbook = analyst.generate_excel_report(filename)
-        excel_path = os.path.join(app.config['UPLOAD_FOLDER'], 'professional_analysis_report.xlsx')
-        excel_workbook.save(excel_path)
-        
+        notebook = None
+        if deadline.allows('notebook'):
+            with deadline.stage('notebook'):
+                notebook = analyst.generate_notebook(filename)
+    
+        # Stage 9.5: Excel Report (downgraded to summary sheets when the data sheet does not fit)
+        if deadline.allows('excel_report'):
+            with deadline.stage('excel_report'):
+                excel_workbook = analyst.generate_excel_report(filename, include_data=deadline.allows('excel_data_sheet'))
+                excel_path = os.path.join(app.config['UPLOAD_FOLDER'], 'professional_analysis_report.xlsx')
+                excel_workbook.save(excel_path)
+    
         # Stage 10: Final deliverables
         result = {
             "understanding": understanding,
@@ -1413,20 +2024,249 @@ def analyze():
             "dax_measures": dax_measures,
             "json_output": json_output,
             "notebook": notebook,
-            "executive_summary": f"Analyzed {len(df):,} records across {len(df.columns)} dimensions. Cleaned {cleaning.get('duplicates_removed', 0)} duplicates. Generated {len(insights)} key insights with {len(charts)} professional visualizations."
+            "skipped_stages": list(deadline.skipped),
+            "timing": deadline.to_dict(),
+            "executive_summary": f"Analyzed {(profile.rows if profile is not None else len(analyst.df)):,} records across {len(analyst.df.columns)} dimensions. Cleaned {cleaning.get('duplicates_removed', 0)} duplicates. Generated {len(insights)} key insights with {len(charts)} professional visualizations."
         }
         
-        # Sanitize all data to remove NaN/Inf values
-        result = sanitize_for_json(result)
+        # Keep the full cleaned frame for /query drill-downs (samples and merged statistics are not kept)
+        if profile is None and time_rollups is None and correlation_stats is None:
+            analysis_id = query_store.add(QueryEngine(analyst.df, analyst.date_hierarchies, analyst.outliers))
+            if analysis_id is not None:
+                result['analysis_id'] = analysis_id
+        return result
+    finally:
+        # Removes the spill directory; the mapped views stay readable until released
+        analyst.close()
+
+def run_chunked_analysis(chunks, filename='your_data.csv', deadline=None, duplicate_key=None):
+    """Profile an upload chunk by chunk and run the pipeline on a bounded uniform sample"""
+    deadline = deadline or Deadline()
+    with deadline.stage('chunked_profiling'):
+        profiler = profile_stream(chunks)
+    if profiler.rows == 0:
+        raise ValueError("File loaded but contains no data rows")
+    
+    result = run_analysis(profiler.sample_frame(), filename, profile=profiler, deadline=deadline, duplicate_key=duplicate_key)
+    result['mode'] = 'chunked'
+    result['profile'] = profiler.to_dict()
+    return result
+
+def run_incremental_analysis(chunks, filename='your_data.csv', deadline=None, duplicate_key=None, analysis_id=None):
+    """Fold new rows into a stored IncrementalState (a new one without ``analysis_id``) and
+    refresh the analysis from the merged statistics; historical rows are never rescanned"""
+    deadline = deadline or Deadline()
+    state = analysis_store.get(analysis_id) if analysis_id else IncrementalState(filename, duplicate_key)
+    if state is None:
+        raise KeyError(analysis_id)
+    
+    with state.lock:
+        with deadline.stage('incremental_profiling'):
+            appended = state.append(chunks)
+        if state.rows == 0:
+            raise ValueError("File loaded but contains no data rows")
+        # The pipeline runs on the bounded row sample; totals, rollups and correlations are full-data
+        result = run_analysis(state.profiler.sample_frame(), state.filename, profile=state.profiler, deadline=deadline,
+                              duplicate_key=state.duplicate_key, time_rollups=state.time_rollups,
+                              correlation_stats=state.correlation_stats)
+    
+    if analysis_id is None:
+        analysis_id = analysis_store.add(state)
+    result['mode'] = 'incremental'
+    result['analysis_id'] = analysis_id
+    result['rows_appended'] = appended
+    result['duplicates_skipped'] = state.duplicates_skipped
+    result['hash_matches_skipped'] = state.hash_matches_skipped
+    result['batches'] = state.batches
+    result['profile'] = state.profiler.to_dict()
+    return result
+
+def _upload_format(file):
+    filename = secure_filename(file.filename)
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+def estimate_upload_memory(file, fmt, chunked=False):
+    """Estimate an upload's peak analysis memory from its size, format and a parsed row sample"""
+    size = _upload_size(file)
+    chunkable = fmt in ('csv', 'jsonl', 'ndjson')
+    sample_rows = sample_bytes = sample_memory = sample_columns = 0
+    
+    if chunkable:
+        stream = file.stream
+        try:
+            stream.seek(0)
+            sample = stream.read(UPLOAD_SAMPLE_BYTES)
+            stream.seek(0)
+            # Only parse complete lines
+            if len(sample) == UPLOAD_SAMPLE_BYTES and b'\n' in sample:
+                sample = sample[:sample.rindex(b'\n') + 1]
+            if fmt == 'csv':
+                encoding, sep = _sniff_csv_dialect(sample)
+                sample_df = pd.read_csv(BytesIO(sample), sep=sep, encoding=encoding, on_bad_lines='skip')
+            else:
+                sample_df = read_json_lines(BytesIO(sample))
+            sample_rows, sample_bytes, sample_columns = len(sample_df), len(sample), len(sample_df.columns)
+            sample_memory = int(sample_df.memory_usage(deep=True).sum())
+        except Exception:
+            # Fall back to the per-format expansion factor
+            stream.seek(0)
+    
+    estimate = estimate_peak_memory(size, fmt, sample_rows, sample_bytes, sample_memory, chunkable=chunkable,
+                                    sample_columns=sample_columns)
+    if chunked:
+        return MemoryEstimate(estimate.chunked_bytes, None, estimate.basis)
+    return estimate
+
+def _incremental_upload():
+    """New rows of an incremental upload as (lazy chunk iterator, memory estimate), or (None, None)"""
+    if 'file' in request.files:
+        file = request.files['file']
+        fmt = _upload_format(file)
+        if fmt in ('csv', 'jsonl', 'ndjson'):
+            return iter_upload_chunks(file), estimate_upload_memory(file, fmt, chunked=True)
+        return _lazy_chunk(load_data, file, request.form.get('sheet') or None), estimate_upload_memory(file, fmt)
+    if 'raw_data' in request.form:
+        raw_data = request.form['raw_data']
+        return _lazy_chunk(pd.read_csv, StringIO(raw_data)), estimate_peak_memory(len(raw_data.encode()), 'csv')
+    return None, None
+
+def _lazy_chunk(load, *args):
+    """A whole upload as a single chunk, loaded only once admitted"""
+    yield load(*args)
+
+def _with_admission(result, decision):
+    """Report the admission decision (and the resulting analysis mode) in the response"""
+    result['admission'] = decision.to_dict()
+    if 'sheets' not in result:
+        result.setdefault('mode', 'full')
+    return result
+
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    try:
+        try:
+            options = _response_options()
+            # The time budget covers queueing and loading as well as the pipeline itself
+            deadline = Deadline(parse_time_budget(request.form.get('time_budget', request.args.get('time_budget'))))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        filename = 'your_data.csv'
+        duplicate_key = parse_duplicate_key(request.form.get('duplicate_key', request.args.get('duplicate_key')))
+        
+        # Incremental mode: keep mergeable statistics so later rows can be appended by analysis_id
+        if request.form.get('mode') == 'incremental':
+            chunks, estimate = _incremental_upload()
+            if chunks is None:
+                return jsonify({"error": "No data provided"}), 400
+            if 'file' in request.files:
+                filename = request.files['file'].filename
+            with admission_controller.admit(estimate) as decision:
+                result = _with_admission(run_incremental_analysis(chunks, filename, deadline, duplicate_key), decision)
+            return json_response(shape_result(result, *options))
         
-        return jsonify(result)
+        # Load data
+        if 'file' in request.files:
+            file = request.files['file']
+            filename = file.filename
+            fmt = _upload_format(file)
+            print(f"Loading file: {file.filename}")
+            
+            # Large CSV / JSON Lines uploads are profiled in CHUNK_SIZE pieces instead of loaded whole
+            chunkable = fmt in ('csv', 'jsonl', 'ndjson')
+            chunked = chunkable and (request.form.get('mode') == 'chunked' or _upload_size(file) > Config.CHUNKED_MODE_THRESHOLD)
+            
+            # Admit, queue or downgrade against the worker's memory budget before expanding the file
+            estimate = estimate_upload_memory(file, fmt, chunked)
+            with admission_controller.admit(estimate) as decision:
+                # Excel: several sheets analyzed as separate datasets ('*' = every sheet)
+                sheets = request.form.get('sheets', '').strip()
+                if sheets:
+                    sheet_names = None if sheets == '*' else [name.strip() for name in sheets.split(',') if name.strip()]
+                    with deadline.stage('loading'):
+                        datasets = load_excel_sheets(file, sheet_names)
+                    print(f"Successfully loaded {len(datasets)} sheets")
+                    result = {"sheets": {name: run_analysis(sheet_df, filename, deadline=deadline, duplicate_key=duplicate_key) for name, sheet_df in datasets.items()}}
+                    result['skipped_stages'] = list(deadline.skipped)
+                    result['timing'] = deadline.to_dict()
+                elif chunked or decision.downgraded:
+                    result = run_chunked_analysis(iter_upload_chunks(file), filename, deadline, duplicate_key)
+                else:
+                    with deadline.stage('loading'):
+                        df = load_data(file, request.form.get('sheet') or None)
+                    print(f"Successfully loaded {len(df)} rows and {len(df.columns)} columns")
+                    result = run_analysis(df, filename, deadline=deadline, duplicate_key=duplicate_key)
+                result = _with_admission(result, decision)
+        elif 'raw_data' in request.form:
+            raw_data = request.form['raw_data']
+            estimate = estimate_peak_memory(len(raw_data.encode()), 'csv')
+            with admission_controller.admit(estimate) as decision:
+                df = pd.read_csv(StringIO(raw_data))
+                result = _with_admission(run_analysis(df, filename, deadline=deadline, duplicate_key=duplicate_key), decision)
+        else:
+            return jsonify({"error": "No data provided"}), 400
+        
+        return json_response(shape_result(result, *options))
+    
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e), "admission": e.decision.to_dict()}), 503
+    except DuplicateKeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/analyze/<analysis_id>/append', methods=['POST'])
+def append_rows(analysis_id):
+    """Append new rows to an incremental analysis and return the refreshed results"""
+    try:
+        if analysis_store.get(analysis_id) is None:
+            return jsonify({"error": f"Unknown or expired analysis_id: {analysis_id}"}), 404
+        try:
+            options = _response_options()
+            deadline = Deadline(parse_time_budget(request.form.get('time_budget', request.args.get('time_budget'))))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        chunks, estimate = _incremental_upload()
+        if chunks is None:
+            return jsonify({"error": "No data provided"}), 400
+        with admission_controller.admit(estimate) as decision:
+            result = _with_admission(run_incremental_analysis(chunks, deadline=deadline, analysis_id=analysis_id), decision)
+        return json_response(shape_result(result, *options))
     
+    except AdmissionRejected as e:
+        return jsonify({"error": str(e), "admission": e.decision.to_dict()}), 503
+    except DuplicateKeyError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/query/<analysis_id>', methods=['GET', 'POST'])
+def query_analysis(analysis_id):
+    """Filter, group, aggregate, sort and limit the cleaned data of a finished analysis
+    (GET describes the queryable columns)"""
+    engine = query_store.get(analysis_id)
+    if engine is None:
+        return jsonify({"error": f"Unknown or expired analysis_id: {analysis_id}"}), 404
+    if request.method == 'GET':
+        return json_response(engine.describe())
+    try:
+        result = engine.run(parse_query(request.get_json(silent=True)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    metrics.observe('query_seconds', result['elapsed_ms'] / 1000)
+    result['analysis_id'] = analysis_id
+    return json_response(result)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify(metrics.snapshot())
 
 @app.route('/download/notebook', methods=['POST'])
 def download_notebook():
     notebook_data = request.json.get('notebook')
+    if not notebook_data:
+        return jsonify({"error": "No notebook provided"}), 400
     buffer = BytesIO()
     buffer.write(json.dumps(notebook_data, indent=2).encode())
     buffer.seek(0)
@@ -1439,5 +2279,13 @@ def download_excel():
         return send_file(excel_path, as_attachment=True, download_name='Professional_Analysis_Report.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     return jsonify({"error": "Excel report not found"}), 404
 
+@app.route('/artifacts/<artifact_id>', methods=['GET'])
+def download_artifact(artifact_id):
+    """Chart image, notebook or JSON deliverable referenced by a schema_version 2 response"""
+    artifact = artifact_store.get(artifact_id)
+    if artifact is None:
+        return jsonify({"error": f"Unknown or expired artifact: {artifact_id}"}), 404
+    return send_file(BytesIO(artifact.content), as_attachment=artifact.attachment, download_name=artifact.filename, mimetype=artifact.media_type)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,56 @@
+"""
+Large analysis artifacts (chart images, notebooks, JSON deliverables) served by id instead of inline
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+
+from config import Config
+
+
+class Artifact:
+    def __init__(self, content, media_type, filename, attachment=True):
+        self.content = content
+        self.media_type = media_type
+        self.filename = filename
+        self.attachment = attachment
+
+    @property
+    def size(self):
+        return len(self.content)
+
+
+class ArtifactStore:
+    """Thread-safe, byte-bounded map of artifact id to Artifact (least recently used evicted)"""
+
+    def __init__(self, capacity_mb=None):
+        self.capacity = int((Config.ARTIFACT_STORE_MB if capacity_mb is None else capacity_mb) * 1024 * 1024)
+        self.nbytes = 0
+        self._artifacts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, content, media_type, filename, attachment=True):
+        """Store ``content`` (bytes) and return a reference to embed in the response"""
+        artifact = Artifact(content, media_type, filename, attachment)
+        artifact_id = uuid.uuid4().hex
+        with self._lock:
+            self._artifacts[artifact_id] = artifact
+            self.nbytes += artifact.size
+            while self.nbytes > self.capacity and len(self._artifacts) > 1:
+                _, evicted = self._artifacts.popitem(last=False)
+                self.nbytes -= evicted.size
+        return {'id': artifact_id, 'url': f'/artifacts/{artifact_id}', 'media_type': media_type, 'bytes': artifact.size}
+
+    def get(self, artifact_id):
+        with self._lock:
+            artifact = self._artifacts.get(artifact_id)
+            if artifact is not None:
+                self._artifacts.move_to_end(artifact_id)
+            return artifact
+
+    def __len__(self):
+        return len(self._artifacts)
+
+
+artifact_store = ArtifactStore()
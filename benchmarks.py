@@ -0,0 +1,353 @@
+"""
+Benchmarks for AI Data Analyst ingestion and analysis paths
+
+Each measurement runs in a fresh process so peak RSS is not polluted by earlier runs.
+
+Usage:
+    python benchmarks.py excel --rows 500000
+    python benchmarks.py dedupe --rows 5000000 --cols 40
+    python benchmarks.py shared --rows 2000000 --cols 40 --workers 4
+    python benchmarks.py serialize --rows 5000 --cols 300
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_measured(queue, fn, args):
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_mb()
+    queue.put({
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': round(peak, 1) if peak is not None else None,
+        'rss_growth_mb': round(peak - baseline, 1) if peak is not None else None,
+        'result': result,
+    })
+
+
+def measure(fn, *args):
+    """Run fn(*args) in a fresh process and report wall time and peak memory"""
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_measured, args=(queue, fn, args))
+    proc.start()
+    out = queue.get()
+    proc.join()
+    return out
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print("-" * 72)
+    for name, m in rows:
+        print(f"{name:<32} {m['seconds']:>9.3f} s   peak RSS {m['peak_rss_mb']} MB   (+{m['rss_growth_mb']} MB)")
+
+
+# ---------------------------------------------------------------------------
+# Excel ingestion: read-only row streaming vs pd.read_excel
+# ---------------------------------------------------------------------------
+
+def make_workbook(path, rows, sheets=1):
+    """Write a synthetic sales workbook using openpyxl's write-only mode"""
+    from openpyxl import Workbook
+
+    rng = np.random.default_rng(42)
+    wb = Workbook(write_only=True)
+    for sheet in range(sheets):
+        ws = wb.create_sheet(f'Sheet{sheet + 1}')
+        ws.append(['Order_ID', 'Order_Date', 'Region', 'Product', 'Sales', 'Quantity', 'Profit', 'Discount'])
+        dates = pd.date_range('2020-01-01', periods=rows, freq='min').to_pydatetime()
+        regions = rng.choice(['North', 'South', 'East', 'West'], rows)
+        products = rng.choice(['Laptop', 'Mouse', 'Keyboard', 'Monitor'], rows)
+        sales = rng.gamma(2, 150, rows).round(2)
+        qty = rng.integers(1, 20, rows)
+        profit = rng.normal(40, 25, rows).round(2)
+        discount = rng.choice([0.0, 0.05, 0.1, 0.2], rows)
+        for i in range(rows):
+            ws.append([i, dates[i], regions[i], products[i], float(sales[i]), int(qty[i]), float(profit[i]), float(discount[i])])
+    wb.save(path)
+
+
+def _load_read_excel(path):
+    df = pd.read_excel(path)
+    return list(df.shape)
+
+
+def _load_streaming(path):
+    from loaders import read_excel_stream
+    with open(path, 'rb') as f:
+        df = read_excel_stream(f)
+    return list(df.shape)
+
+
+def bench_excel(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.xlsx')
+        start = time.perf_counter()
+        make_workbook(path, rows)
+        print(f"Generated {rows:,}-row workbook ({os.path.getsize(path) / 1024**2:.1f} MB) in {time.perf_counter() - start:.1f} s")
+
+        results = [
+            ('pd.read_excel', measure(_load_read_excel, path)),
+            ('read_excel_stream (read-only)', measure(_load_streaming, path)),
+        ]
+    print_table(f"Excel ingestion, {rows:,} rows x 8 columns", results)
+    return {name: m for name, m in results}
+
+
+# ---------------------------------------------------------------------------
+# Duplicate detection: 64-bit row hashing vs DataFrame.drop_duplicates
+# ---------------------------------------------------------------------------
+
+def make_wide_frame(rows, cols, duplicate_fraction=0.05, seed=42):
+    """Object-heavy frame: half string columns, a quarter ints, a quarter floats, with repeated rows"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f'customer_{i:06d}' for i in range(50_000)], dtype=object)
+    unique_rows = rows - int(rows * duplicate_fraction)
+    # Each column is generated for the unique rows and expanded once, so the build step does
+    # not raise the peak RSS above the finished frame (the dedupe step is what is measured)
+    source = np.concatenate([np.arange(unique_rows), rng.integers(0, unique_rows, rows - unique_rows)])
+    data = {}
+    for i in range(cols):
+        if i % 4 == 0:
+            data[f'amount_{i}'] = rng.normal(100, 30, unique_rows).round(2)[source]
+        elif i % 4 == 1:
+            data[f'count_{i}'] = rng.integers(0, 1000, unique_rows)[source]
+        else:
+            data[f'name_{i}'] = words[rng.integers(0, len(words), unique_rows)[source]]
+    return pd.DataFrame(data, copy=False)
+
+
+def _dedupe_run(method, rows, cols):
+    """Build the frame, then time only the duplicate removal and its memory growth"""
+    df = make_wide_frame(rows, cols)
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    if method == 'hash':
+        from dedupe import find_duplicates
+        duplicated, _ = find_duplicates(df)
+        df.drop(index=df.index[duplicated], inplace=True)
+    else:
+        df.drop_duplicates(inplace=True)
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_mb()
+    return {'seconds': round(elapsed, 3), 'peak_rss_mb': peak and round(peak, 1),
+            'rss_growth_mb': peak and round(peak - baseline, 1), 'rows_kept': len(df)}
+
+
+def bench_dedupe(rows, cols):
+    results = []
+    for name, method in [('drop_duplicates', 'pandas'), ('find_duplicates (row hash)', 'hash')]:
+        results.append((name, measure(_dedupe_run, method, rows, cols)['result']))
+    print_table(f"Duplicate removal, {rows:,} rows x {cols} columns (dedupe step only)", results)
+    return {name: m for name, m in results}
+
+
+# ---------------------------------------------------------------------------
+# Frame handoff to worker processes: pickled copies vs shared memory
+# ---------------------------------------------------------------------------
+
+def _own_peak_mb():
+    """Peak RSS of this process's own address space (ru_maxrss survives exec, VmHWM does not)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _numeric_total(df):
+    return float(df.select_dtypes(include=[np.number]).sum().sum()), _own_peak_mb()
+
+
+def _total_shared(handle):
+    from shared_frame import SharedFrame
+    shared = SharedFrame.attach(handle)
+    # Only the columns the task needs are materialized; numeric ones are views
+    return _numeric_total(shared.frame(columns=shared.raw_columns()))
+
+
+def _handoff_run(method, rows, cols, workers):
+    """Give every worker the whole frame and sum its numeric columns; time the handoff and work"""
+    from concurrent.futures import ProcessPoolExecutor
+    from shared_frame import SharedFrame
+
+    df = make_wide_frame(rows, cols, duplicate_fraction=0)
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    # Spawned workers start empty, so their peak RSS shows what the handoff itself costs
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+        if method == 'pickle':
+            results = list(pool.map(_numeric_total, [df] * workers))
+        else:
+            with SharedFrame.publish(df) as shared:
+                results = list(pool.map(_total_shared, [shared.handle] * workers))
+    elapsed = time.perf_counter() - start
+    peak = _peak_rss_mb()
+    worker_peaks = [mb for _, mb in results if mb is not None]
+    return {'seconds': round(elapsed, 3), 'peak_rss_mb': peak and round(peak, 1),
+            'rss_growth_mb': peak and round(peak - baseline, 1),
+            'worker_peak_rss_mb': round(max(worker_peaks), 1) if worker_peaks else None, 'total': results[0][0]}
+
+
+def bench_shared(rows, cols, workers):
+    results = []
+    for name, method in [('pickled frame per worker', 'pickle'), ('SharedFrame (shared memory)', 'shared')]:
+        results.append((name, measure(_handoff_run, method, rows, cols, workers)['result']))
+    print_table(f"Frame handoff to {workers} workers, {rows:,} rows x {cols} columns", results)
+    for name, m in results:
+        print(f"{name:<32} largest worker peak RSS {m['worker_peak_rss_mb']} MB")
+    return {name: m for name, m in results}
+
+
+# ---------------------------------------------------------------------------
+# Response serialization: recursive sanitize + Flask JSON vs one-pass encoding
+# ---------------------------------------------------------------------------
+
+def make_analysis_result(rows, cols):
+    """Analysis result of a wide numeric/categorical frame (all stages except charts and reports)"""
+    from app import DataAnalyst
+
+    rng = np.random.default_rng(42)
+    data = {'Order_Date': pd.date_range('2022-01-01', periods=rows, freq='h')}
+    for i in range(cols - 1):
+        if i % 5 == 0:
+            data[f'segment_{i}'] = rng.choice(['North', 'South', 'East', 'West', None], rows)
+        else:
+            column = rng.normal(100, 25, rows)
+            column[rng.random(rows) < 0.03] = np.nan
+            data[f'metric_{i}'] = column
+    analyst = DataAnalyst(pd.DataFrame(data))
+    understanding = analyst.understand_data()
+    cleaning = analyst.clean_data()
+    eda = analyst.perform_eda()
+    insights, detailed = analyst.generate_insights()
+    return {'understanding': understanding, 'cleaning': cleaning, 'eda': eda, 'insights': insights,
+            'detailed_insights': detailed, 'python_code': analyst.generate_python_code('data.csv'),
+            'sql_queries': analyst.generate_sql_queries(), 'dax_measures': analyst.generate_dax_measures()}
+
+
+def _time(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def bench_serialize(rows, cols):
+    import gzip
+    from app import app
+    from serialization import brotli, dumps, dumps_stdlib, orjson
+
+    result = make_analysis_result(rows, cols)
+    results = {}
+    with app.app_context():
+        # Previous path: sanitize_for_json walk, then Flask's provider (sorted keys, indented in debug)
+        legacy = lambda: app.json.dumps(_legacy_sanitize(result)).encode()
+        candidates = [('sanitize + jsonify', legacy), ('serialization.dumps (stdlib)', lambda: dumps_stdlib(result))]
+        if orjson is not None:
+            candidates.append(('serialization.dumps (orjson)', lambda: dumps(result)))
+        for name, fn in candidates:
+            seconds, body = _time(fn)
+            results[name] = {'seconds': round(seconds, 4), 'bytes': len(body)}
+
+    body = dumps(result)
+    sizes = {'identity': len(body), 'gzip': len(gzip.compress(body, compresslevel=5))}
+    if brotli is not None:
+        sizes['br'] = len(brotli.compress(body, quality=5))
+    results['payload_bytes'] = sizes
+
+    print(f"\nJSON serialization of a {cols}-column analysis result ({rows:,} rows)")
+    print("-" * 72)
+    for name, m in results.items():
+        if name != 'payload_bytes':
+            print(f"{name:<32} {m['seconds'] * 1000:>9.1f} ms   {m['bytes']:,} bytes")
+    print('Payload: ' + ', '.join(f"{enc} {size:,} bytes" for enc, size in sizes.items()))
+    return results
+
+
+def _legacy_sanitize(obj):
+    """The recursive walk the /analyze endpoint ran before serialization.py"""
+    if isinstance(obj, dict):
+        return {k: _legacy_sanitize(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_legacy_sanitize(item) for item in obj]
+    elif isinstance(obj, (np.integer, np.floating)):
+        if np.isnan(obj) or np.isinf(obj):
+            return None
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return _legacy_sanitize(obj.tolist())
+    elif isinstance(obj, float):
+        if np.isnan(obj) or np.isinf(obj):
+            return None
+        return obj
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI Data Analyst benchmarks')
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    p = sub.add_parser('excel', help='Streaming Excel reader vs pd.read_excel')
+    p.add_argument('--rows', type=int, default=500_000)
+
+    p = sub.add_parser('dedupe', help='Row-hash duplicate detection vs drop_duplicates')
+    p.add_argument('--rows', type=int, default=5_000_000)
+    p.add_argument('--cols', type=int, default=40)
+
+    p = sub.add_parser('shared', help='Shared-memory frame handoff vs pickling to worker processes')
+    p.add_argument('--rows', type=int, default=2_000_000)
+    p.add_argument('--cols', type=int, default=40)
+    p.add_argument('--workers', type=int, default=4)
+
+    p = sub.add_parser('serialize', help='One-pass JSON encoding vs sanitize_for_json + jsonify')
+    p.add_argument('--rows', type=int, default=5000)
+    p.add_argument('--cols', type=int, default=300)
+
+    parser.add_argument('--json', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    if args.benchmark == 'excel':
+        results = bench_excel(args.rows)
+    elif args.benchmark == 'dedupe':
+        results = bench_dedupe(args.rows, args.cols)
+    elif args.benchmark == 'shared':
+        results = bench_shared(args.rows, args.cols, args.workers)
+    elif args.benchmark == 'serialize':
+        results = bench_serialize(args.rows, args.cols)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,21 @@
 Configuration file for AI Data Analyst application
 """
 
+import math
 import os
 
+
+def _env_seconds(name):
+    """Positive, finite number of seconds from environment variable ``name`` (None when unset)"""
+    value = os.environ.get(name)
+    if not value:
+        return None
+    seconds = float(value)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"{name} must be a positive number of seconds, got {value!r}")
+    return seconds
+
+
 class Config:
     """Base configuration"""
     
@@ -14,14 +27,15 @@ class Config:
     # Upload settings
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
-    ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'json'}
+    ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'json', 'jsonl', 'ndjson'}
     
     # Analysis settings
     MAX_PREVIEW_ROWS = 10
     MAX_CATEGORICAL_UNIQUE = 100
-    OUTLIER_METHOD = 'IQR'  # or 'Z-score'
+    OUTLIER_METHOD = 'IQR'  # 'IQR', 'Z-score' or 'MAD'
     IQR_MULTIPLIER = 1.5
     Z_SCORE_THRESHOLD = 3
+    MAD_THRESHOLD = 3.5  # Modified z-score cut-off for OUTLIER_METHOD = 'MAD'
     
     # Visualization settings
     FIGURE_DPI = 100
@@ -30,12 +44,68 @@ class Config:
     
     # Code generation settings
     PYTHON_STYLE = 'PEP8'
-    SQL_DIALECT = 'standard'  # standard, mysql, postgresql, bigquery
+    SQL_DIALECT = 'standard'  # standard, mysql, postgresql, bigquery, sqlite
+    SQL_VALIDATION_MAX_ROWS = 1000000  # Generated SQL is run on an SQLite copy of cleaned frames up to this size (0 = never)
+    SQL_DATABASE_DIR = os.environ.get('ANALYSIS_SQL_DATABASE_DIR') or None  # Temporary SQLite files go here (None = in memory)
+    SQL_INSERT_BATCH = 50000  # Rows per executemany call when loading SQLite
+    SQL_PREVIEW_ROWS = 10  # Result rows returned with each validated query
+    TEMPLATE_CACHE_ENTRIES = int(os.environ.get('ANALYSIS_TEMPLATE_CACHE_ENTRIES', 512))  # Generated code/SQL/DAX/notebook templates kept per schema fingerprint (0 = none)
     
     # Performance settings
     CHUNK_SIZE = 10000  # For large file processing
-    MAX_CORRELATION_COLUMNS = 20
+    MAX_CORRELATION_COLUMNS = 20  # Columns in the correlation matrix returned by EDA and the Excel report
+    CORRELATION_METHOD = 'pearson'  # 'pearson' or 'spearman'
+    CORRELATION_TOP_PAIRS = 25  # Strongest column pairs reported
+    CORRELATION_BLOCK_MB = 64  # Working memory per block of the correlation engine
+    MAX_FOCUS_COLUMNS = 50  # Top-ranked measures/dimensions the expensive stages run on
+    RANKING_SAMPLE_ROWS = 10000  # Rows sampled to rank columns by variance, cardinality and centrality
+    ANALYSIS_STORE_SIZE = 16  # Incremental analyses kept for appends (least recently used evicted)
     MAX_CHART_CATEGORIES = 20
+    SEGMENT_PAIR_COLUMNS = 3  # Leading categorical columns also aggregated pairwise in the segment cube
+    EXCEL_SHEET_WORKERS = 4  # Processes for multi-sheet Excel uploads (0 = one per CPU)
+    CHUNKED_MODE_THRESHOLD = 50 * 1024 * 1024  # Uploads above this size are profiled chunk by chunk
+    CHUNKED_SAMPLE_ROWS = 50000  # Uniform row sample kept for charts/insights in chunked mode
+    PROFILE_TOPK_CAPACITY = 1000  # Distinct values tracked per column while profiling
+    PARALLEL_WORKERS = int(os.environ.get('ANALYSIS_PARALLEL_WORKERS', 0))  # Processes for row-shard map-reduce (0 = one per CPU, 1 = serial)
+    PARALLEL_MIN_ROWS = 200000  # Smaller frames are aggregated in-process (pool start-up outweighs the gain)
+    SPILL_THRESHOLD_MB = int(os.environ.get('ANALYSIS_SPILL_THRESHOLD_MB', 0))  # Cleaned frames above this are memory-mapped from disk (0 = never)
+    SPILL_DIR = os.environ.get('ANALYSIS_SPILL_DIR') or None  # Parent of the per-analysis spill directories (None = system temp dir)
+    SPILL_MAX_CATEGORIES = 65536  # Text columns with more distinct values stay in memory when spilling
+    
+    # Response encoding (orjson and brotli are used when installed)
+    COMPRESSION_MIN_BYTES = 1024  # Smaller JSON responses are sent uncompressed
+    GZIP_LEVEL = 5
+    BROTLI_QUALITY = 5
+    RESPONSE_SCHEMA_VERSION = 1  # 2 = no duplicated sections, large artifacts referenced by id
+    ARTIFACT_STORE_MB = 256  # Chart images, notebooks and JSON deliverables kept for download
+    
+    # Drill-down queries over retained cleaned datasets (/query/<analysis_id>)
+    QUERY_STORE_MB = int(os.environ.get('ANALYSIS_QUERY_STORE_MB', 512))  # Cleaned frames and their indexes kept for queries (least recently used evicted; 0 = none)
+    QUERY_BITMAP_MAX_VALUES = 256  # Coded columns with more distinct values are filtered by scanning codes
+    QUERY_DEFAULT_LIMIT = 100
+    QUERY_MAX_LIMIT = 10000
+    
+    # Admission control (budget is per worker process)
+    MEMORY_BUDGET_MB = int(os.environ.get('ANALYSIS_MEMORY_BUDGET_MB', 2048))  # Includes the QUERY_STORE_MB of retained query frames
+    ADMISSION_QUEUE_TIMEOUT = 30  # Seconds a request may wait for memory before a 503
+    PIPELINE_MEMORY_FACTOR = 3  # Working frame plus cleaning/EDA intermediates, relative to the parsed DataFrame
+    EXCEL_CELL_BYTES = 300  # Memory per cell of the report workbook's data sheet (openpyxl keeps every cell)
+    
+    # Deadline-aware analysis (time_budget request field overrides the default)
+    DEFAULT_TIME_BUDGET = _env_seconds('ANALYSIS_TIME_BUDGET')
+    DEADLINE_RESERVE_SECONDS = 2  # Kept free for building and serializing the response
+    STAGE_TIME_ESTIMATES = {  # Seconds per 100k rows for optional stages
+        'correlation_heatmap': 1.0,
+        'distribution_charts': 1.5,
+        'category_charts': 1.0,
+        'scatter_matrix': 3.0,
+        'time_series_chart': 1.0,
+        'segment_chart': 1.5,
+        'notebook': 0.5,
+        'excel_report': 1.0,
+        'excel_data_sheet': 8.0,
+        'sql_validation': 1.0,
+    }
 
 class DevelopmentConfig(Config):
     """Development configuration"""
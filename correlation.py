@@ -0,0 +1,308 @@
+"""
+Blocked top-k correlation engine for wide numeric tables
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+
+METHODS = ('pearson', 'spearman')
+
+# |r| cut-offs used to label relationships in insights and recommendations
+STRENGTH_LEVELS = {'Strong': 0.7, 'Moderate': 0.5}
+
+# Relative variance below which a column counts as constant on a pair's shared rows
+# (float32 engine values, and float64 sufficient statistics)
+SPREAD_TOLERANCE = 1e-5
+STATS_SPREAD_TOLERANCE = 1e-12
+
+
+def strength(r):
+    """Strength label of a correlation coefficient ('Strong', 'Moderate' or 'Weak')"""
+    for label, level in STRENGTH_LEVELS.items():
+        if abs(r) > level:
+            return label
+    return 'Weak'
+
+
+def _standardize(df, columns, method):
+    """Centered, unit-norm float32 columns with missing values set to 0, the missing mask
+    (None when nothing is missing) and a mask of columns without any spread.
+
+    Columns are converted one at a time, so no float64 copy of the whole table is made.
+    """
+    n, k = len(df), len(columns)
+    values = np.empty((n, k), dtype=np.float32)
+    missing = np.zeros((n, k), dtype=bool)
+    constant = np.ones(k, dtype=bool)
+    for idx, col in enumerate(columns):
+        series = df[col]
+        if method == 'spearman':
+            # Ranks of the non-missing values (ties share their average rank)
+            series = series.rank()
+        column = series.to_numpy(dtype=float, na_value=np.nan)
+        absent = ~np.isfinite(column)
+        present = column[~absent]
+        if len(present):
+            centered = present - present.mean()
+            norm = np.sqrt(np.dot(centered, centered))
+            column = np.where(absent, 0.0, column - present.mean())
+            if norm > 0:
+                column /= norm
+                constant[idx] = False
+        else:
+            column = np.zeros(n)
+        values[:, idx] = column
+        missing[:, idx] = absent
+    return values, (missing if missing.any() else None), constant
+
+
+def _pairwise_r(a, present_a, b, present_b):
+    """Correlations between the columns of ``a`` and ``b`` over the rows where both are present"""
+    count = present_a.T @ present_b
+    sum_a, sum_b = a.T @ present_b, present_a.T @ b
+    squares_a, squares_b = (a * a).T @ present_b, present_a.T @ (b * b)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = a.T @ b - sum_a * sum_b / count
+        var_a = squares_a - sum_a * sum_a / count
+        var_b = squares_b - sum_b * sum_b / count
+        r = cov / np.sqrt(var_a * var_b)
+    # Too few shared rows, or no spread beyond float32 rounding on those rows
+    r[(count < 2) | (var_a <= SPREAD_TOLERANCE * squares_a) | (var_b <= SPREAD_TOLERANCE * squares_b)] = np.nan
+    return r
+
+
+class CorrelationEngine:
+    """Pearson or Spearman correlations of many numeric columns, computed block by block.
+
+    Columns are standardized once; correlations are then matrix products of column blocks with
+    the whole table, sized so each block of results stays within ``Config.CORRELATION_BLOCK_MB``.
+    Only the strongest pairs, one column's drivers, or a small matrix are ever materialized.
+    Pairs with missing values use the rows where both columns are present, as pandas does.
+    """
+
+    def __init__(self, columns, values, missing, constant, method='pearson', block_mb=None):
+        self.columns = list(columns)
+        self.method = method
+        self.values = values
+        self.missing = missing
+        self.constant = constant
+        self.block_mb = Config.CORRELATION_BLOCK_MB if block_mb is None else block_mb
+        self._scans = {}
+        # Precomputed correlations (engines built from CorrelationStats have no row values)
+        self._matrix = None
+
+    @classmethod
+    def from_frame(cls, df, columns, method=None, block_mb=None):
+        method = str(method or Config.CORRELATION_METHOD).lower()
+        if method not in METHODS:
+            raise ValueError(f"Unknown correlation method '{method}'. Use one of: {', '.join(METHODS)}")
+        values, missing, constant = _standardize(df, list(columns), method)
+        return cls(columns, values, missing, constant, method, block_mb)
+
+    @classmethod
+    def from_stats(cls, stats, columns=None, labels=None):
+        """Engine over full-data sufficient statistics, for ``columns`` (default: all tracked)
+        reported under ``labels`` (default: the column names)"""
+        columns = list(stats.columns if columns is None else columns)
+        matrix = stats.correlations(columns)
+        engine = cls(labels or columns, None, None, np.all(np.isnan(matrix), axis=1), 'pearson')
+        engine._matrix = matrix
+        return engine
+
+    def _block_columns(self):
+        # A block holds a handful of (block x k) float32 intermediates
+        per_column = max(len(self.columns), 1) * 4 * 8
+        return max(1, int(self.block_mb * 1024 * 1024 // per_column))
+
+    def _pairwise_columns(self):
+        # Pairwise-complete sums hold about six (rows x width) float32 intermediates
+        per_column = max(len(self.values), 1) * 4 * 6
+        return max(1, int(self.block_mb * 1024 * 1024 // per_column))
+
+    def _cross(self, left, right):
+        """Correlations between the ``left`` and ``right`` column selections (slices or index arrays)"""
+        if self._matrix is not None:
+            return self._matrix[left][:, right]
+        a, b = self.values[:, left], self.values[:, right]
+        if self.missing is None:
+            r = a.T @ b
+            r[self.constant[left]] = np.nan
+            r[:, self.constant[right]] = np.nan
+            return r
+        # Pairwise-complete moments: every sum only covers rows where both columns are present.
+        # Presence masks and squares are built for a few columns at a time, never for the table
+        positions = np.arange(len(self.columns))
+        left, right = positions[left], positions[right]
+        r = np.empty((len(left), len(right)), dtype=np.float32)
+        width = self._pairwise_columns()
+        for i in range(0, len(left), width):
+            cols_a = left[i:i + width]
+            a, present_a = self.values[:, cols_a], (~self.missing[:, cols_a]).astype(np.float32)
+            for j in range(0, len(right), width):
+                cols_b = right[j:j + width]
+                b, present_b = self.values[:, cols_b], (~self.missing[:, cols_b]).astype(np.float32)
+                r[i:i + width, j:j + width] = _pairwise_r(a, present_a, b, present_b)
+        return r
+
+    def _scan(self, k, threshold):
+        """Top ``k`` pairs with |r| above ``threshold`` and pair counts per strength level"""
+        total = len(self.columns)
+        best_r = np.empty(0, dtype=np.float32)
+        best_i = best_j = np.empty(0, dtype=np.intp)
+        counts = dict.fromkeys(STRENGTH_LEVELS, 0)
+        step = self._block_columns()
+        for start in range(0, total, step):
+            stop = min(start + step, total)
+            # Only the upper triangle: block columns against themselves and every later column
+            block = self._cross(slice(start, stop), slice(start, total))
+            rows, cols = np.triu_indices(stop - start, k=1, m=total - start)
+            r = block[rows, cols]
+            strengths = np.nan_to_num(np.abs(r))
+            for label, level in STRENGTH_LEVELS.items():
+                counts[label] += int((strengths > level).sum())
+            keep = np.flatnonzero(strengths > threshold)
+            if len(keep) > k:
+                keep = keep[np.argpartition(-strengths[keep], k - 1)[:k]]
+            best_r = np.concatenate([best_r, r[keep]])
+            best_i = np.concatenate([best_i, rows[keep] + start])
+            best_j = np.concatenate([best_j, cols[keep] + start])
+            if len(best_r) > k:
+                top = np.argpartition(-np.abs(best_r), k - 1)[:k]
+                best_r, best_i, best_j = best_r[top], best_i[top], best_j[top]
+        order = np.lexsort((best_j, best_i, -np.abs(best_r)))
+        return best_r[order], best_i[order], best_j[order], counts
+
+    def _scan_cached(self, k, threshold):
+        key = (k, threshold)
+        if key not in self._scans:
+            self._scans[key] = self._scan(k, threshold)
+        return self._scans[key]
+
+    def top_pairs(self, k=None, threshold=0.0):
+        """Up to ``k`` column pairs with the largest |r| above ``threshold``, strongest first"""
+        k = Config.CORRELATION_TOP_PAIRS if k is None else k
+        values, rows, cols, _ = self._scan_cached(k, threshold)
+        return [
+            {'var1': str(self.columns[i]), 'var2': str(self.columns[j]), 'correlation': float(r), 'strength': strength(r)}
+            for r, i, j in zip(values.tolist(), rows.tolist(), cols.tolist())
+        ]
+
+    def strength_counts(self, k=None, threshold=0.0):
+        """Number of pairs above each STRENGTH_LEVELS cut-off (shares the top_pairs scan)"""
+        k = Config.CORRELATION_TOP_PAIRS if k is None else k
+        return dict(self._scan_cached(k, threshold)[3])
+
+    def centrality(self):
+        """Mean |r| of each column with every other column, accumulated block by block"""
+        total = len(self.columns)
+        sums = np.zeros(total)
+        step = self._block_columns()
+        for start in range(0, total, step):
+            stop = min(start + step, total)
+            block = np.nan_to_num(np.abs(self._cross(slice(start, stop), slice(None))))
+            # Drop each column's correlation with itself
+            block[np.arange(stop - start), np.arange(start, stop)] = 0
+            sums[start:stop] = block.sum(axis=1)
+        return pd.Series(sums / max(total - 1, 1), index=self.columns)
+
+    def drivers(self, target, n=5):
+        """The ``n`` columns most correlated with ``target`` (e.g. a KPI), strongest first"""
+        t = self.columns.index(target)
+        r = self._cross([t], slice(None))[0].astype(float)
+        r[t] = np.nan
+        ranked = [j for j in np.argsort(-np.nan_to_num(np.abs(r)), kind='stable') if not np.isnan(r[j])][:n]
+        return [{'column': str(self.columns[j]), 'correlation': float(r[j]), 'strength': strength(r[j])} for j in ranked]
+
+    def matrix(self, columns=None):
+        """Full correlation matrix of ``columns`` (default: the first MAX_CORRELATION_COLUMNS)"""
+        if columns is None:
+            columns = self.columns[:Config.MAX_CORRELATION_COLUMNS]
+        idx = [self.columns.index(col) for col in columns]
+        r = self._cross(idx, idx).astype(float)
+        # Exact ones on the diagonal for every column with any spread, as pandas reports
+        diagonal = np.diag(r).copy()
+        np.fill_diagonal(r, np.where(np.isnan(diagonal), np.nan, 1.0))
+        return pd.DataFrame(np.clip(r, -1, 1), index=list(columns), columns=list(columns))
+
+    def leading_columns(self, limit=None):
+        """Columns in order of first appearance among the strongest pairs, then the rest"""
+        limit = Config.MAX_CORRELATION_COLUMNS if limit is None else limit
+        _, rows, cols, _ = self._scan_cached(Config.CORRELATION_TOP_PAIRS, 0.0)
+        ordered = list(dict.fromkeys(np.column_stack([rows, cols]).ravel().tolist()))
+        seen = set(ordered)
+        ordered += [idx for idx in range(len(self.columns)) if idx not in seen]
+        return [self.columns[idx] for idx in ordered[:limit]]
+
+
+class CorrelationStats:
+    """Mergeable pairwise sufficient statistics for Pearson correlations.
+
+    For every column pair the rows where both are present contribute to a count, the sums and
+    sums of squares of each side, and the cross product. Values are shifted by the first batch's
+    means to keep the float64 sums well conditioned. Batches can be added with ``update`` or
+    combined with ``merge``; correlations never need the historical rows again.
+    """
+
+    def __init__(self, columns, shift):
+        k = len(columns)
+        self.columns = list(columns)
+        self.shift = np.asarray(shift, dtype=float)
+        self.rows = 0
+        self.count = np.zeros((k, k))
+        self.sums = np.zeros((k, k))
+        self.squares = np.zeros((k, k))
+        self.products = np.zeros((k, k))
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        columns = list(columns)
+        shift = np.nan_to_num(np.array([df[col].mean() if col in df else np.nan for col in columns], dtype=float))
+        return cls(columns, shift).update(df)
+
+    def update(self, df):
+        n, k = len(df), len(self.columns)
+        values = np.full((n, k), np.nan)
+        for idx, col in enumerate(self.columns):
+            if col in df:
+                values[:, idx] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        present = np.isfinite(values)
+        shifted = np.where(present, values - self.shift, 0.0)
+        mask = present.astype(float)
+        # Entry [a, b] sums column a over the rows where b is present too
+        self.count += mask.T @ mask
+        self.sums += shifted.T @ mask
+        self.squares += (shifted * shifted).T @ mask
+        self.products += shifted.T @ shifted
+        self.rows += n
+        return self
+
+    def merge(self, other):
+        """Add statistics gathered over other rows (same columns; rebased onto this shift)"""
+        if other.columns != self.columns:
+            raise ValueError("Correlation statistics cover different columns")
+        delta = other.shift - self.shift
+        # Moving other's values from its shift to ours: x' = x + delta
+        d_a, d_b = delta[:, None], delta[None, :]
+        sums_b = other.sums.T
+        self.products += other.products + d_b * other.sums + d_a * sums_b + d_a * d_b * other.count
+        self.squares += other.squares + 2 * d_a * other.sums + d_a ** 2 * other.count
+        self.sums += other.sums + d_a * other.count
+        self.count += other.count
+        self.rows += other.rows
+        return self
+
+    def correlations(self, columns=None):
+        """Pairwise-complete Pearson correlation matrix (NaN where undefined)"""
+        idx = np.arange(len(self.columns)) if columns is None else [self.columns.index(col) for col in columns]
+        count = self.count[np.ix_(idx, idx)]
+        sums, squares, products = (stat[np.ix_(idx, idx)] for stat in (self.sums, self.squares, self.products))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = products - sums * sums.T / count
+            var_a = squares - sums * sums / count
+            var_b = var_a.T
+            r = cov / np.sqrt(var_a * var_b)
+        r[(count < 2) | (var_a <= STATS_SPREAD_TOLERANCE * squares) | (var_b <= STATS_SPREAD_TOLERANCE * squares.T)] = np.nan
+        return np.clip(r, -1, 1)
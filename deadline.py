@@ -0,0 +1,78 @@
+"""
+Cooperative time budgets for the analysis pipeline
+"""
+
+import math
+import time
+from contextlib import contextmanager
+
+from config import Config
+
+
+class Deadline:
+    """Time budget shared by the stages of one analysis.
+
+    Stages are timed with ``stage()``. Optional stages ask ``allows()`` first; once the budget
+    is nearly spent they are skipped and recorded, so the request can still return what has
+    completed instead of being cut off by the gateway.
+    """
+
+    def __init__(self, budget_seconds=None, rows=0):
+        self.budget = budget_seconds
+        self.rows = rows
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.skipped = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def remaining(self):
+        if self.budget is None:
+            return float('inf')
+        return self.budget - self.elapsed()
+
+    def estimate(self, stage):
+        """Expected seconds for an optional stage, scaled by dataset size"""
+        base = Config.STAGE_TIME_ESTIMATES.get(stage, 1.0)
+        return base * max(1.0, self.rows / 100000)
+
+    def allows(self, stage, seconds=None):
+        """True if ``stage`` fits in the remaining budget; otherwise record it as skipped"""
+        if self.budget is None:
+            return True
+        needed = (seconds if seconds is not None else self.estimate(stage)) + Config.DEADLINE_RESERVE_SECONDS
+        if self.remaining() >= needed:
+            return True
+        if stage not in self.skipped:
+            self.skipped.append(stage)
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(self.timings.get(name, 0.0) + time.perf_counter() - start, 4)
+
+    def to_dict(self):
+        return {
+            'time_budget_seconds': self.budget,
+            'elapsed_seconds': round(self.elapsed(), 3),
+            'stage_timings': dict(self.timings),
+            'skipped_stages': list(self.skipped)
+        }
+
+
+def parse_time_budget(value):
+    """Parse a time_budget request value in seconds; falls back to DEFAULT_TIME_BUDGET"""
+    if value in (None, ''):
+        return Config.DEFAULT_TIME_BUDGET
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid time_budget: {value!r} (expected seconds)")
+    if not math.isfinite(budget) or budget <= 0:
+        raise ValueError("time_budget must be a positive, finite number of seconds")
+    return budget
@@ -0,0 +1,87 @@
+"""
+Hash-based duplicate detection with duplicate-group reporting
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def row_hashes(df, subset=None):
+    """64-bit hash of each row (or of the ``subset`` columns), computed column-wise in C.
+
+    The hashes depend only on the values, not the index, so they can be stored and compared
+    across batches of the same dataset.
+    """
+    frame = df if subset is None else df[list(subset)]
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+class DuplicateKeyError(ValueError):
+    """A duplicate_key names columns the dataset does not have (a client error)"""
+
+
+def check_duplicate_key(columns, key):
+    """Raise DuplicateKeyError unless every ``key`` column is in ``columns``"""
+    missing = [col for col in key if col not in columns]
+    if missing:
+        raise DuplicateKeyError(f"duplicate_key column(s) not found: {', '.join(map(str, missing))}")
+
+
+def parse_duplicate_key(value):
+    """Parse a comma-separated duplicate_key request value into a column list (None = all columns)"""
+    if value is None or not str(value).strip():
+        return None
+    return [name.strip() for name in str(value).split(',') if name.strip()]
+
+
+def _same_rows(frame, left, right):
+    """Row-wise equality of two row selections, treating missing values as equal"""
+    a = frame.iloc[left].reset_index(drop=True)
+    b = frame.iloc[right].reset_index(drop=True)
+    return ((a == b) | (a.isna() & b.isna())).all(axis=1).to_numpy()
+
+
+def find_duplicates(df, subset=None, hashes=None, max_groups=10, examples=3):
+    """Flag repeated rows (keeping the first occurrence) and describe the duplicate groups.
+
+    Rows are grouped by their 64-bit hash with one hash-table pass; rows flagged as duplicates
+    are then compared with their group's first row, so a hash collision can never drop a row.
+    Returns ``(duplicated, report)`` where ``duplicated`` is a boolean array aligned with ``df``.
+    """
+    if hashes is None:
+        hashes = row_hashes(df, subset)
+    n = len(hashes)
+    report = {'key': list(subset) if subset is not None else 'all columns', 'duplicate_rows': 0, 'duplicate_groups': 0, 'groups': []}
+    if n == 0:
+        return np.zeros(0, dtype=bool), report
+
+    # factorize numbers hashes in order of first appearance, so a row is a group's first row
+    # exactly when its code exceeds every code before it
+    codes, _ = pd.factorize(hashes)
+    sizes = np.bincount(codes)
+    duplicated = np.empty(n, dtype=bool)
+    duplicated[0] = False
+    duplicated[1:] = codes[1:] <= np.maximum.accumulate(codes)[:-1]
+    first = np.flatnonzero(~duplicated)
+    candidates = np.flatnonzero(duplicated)
+    if len(candidates):
+        frame = df if subset is None else df[list(subset)]
+        collided = ~_same_rows(frame, candidates, first[codes[candidates]])
+        duplicated[candidates[collided]] = False
+
+    report['duplicate_rows'] = int(duplicated.sum())
+    repeated = np.flatnonzero(sizes > 1)
+    report['duplicate_groups'] = int(len(repeated))
+
+    # Largest groups first, each with the positions of a few of its rows and one example row
+    largest = repeated[np.argsort(-sizes[repeated], kind='stable')[:max_groups]]
+    for group in largest:
+        rows = np.flatnonzero(codes == group)[:examples]
+        example = df.iloc[int(rows[0])]
+        report['groups'].append({
+            'count': int(sizes[group]),
+            'row_positions': [int(r) for r in rows],
+            'example': {str(k): v for k, v in example.items()}
+        })
+    return duplicated, report
+
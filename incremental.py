@@ -0,0 +1,178 @@
+"""
+Incremental re-analysis: mergeable dataset state kept between uploads of appended rows
+"""
+
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from correlation import CorrelationStats
+from dedupe import check_duplicate_key, find_duplicates, row_hashes
+from profiling import ChunkedProfiler
+from ranking import ColumnRanking
+from rollups import TimeRollup
+
+
+def _date_columns(df):
+    """Datetime columns, plus text columns that parse as dates (as DataAnalyst.clean_data does)"""
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            columns.append(col)
+        elif series.dtype == 'object' and series.notna().any():
+            try:
+                pd.to_datetime(series.dropna())
+                columns.append(col)
+            except (ValueError, TypeError):
+                pass
+    return columns
+
+
+def _contains(sorted_hashes, hashes):
+    """Whether each of ``hashes`` occurs in the sorted array ``sorted_hashes`` (binary search)"""
+    found = np.zeros(len(hashes), dtype=bool)
+    if len(sorted_hashes):
+        pos = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+        found = sorted_hashes[pos] == hashes
+    return found
+
+
+def _merge_sorted(a, b):
+    """Sorted union (with repeats) of two sorted arrays, in one copy of the larger one"""
+    if len(a) < len(b):
+        a, b = b, a
+    return np.insert(a, np.searchsorted(a, b), b)
+
+
+class IncrementalState:
+    """Everything needed to refresh an analysis from new rows only.
+
+    The ChunkedProfiler keeps counts, moments, nulls, quantile sketches, top-k values and the
+    uniform row sample; TimeRollups and CorrelationStats keep full-data time aggregates and
+    correlation sufficient statistics. Columns are tracked under their uploaded names; the
+    layout (date columns, correlation columns) is fixed by the first batch.
+
+    The sorted 64-bit duplicate-key hash of every row folded in (8 bytes a row) is kept as well,
+    so repeated rows are skipped. Repeats within a chunk are confirmed by comparing the rows
+    (``duplicates_skipped``). Earlier chunks and uploads are not kept, so a repeat of one of their
+    rows is matched by hash alone (``hash_matches_skipped``): a 64-bit collision would drop a new
+    row. A batch's hashes are looked up by binary search and merged into the history once per
+    ``append``, so the cost of an append follows its own rows, not the history.
+    """
+
+    def __init__(self, filename='your_data.csv', duplicate_key=None):
+        self.filename = filename
+        self.duplicate_key = duplicate_key
+        self.profiler = ChunkedProfiler()
+        self.time_rollups = None
+        self.correlation_stats = None
+        self.key_hashes = np.empty(0, dtype=np.uint64)
+        # Sorted runs of this batch's hashes, each at most half the size of the one before
+        self._batch_hashes = []
+        self.duplicates_skipped = 0
+        self.hash_matches_skipped = 0
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    @property
+    def rows(self):
+        return self.profiler.rows
+
+    def _new_rows(self, chunk):
+        """``chunk`` without its repeated rows and those whose key hash has been seen before"""
+        if self.duplicate_key:
+            check_duplicate_key(chunk.columns, self.duplicate_key)
+        hashes = row_hashes(chunk, self.duplicate_key)
+        repeated, _ = find_duplicates(chunk, self.duplicate_key, hashes, max_groups=0)
+        seen = _contains(self.key_hashes, hashes)
+        for run in self._batch_hashes:
+            seen |= _contains(run, hashes)
+        seen &= ~repeated
+        new = ~(repeated | seen)
+        self.duplicates_skipped += int(repeated.sum())
+        self.hash_matches_skipped += int(seen.sum())
+        # Runs are merged like a binary counter, so a batch keeps O(log n) of them
+        run = np.sort(hashes[new])
+        while self._batch_hashes and len(self._batch_hashes[-1]) <= 2 * len(run):
+            run = _merge_sorted(self._batch_hashes.pop(), run)
+        self._batch_hashes.append(run)
+        return chunk if new.all() else chunk[new]
+
+    def _merge_batch_hashes(self):
+        """Fold this batch's hash runs into the history (one pass over it per batch)"""
+        batch = np.empty(0, dtype=np.uint64)
+        while self._batch_hashes:
+            batch = _merge_sorted(self._batch_hashes.pop(), batch)
+        self.key_hashes = _merge_sorted(self.key_hashes, batch)
+
+    def update(self, chunk):
+        """Fold one chunk of new rows into every statistic"""
+        chunk = self._new_rows(chunk)
+        if chunk.empty:
+            return self
+        if self.time_rollups is None:
+            self._start(chunk)
+        self.profiler.update(chunk)
+        value_cols = self._value_cols()
+        for date_col, rollup in self.time_rollups.items():
+            if date_col in chunk:
+                rollup.merge(TimeRollup.from_frame(chunk, date_col, [col for col in value_cols if col in chunk]))
+        if self.correlation_stats is not None:
+            self.correlation_stats.update(chunk)
+        return self
+
+    def append(self, chunks):
+        """Add a batch of chunks; returns the number of rows appended"""
+        before = self.rows
+        try:
+            for chunk in chunks:
+                self.update(chunk)
+        finally:
+            self._merge_batch_hashes()
+        self.batches += 1
+        return self.rows - before
+
+    def _start(self, chunk):
+        self.time_rollups = {col: TimeRollup(col, []) for col in _date_columns(chunk)}
+        # Correlations track the first batch's most informative measures (bounded k x k statistics)
+        numeric = ColumnRanking.from_frame(chunk, {}).top('numeric', Config.MAX_FOCUS_COLUMNS)
+        if len(numeric) > 1:
+            self.correlation_stats = CorrelationStats(numeric, np.nan_to_num(chunk[numeric].mean().to_numpy(dtype=float)))
+
+    def _value_cols(self):
+        return [col for col, profile in self.profiler.columns.items() if profile.kind == 'numeric']
+
+
+class AnalysisStore:
+    """Bounded, thread-safe map of analysis id to IncrementalState (least recently used evicted)"""
+
+    def __init__(self, capacity=None):
+        self.capacity = Config.ANALYSIS_STORE_SIZE if capacity is None else capacity
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, state):
+        analysis_id = uuid.uuid4().hex
+        with self._lock:
+            self._states[analysis_id] = state
+            while len(self._states) > self.capacity:
+                self._states.popitem(last=False)
+        return analysis_id
+
+    def get(self, analysis_id):
+        with self._lock:
+            state = self._states.get(analysis_id)
+            if state is not None:
+                self._states.move_to_end(analysis_id)
+            return state
+
+    def __len__(self):
+        return len(self._states)
+
+
+analysis_store = AnalysisStore()
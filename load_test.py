@@ -0,0 +1,450 @@
+"""
+Concurrent load test for /analyze
+
+Replays a weighted mix of synthetic datasets from N concurrent clients and reports throughput,
+p50/p95/p99 latency, error rate and peak RSS per worker, optionally written as JSON.
+
+Worker models:
+    inprocess  --workers spawned processes, each sending its share of the clients' requests
+               through its own Flask test client (one thread per client)
+    gunicorn   a local gunicorn (--workers x --threads) driven over HTTP by client threads
+
+Usage:
+    python load_test.py --clients 4 --requests 32
+    python load_test.py --workers 2 --clients 8 --mix sales:3,wide:1,events:1 --rows 20000 --json inprocess.json
+    python load_test.py --server gunicorn --workers 2 --threads 4 --clients 8 --json gunicorn.json
+    python load_test.py --clients 8 --field time_budget=30 --baseline inprocess.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import warnings
+import multiprocessing as mp
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _peak_rss_mb(pid='self'):
+    """Peak RSS of a process (VmHWM; ru_maxrss would include the spawning parent's peak)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid == 'self' and resource is not None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Synthetic datasets
+# ---------------------------------------------------------------------------
+
+def make_sales(rows, rng):
+    df = pd.DataFrame({
+        'Order_ID': np.arange(rows),
+        'Order_Date': pd.date_range('2022-01-01', periods=rows, freq='h').strftime('%Y-%m-%d'),
+        'Region': rng.choice(['North', 'South', 'East', 'West', None], rows),
+        'Product': rng.choice(['Laptop', 'Mouse', 'Keyboard', 'Monitor'], rows),
+        'Sales': rng.gamma(2, 150, rows).round(2),
+        'Quantity': rng.integers(1, 20, rows),
+        'Profit': rng.normal(40, 25, rows).round(2),
+    })
+    return df.to_csv(index=False).encode()
+
+
+def make_wide(rows, rng, cols=40):
+    data = {}
+    for i in range(cols):
+        if i % 5 == 0:
+            data[f'segment_{i}'] = rng.choice(['A', 'B', 'C', 'D', None], rows)
+        else:
+            column = rng.normal(100, 25, rows).round(3)
+            column[rng.random(rows) < 0.03] = np.nan
+            data[f'metric_{i}'] = column
+    return pd.DataFrame(data).to_csv(index=False).encode()
+
+
+def make_events(rows, rng):
+    df = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=rows, freq='min').strftime('%Y-%m-%d %H:%M:%S'),
+        'user': rng.choice([f'user_{i}' for i in range(500)], rows),
+        'event': rng.choice(['view', 'click', 'purchase'], rows, p=[0.7, 0.25, 0.05]),
+        'value': rng.exponential(20, rows).round(2),
+    })
+    return df.to_json(orient='records', lines=True).encode()
+
+
+def make_excel(rows, rng):
+    buffer = BytesIO()
+    pd.read_csv(BytesIO(make_sales(rows, rng))).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+DATASETS = {
+    'sales': ('sales.csv', make_sales),
+    'wide': ('wide.csv', make_wide),
+    'events': ('events.jsonl', make_events),
+    'excel': ('sales.xlsx', make_excel),
+}
+
+
+def parse_mix(value):
+    """``name:weight,...`` to ``{name: weight}`` (a bare name has weight 1)"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition(':')
+        if name not in DATASETS:
+            raise argparse.ArgumentTypeError(f"Unknown dataset '{name}'. Use: {', '.join(DATASETS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def write_datasets(directory, mix, rows, seed):
+    """Generate each dataset in the mix once; returns ``{name: (filename, path)}``"""
+    rng = np.random.default_rng(seed)
+    files = {}
+    for name in mix:
+        filename, make = DATASETS[name]
+        path = os.path.join(directory, filename)
+        with open(path, 'wb') as f:
+            f.write(make(rows, rng))
+        files[name] = (filename, path)
+    return files
+
+
+def schedule(mix, clients, requests, seed):
+    """Dataset names each client sends, drawn by weight; ``requests`` is split across clients"""
+    names = list(mix)
+    weights = np.array([mix[name] for name in names])
+    plans = []
+    for client in range(clients):
+        count = requests // clients + (client < requests % clients)
+        rng = np.random.default_rng(seed + client)
+        plans.append([names[i] for i in rng.choice(len(names), count, p=weights / weights.sum())])
+    return plans
+
+
+# ---------------------------------------------------------------------------
+# Clients
+# ---------------------------------------------------------------------------
+
+def _run_clients(plans, send):
+    """Run one thread per plan; each record is ``(dataset, status, seconds)``"""
+    records = []
+    lock = threading.Lock()
+
+    def client(plan):
+        for name in plan:
+            start = time.perf_counter()
+            try:
+                status = send(name)
+            except Exception as e:
+                status = f'exception: {type(e).__name__}'
+            elapsed = time.perf_counter() - start
+            with lock:
+                records.append((name, status, elapsed))
+
+    threads = [threading.Thread(target=client, args=(plan,)) for plan in plans]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def _inprocess_worker(queue, barrier, plans, files, fields, warmup, verbose):
+    """One server process: warm up, wait for the others, then serve ``plans`` through the test client"""
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+        warnings.filterwarnings('ignore')
+    sys.path.insert(0, ROOT)
+    from app import app
+
+    payloads = {}
+    for name, (filename, path) in files.items():
+        with open(path, 'rb') as f:
+            payloads[name] = (filename, f.read())
+
+    local = threading.local()
+
+    def send(name):
+        # One test client per client thread
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        filename, content = payloads[name]
+        response = local.client.post('/analyze', data=dict(fields, file=(BytesIO(content), filename)),
+                                     content_type='multipart/form-data')
+        response.close()
+        return response.status_code
+
+    for name in payloads:
+        for _ in range(warmup):
+            send(name)
+    ready_rss = _peak_rss_mb()
+
+    barrier.wait()
+    records = _run_clients(plans, send)
+    worker = {'pid': os.getpid(), 'requests': len(records), 'ready_rss_mb': ready_rss, 'peak_rss_mb': _peak_rss_mb(),
+              'server_metrics': app.test_client().get('/metrics').get_json()}
+    queue.put((records, worker))
+
+
+def run_inprocess(plans, files, fields, workers, warmup, verbose):
+    """Spread the client plans over ``workers`` spawned processes; returns (wall seconds, records, workers)"""
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    barrier = ctx.Barrier(workers + 1)
+    procs = [ctx.Process(target=_inprocess_worker, args=(queue, barrier, plans[w::workers], files, fields, warmup, verbose))
+             for w in range(workers)]
+    for proc in procs:
+        proc.start()
+    barrier.wait()
+    start = time.perf_counter()
+    reports = [queue.get() for _ in procs]
+    wall = time.perf_counter() - start
+    for proc in procs:
+        proc.join()
+    return wall, [record for records, _ in reports for record in records], [worker for _, worker in reports]
+
+
+def _multipart(fields, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for key, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _gunicorn_workers(master):
+    """Worker pids of a gunicorn master (Linux /proc only)"""
+    try:
+        with open(f'/proc/{master}/task/{master}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def run_gunicorn(plans, files, fields, workers, threads, warmup, verbose, timeout=600):
+    """Drive a local gunicorn over HTTP; returns (wall seconds, records, workers). Which worker
+    served a request is not visible to the client, so workers report only their peak RSS."""
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}'
+    output = None if verbose else subprocess.DEVNULL
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                               '--bind', f'127.0.0.1:{port}', '--timeout', str(timeout), 'app:app'],
+                              cwd=ROOT, stdout=output, stderr=output)
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                urllib.request.urlopen(url, timeout=30).close()
+                break
+            except OSError:  # Refused, reset or timed out while the workers import the app
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.5)
+
+        bodies = {}
+        for name, (filename, path) in files.items():
+            with open(path, 'rb') as f:
+                bodies[name] = _multipart(fields, filename, f.read())
+
+        def send(name):
+            body, content_type = bodies[name]
+            request = urllib.request.Request(f'{url}/analyze', data=body, headers={'Content-Type': content_type})
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        # Requests cannot be routed to a worker; send enough for each to see every dataset
+        for name in bodies:
+            for _ in range(warmup * workers):
+                send(name)
+
+        start = time.perf_counter()
+        records = _run_clients(plans, send)
+        wall = time.perf_counter() - start
+        workers = [{'pid': pid, 'requests': None, 'ready_rss_mb': None, 'peak_rss_mb': _peak_rss_mb(pid)}
+                   for pid in _gunicorn_workers(server.pid)]
+        return wall, records, workers
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _latency(seconds):
+    if not seconds:
+        return None
+    ms = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50': round(p50, 1), 'p95': round(p95, 1), 'p99': round(p99, 1),
+            'mean': round(ms.mean(), 1), 'max': round(ms.max(), 1)}
+
+
+def summarize(wall, records, workers, config):
+    errors = [record for record in records if record[1] != 200]
+    status_counts = {}
+    for _, status, _ in records:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    datasets = {}
+    for name in sorted({record[0] for record in records}):
+        mine = [record for record in records if record[0] == name]
+        datasets[name] = {'requests': len(mine), 'errors': sum(record[1] != 200 for record in mine),
+                          'latency_ms': _latency([record[2] for record in mine])}
+    peaks = [worker['peak_rss_mb'] for worker in workers if worker['peak_rss_mb'] is not None]
+    return {
+        'config': config,
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'pandas': pd.__version__, 'numpy': np.__version__},
+        'wall_seconds': round(wall, 3),
+        'requests': len(records),
+        'errors': len(errors),
+        'error_rate': round(len(errors) / len(records), 4) if records else None,
+        'throughput_rps': round(len(records) / wall, 3) if wall else None,
+        'latency_ms': _latency([record[2] for record in records]),
+        'status_counts': status_counts,
+        'datasets': datasets,
+        'peak_rss_mb': max(peaks) if peaks else None,
+        'workers': workers,
+    }
+
+
+# (metric path, True when higher is better)
+COMPARED = [('throughput_rps', True), ('latency_ms.p50', False), ('latency_ms.p95', False),
+            ('latency_ms.p99', False), ('peak_rss_mb', False)]
+
+
+def _get(summary, path):
+    for key in path.split('.'):
+        summary = (summary or {}).get(key)
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    """Metrics that regressed by more than ``tolerance`` (relative) against ``baseline``; the
+    error rate regresses when it rises by more than one percentage point"""
+    regressions = []
+    for path, higher_is_better in COMPARED:
+        current, before = _get(summary, path), _get(baseline, path)
+        if current is None or not before:
+            continue
+        change = (current - before) / before
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({'metric': path, 'baseline': before, 'current': current, 'change': round(change, 3)})
+    current, before = summary.get('error_rate'), baseline.get('error_rate')
+    if current is not None and before is not None and current - before > 0.01:
+        regressions.append({'metric': 'error_rate', 'baseline': before, 'current': current, 'change': round(current - before, 4)})
+    return regressions
+
+
+def print_summary(summary):
+    config = summary['config']
+    print(f"\n/analyze load test: {config['server']}, {config['workers']} worker(s), {config['clients']} clients, "
+          f"{summary['requests']} requests in {summary['wall_seconds']:.1f} s")
+    print("-" * 72)
+    latency = summary['latency_ms'] or {}
+    print(f"Throughput {summary['throughput_rps']} req/s   error rate {summary['error_rate']}   statuses {summary['status_counts']}")
+    print(f"Latency p50 {latency.get('p50')} ms   p95 {latency.get('p95')} ms   p99 {latency.get('p99')} ms   max {latency.get('max')} ms")
+    for name, stats in summary['datasets'].items():
+        latency = stats['latency_ms'] or {}
+        print(f"  {name:<10} {stats['requests']:>5} requests   {stats['errors']} errors   p50 {latency.get('p50')} ms   p95 {latency.get('p95')} ms")
+    for worker in summary['workers']:
+        line = f"  worker {worker['pid']:<8} peak RSS {worker['peak_rss_mb']} MB"
+        if worker['requests'] is not None:
+            line += f"   {worker['requests']} requests   (after warm-up {worker['ready_rss_mb']} MB)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent /analyze load test')
+    parser.add_argument('--server', choices=['inprocess', 'gunicorn'], default='inprocess')
+    parser.add_argument('--workers', type=int, default=1, help='Server processes')
+    parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker')
+    parser.add_argument('--clients', type=int, default=4, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=32, help='Total requests (split across clients)')
+    parser.add_argument('--mix', type=parse_mix, default='sales:3,wide:1,events:1,excel:1', help='Weighted datasets, e.g. sales:3,wide:1')
+    parser.add_argument('--rows', type=int, default=5000, help='Rows per synthetic dataset')
+    parser.add_argument('--field', action='append', default=[], metavar='KEY=VALUE', help='Extra form field sent with every upload')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per dataset per worker')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Earlier --json results to check for regressions (exit status 1)')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression against --baseline')
+    parser.add_argument('--verbose', action='store_true', help='Show server output')
+    args = parser.parse_args()
+
+    fields = dict(field.split('=', 1) for field in args.field)
+    plans = schedule(args.mix, args.clients, args.requests, args.seed)
+    config = {'server': args.server, 'workers': args.workers, 'threads': args.threads if args.server == 'gunicorn' else None,
+              'clients': args.clients, 'requests': args.requests, 'mix': args.mix, 'rows': args.rows,
+              'fields': fields, 'warmup': args.warmup, 'seed': args.seed}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = write_datasets(tmp, args.mix, args.rows, args.seed)
+        if args.server == 'gunicorn':
+            wall, records, workers = run_gunicorn(plans, files, fields, args.workers, args.threads, args.warmup, args.verbose)
+        else:
+            wall, records, workers = run_inprocess(plans, files, fields, args.workers, args.warmup, args.verbose)
+
+    summary = summarize(wall, records, workers, config)
+    print_summary(summary)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            summary['regressions'] = compare(summary, json.load(f), args.tolerance)
+        for regression in summary['regressions']:
+            print(f"REGRESSION {regression['metric']}: {regression['baseline']} -> {regression['current']} ({regression['change']:+})")
+        status = 1 if summary['regressions'] else 0
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
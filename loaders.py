@@ -0,0 +1,255 @@
+"""
+Streaming file readers for AI Data Analyst uploads
+"""
+
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+
+class _ColumnBuilder:
+    """Accumulates cell values for one column and converts them to typed arrays chunk by chunk"""
+
+    def __init__(self, name, chunk_size):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.values = []
+        self.chunks = []
+
+    def append(self, value):
+        self.values.append(value)
+        if len(self.values) >= self.chunk_size:
+            self.flush()
+
+    def pad(self, count):
+        """Fill rows read before this column first appeared"""
+        for _ in range(count):
+            self.append(None)
+
+    def flush(self):
+        if not self.values:
+            return
+        if all(v is None for v in self.values):
+            chunk = pd.Series(np.full(len(self.values), np.nan))
+        else:
+            # Let pandas infer int/float/bool/datetime/object in C for the whole chunk
+            chunk = pd.Series(self.values)
+        self.chunks.append(chunk)
+        self.values = []
+
+    def build(self):
+        self.flush()
+        if not self.chunks:
+            return pd.Series([], dtype=object)
+        if len(self.chunks) == 1:
+            return self.chunks[0]
+        return pd.concat(self.chunks, ignore_index=True)
+
+
+def _dedupe_names(names):
+    """Repeated column names renamed the way pandas' readers do (``Sales``, ``Sales.1``, ...),
+    skipping suffixes that another header cell already uses"""
+    taken = set(names)
+    seen, counts, deduped = set(), {}, []
+    for name in names:
+        if name in seen:
+            count = counts.get(name, 1)
+            while f'{name}.{count}' in taken:
+                count += 1
+            counts[name] = count + 1
+            name = f'{name}.{count}'
+            taken.add(name)
+        seen.add(name)
+        deduped.append(name)
+    return deduped
+
+
+def _is_blank_row(row):
+    return all(v is None or (isinstance(v, str) and not v.strip()) for v in row)
+
+
+def _worksheet_to_frame(ws, chunk_size):
+    """Stream a read-only worksheet row by row into a DataFrame"""
+    rows = ws.iter_rows(values_only=True)
+
+    header = None
+    for row in rows:
+        if not _is_blank_row(row):
+            header = list(row)
+            break
+    if header is None:
+        return pd.DataFrame()
+
+    # Trim trailing empty header cells (read-only sheets often report formatted but empty cells)
+    while header and header[-1] is None:
+        header.pop()
+
+    names = [str(h) if h is not None else f'Unnamed: {i}' for i, h in enumerate(header)]
+    builders = [_ColumnBuilder(name, chunk_size) for name in names]
+    n_rows = 0
+    pending_blank = 0
+
+    for row in rows:
+        if _is_blank_row(row):
+            # Only keep blank rows that are followed by data (pandas trims trailing blanks)
+            pending_blank += 1
+            continue
+
+        last = len(row)
+        while last > len(builders) and row[last - 1] is None:
+            last -= 1
+        if last > len(builders):
+            for i in range(len(builders), last):
+                builder = _ColumnBuilder(f'Unnamed: {i}', chunk_size)
+                builder.pad(n_rows)
+                builders.append(builder)
+
+        for _ in range(pending_blank):
+            for builder in builders:
+                builder.append(None)
+        n_rows += pending_blank
+        pending_blank = 0
+
+        for i, builder in enumerate(builders):
+            builder.append(row[i] if i < len(row) else None)
+        n_rows += 1
+
+    columns = [builder.build() for builder in builders]
+    df = pd.concat(columns, axis=1, ignore_index=True) if columns else pd.DataFrame()
+    df.columns = _dedupe_names([builder.name for builder in builders])
+    return df
+
+
+def _open_workbook(source):
+    from openpyxl import load_workbook
+    return load_workbook(source, read_only=True, data_only=True)
+
+
+def list_excel_sheets(stream):
+    """Return the sheet names of an .xlsx workbook without loading any cells"""
+    wb = _open_workbook(stream)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def read_excel_stream(stream, sheet_name=None, chunk_size=None):
+    """Read one sheet of an .xlsx workbook with openpyxl's read-only row streaming.
+
+    Cells are never held in openpyxl's full object model: each row is appended to
+    per-column builders that convert to typed arrays every ``chunk_size`` rows.
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+    wb = _open_workbook(stream)
+    try:
+        if sheet_name is None:
+            ws = wb.worksheets[0]
+        elif sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+        else:
+            raise ValueError(f"Sheet '{sheet_name}' not found. Available sheets: {', '.join(wb.sheetnames)}")
+        return _worksheet_to_frame(ws, chunk_size)
+    finally:
+        wb.close()
+
+
+def _read_sheet_from_bytes(data, sheet_name, chunk_size):
+    return read_excel_stream(io.BytesIO(data), sheet_name, chunk_size)
+
+
+def read_excel_sheets(stream, sheet_names=None, max_workers=None, chunk_size=None):
+    """Read several sheets as separate datasets, one worker process per sheet.
+
+    ``sheet_names`` of None or '*' loads every sheet. Returns a dict keyed by sheet name
+    in workbook order.
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+    data = stream.read()
+    available = list_excel_sheets(io.BytesIO(data))
+
+    if sheet_names is None or sheet_names == '*':
+        sheet_names = available
+    missing = [name for name in sheet_names if name not in available]
+    if missing:
+        raise ValueError(f"Sheet(s) not found: {', '.join(missing)}. Available sheets: {', '.join(available)}")
+
+    if max_workers is None:
+        max_workers = min(len(sheet_names), Config.EXCEL_SHEET_WORKERS or os.cpu_count() or 1)
+
+    if max_workers <= 1 or len(sheet_names) == 1:
+        return {name: _read_sheet_from_bytes(data, name, chunk_size) for name in sheet_names}
+
+    # openpyxl is pure Python, so sheets are parsed in separate processes rather than threads.
+    # Workers open one temporary copy of the workbook instead of each task pickling its bytes.
+    fd, path = tempfile.mkstemp(prefix='analysis_sheets_', suffix='.xlsx')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        del data
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {name: pool.submit(read_excel_stream, path, name, chunk_size) for name in sheet_names}
+            return {name: future.result() for name, future in futures.items()}
+    finally:
+        os.remove(path)
+
+
+def flatten_nested(df, sep='.'):
+    """Expand columns holding JSON objects into dotted columns (``user.address.city``).
+
+    Each nested column is expanded once for the whole frame; columns produced by the
+    expansion are flattened again until no object values remain. Scalars mixed in with the
+    objects stay in the original column, after its expansion (as ``pd.json_normalize`` does).
+    """
+    pending = list(df.columns)
+    while pending:
+        col = pending.pop(0)
+        series = df[col]
+        if series.dtype != object:
+            continue
+        is_dict = series.map(type).eq(dict)
+        if not is_dict.any():
+            continue
+
+        # Non-object values (null, scalars) become empty records
+        records = series.where(is_dict, None).tolist()
+        records = [r if r is not None else {} for r in records]
+        expanded = pd.DataFrame.from_records(records, index=df.index)
+        expanded.columns = [f"{col}{sep}{sub}" for sub in expanded.columns]
+        scalars = series.where(~is_dict)
+        if scalars.notna().any():
+            expanded[col] = scalars
+        if expanded.empty:
+            df = df.drop(columns=[col])
+            continue
+
+        position = df.columns.get_loc(col)
+        df = pd.concat([df.iloc[:, :position], expanded, df.iloc[:, position + 1:]], axis=1)
+        pending = list(expanded.columns) + pending
+    return df
+
+
+def iter_json_lines(stream, chunk_size=None):
+    """Yield flattened DataFrames of ``chunk_size`` records from an NDJSON/JSON Lines stream.
+
+    Only one chunk of records is materialized at a time.
+    """
+    chunk_size = chunk_size or Config.CHUNK_SIZE
+    reader = pd.read_json(stream, lines=True, chunksize=chunk_size, dtype=False)
+    with reader:
+        for chunk in reader:
+            yield flatten_nested(chunk)
+
+
+def read_json_lines(stream, chunk_size=None):
+    """Read a whole NDJSON/JSON Lines stream into one flattened DataFrame"""
+    chunks = list(iter_json_lines(stream, chunk_size))
+    if not chunks:
+        return pd.DataFrame()
+    return pd.concat(chunks, ignore_index=True)
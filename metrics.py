@@ -0,0 +1,49 @@
+"""
+In-process metrics registry for AI Data Analyst, exposed as JSON at /metrics
+"""
+
+import threading
+import time
+
+
+class Metrics:
+    """Thread-safe counters, gauges and timing summaries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.summaries = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        """Record one observation (count, sum, min, max) for a summary"""
+        with self._lock:
+            s = self.summaries.get(name)
+            if s is None:
+                self.summaries[name] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+            else:
+                s['count'] += 1
+                s['sum'] += value
+                s['min'] = min(s['min'], value)
+                s['max'] = max(s['max'], value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime_seconds': round(time.time() - self._started, 1),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'summaries': {k: dict(v, mean=v['sum'] / v['count']) for k, v in self.summaries.items()}
+            }
+
+
+metrics = Metrics()
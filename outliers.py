@@ -0,0 +1,117 @@
+"""
+Vectorized outlier detection (IQR, z-score, MAD) over all numeric columns at once
+"""
+
+import numpy as np
+
+from config import Config
+
+
+METHODS = ('IQR', 'Z-score', 'MAD')
+
+# Scales the MAD to the standard deviation of a normal distribution (modified z-score)
+MAD_SCALE = 0.6745
+
+_ALIASES = {'iqr': 'IQR', 'z-score': 'Z-score', 'zscore': 'Z-score', 'z': 'Z-score', 'mad': 'MAD'}
+
+
+def normalize_method(method):
+    name = _ALIASES.get(str(method).strip().lower())
+    if name is None:
+        raise ValueError(f"Unknown outlier method '{method}'. Use one of: {', '.join(METHODS)}")
+    return name
+
+
+class OutlierResult:
+    """Fences, counts and a packed per-row bitmap of outliers for a set of numeric columns.
+
+    ``bitmap`` holds one bit per (row, column) for the configured method, packed eight columns
+    to a byte: an n x ceil(k / 8) uint8 array, small enough to keep for drill-down queries.
+    """
+
+    def __init__(self, columns, method, fences, counts, bitmap, rows):
+        self.columns = list(columns)
+        self.method = method
+        self.fences = fences
+        self.counts = counts
+        self.bitmap = bitmap
+        self.rows = rows
+
+    def mask(self, col=None):
+        """Boolean row mask: outliers in ``col``, or in any column when ``col`` is None"""
+        if not self.columns:
+            return np.zeros(self.rows, dtype=bool)
+        if col is None:
+            return self.bitmap.any(axis=1)
+        k = self.columns.index(col)
+        return (self.bitmap[:, k // 8] >> (7 - k % 8) & 1).astype(bool)
+
+    def row_positions(self, col=None, limit=None):
+        positions = np.flatnonzero(self.mask(col))
+        return positions if limit is None else positions[:limit]
+
+    def column_counts(self, method=None):
+        """Outlier count per column for ``method`` (default: the configured method)"""
+        return self.counts[method or self.method]
+
+    def to_dict(self, examples=5):
+        return {
+            'method': self.method,
+            'rows_with_outliers': int(self.mask().sum()),
+            'counts_by_method': {m: {c: int(n) for c, n in counts.items() if n} for m, counts in self.counts.items()},
+            'fences': {col: {'lower': low, 'upper': high} for col, (low, high) in self.fences[self.method].items()},
+            'example_rows': {col: [int(r) for r in self.row_positions(col, examples)] for col in self.columns if self.counts[self.method][col]}
+        }
+
+
+def detect_outliers(df, columns, method=None, iqr_multiplier=None, z_threshold=None, mad_threshold=None):
+    """Compute IQR, z-score and MAD fences for ``columns`` in one pass over the 2D value array.
+
+    Counts are reported for every method; the per-row bitmap is kept for ``method``
+    (default ``Config.OUTLIER_METHOD``). Missing values are never outliers.
+    """
+    method = normalize_method(method or Config.OUTLIER_METHOD)
+    iqr_multiplier = Config.IQR_MULTIPLIER if iqr_multiplier is None else iqr_multiplier
+    z_threshold = Config.Z_SCORE_THRESHOLD if z_threshold is None else z_threshold
+    mad_threshold = Config.MAD_THRESHOLD if mad_threshold is None else mad_threshold
+
+    columns = list(columns)
+    values = df[columns].to_numpy(dtype=float, na_value=np.nan) if columns else np.empty((len(df), 0))
+    n, k = values.shape
+    if n == 0 or k == 0:
+        empty = {m: {col: 0 for col in columns} for m in METHODS}
+        return OutlierResult(columns, method, {m: {} for m in METHODS}, empty, np.zeros((n, (k + 7) // 8), dtype=np.uint8), n)
+
+    # Statistics are computed for columns with at least two values; the rest keep NaN fences
+    q1, median, q3, mean, std, mad = (np.full(k, np.nan) for _ in range(6))
+    usable = (~np.isnan(values)).sum(axis=0) >= 2
+    if usable.any():
+        present = values[:, usable]
+        q1[usable], median[usable], q3[usable] = np.nanquantile(present, [0.25, 0.5, 0.75], axis=0)
+        mean[usable] = np.nanmean(present, axis=0)
+        std[usable] = np.nanstd(present, axis=0, ddof=1)
+        mad[usable] = np.nanmedian(np.abs(present - median[usable]), axis=0)
+
+    iqr = q3 - q1
+    # A zero MAD (more than half the values identical) gives no usable fence
+    mad_width = np.where(mad > 0, mad_threshold * mad / MAD_SCALE, np.inf)
+    bounds = {
+        'IQR': (q1 - iqr_multiplier * iqr, q3 + iqr_multiplier * iqr),
+        'Z-score': (mean - z_threshold * std, mean + z_threshold * std),
+        'MAD': (median - mad_width, median + mad_width)
+    }
+
+    fences, counts, bitmap = {}, {}, None
+    for name, (low, high) in bounds.items():
+        # NaN compares False on both sides, so missing values and undefined fences never flag
+        flagged = (values < low) | (values > high)
+        counts[name] = dict(zip(columns, flagged.sum(axis=0).tolist()))
+        fences[name] = {col: (_finite(lo), _finite(hi)) for col, lo, hi in zip(columns, low, high)}
+        if name == method:
+            bitmap = np.packbits(flagged, axis=1)
+    return OutlierResult(columns, method, fences, counts, bitmap, n)
+
+
+def _finite(value):
+    return float(value) if np.isfinite(value) else None
+
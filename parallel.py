@@ -0,0 +1,177 @@
+"""
+Process-parallel map-reduce over row shards: mergeable partial aggregates per shard, reduced in row order
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import Config
+from correlation import CorrelationStats
+from profiling import ChunkedProfiler, profile_chunks
+from rollups import TimeRollup
+from shared_frame import SharedFrame, read_shared
+
+
+def worker_count(workers=None):
+    """Processes to use: ``Config.PARALLEL_WORKERS`` by default, 0 meaning one per CPU"""
+    workers = Config.PARALLEL_WORKERS if workers is None else workers
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def is_parallel(rows, workers=None, min_rows=None):
+    """Whether a frame of ``rows`` rows is worth splitting across processes"""
+    min_rows = Config.PARALLEL_MIN_ROWS if min_rows is None else min_rows
+    return worker_count(workers) > 1 and rows >= max(min_rows, 2)
+
+
+def shard_bounds(rows, shards):
+    """(start, stop) positions of ``shards`` contiguous, near-equal row ranges"""
+    edges = np.linspace(0, rows, max(1, min(shards, rows)) + 1).astype(np.int64)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:])]
+
+
+def _reduce(partials):
+    result = partials[0]
+    for partial in partials[1:]:
+        result.merge(partial)
+    return result
+
+
+def map_reduce(df, mapper, args=(), workers=None, min_rows=None):
+    """Run ``mapper(shard, index, *args)`` on one contiguous row shard per worker and merge the
+    partial results in row order. ``mapper`` must be a module-level function returning an object
+    with ``merge``; small frames (or a single worker) run in-process as one shard.
+    """
+    if not is_parallel(len(df), workers, min_rows):
+        return mapper(df, 0, *args)
+    bounds = shard_bounds(len(df), worker_count(workers))
+    # Workers attach the published frame by name instead of unpickling a copy of their shard
+    with SharedFrame.publish(df) as shared, ProcessPoolExecutor(max_workers=len(bounds)) as pool:
+        futures = [pool.submit(_shared_shard, mapper, shared.handle, start, stop, index, args)
+                   for index, (start, stop) in enumerate(bounds)]
+        return _reduce([future.result() for future in futures])
+
+
+def _shared_shard(mapper, handle, start, stop, index, args):
+    return mapper(read_shared(handle, start, stop), index, *args)
+
+
+def map_reduce_chunks(chunks, mapper, args=(), workers=None):
+    """``map_reduce`` over an iterable of chunks (e.g. a file reader), keeping at most two
+    chunks per worker in flight so memory stays bounded however long the stream is"""
+    workers = worker_count(workers)
+    if workers <= 1:
+        partials = (mapper(chunk, index, *args) for index, chunk in enumerate(chunks))
+        result = next(partials, None)
+        for partial in partials:
+            result.merge(partial)
+        return result
+
+    result = None
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for index, chunk in enumerate(chunks):
+            pending.append(pool.submit(mapper, chunk, index, *args))
+            if len(pending) >= 2 * workers:
+                partial = pending.popleft().result()
+                result = partial if result is None else result.merge(partial)
+        while pending:
+            partial = pending.popleft().result()
+            result = partial if result is None else result.merge(partial)
+    return result
+
+
+class ShardAggregates:
+    """Mergeable aggregates of a row range: column profiles (moments, ranges, value counts),
+    Pearson sufficient statistics for ``measures`` and a TimeRollup per date column.
+
+    Everything here is a sum, count, min, max or bounded counter, so merging the aggregates of
+    consecutive shards gives the same totals as one pass over the whole frame.
+    """
+
+    def __init__(self, profiler, correlation_stats=None, time_rollups=None):
+        self.profiler = profiler
+        self.correlation_stats = correlation_stats
+        self.time_rollups = time_rollups or {}
+
+    @classmethod
+    def from_frame(cls, df, columns, measures=(), date_cols=(), shift=None, seed=42):
+        # The frame itself stays in memory, so shards keep no row sample
+        profiler = ChunkedProfiler(sample_rows=0, seed=seed).update(df[list(columns)])
+        stats = CorrelationStats(measures, shift).update(df) if len(measures) > 1 else None
+        rollups = {col: TimeRollup.from_frame(df, col, measures) for col in date_cols}
+        return cls(profiler, stats, rollups)
+
+    def merge(self, other):
+        """Add the aggregates of the rows that follow this shard"""
+        self.profiler.merge(other.profiler)
+        if self.correlation_stats is not None:
+            self.correlation_stats.merge(other.correlation_stats)
+        for col, rollup in other.time_rollups.items():
+            self.time_rollups[col].merge(rollup)
+        return self
+
+    def describe(self, df, columns):
+        """Equivalent of ``df[columns].describe().to_dict()``. Counts, moments and ranges come
+        from the shards; quartiles are order statistics, which do not merge, so they are taken
+        exactly from ``df``."""
+        columns = list(columns)
+        quartiles = np.full((3, len(columns)), np.nan)
+        if columns and len(df):
+            values = df[columns].to_numpy(dtype=float, na_value=np.nan)
+            present = ~np.all(np.isnan(values), axis=0)
+            if present.any():
+                quartiles[:, present] = np.nanquantile(values[:, present], [0.25, 0.5, 0.75], axis=0)
+        summary = {}
+        for idx, col in enumerate(columns):
+            profile = self.profiler.columns[col]
+            empty = profile.count == 0
+            summary[col] = {
+                'count': float(profile.count),
+                'mean': None if empty else float(profile.mean),
+                'std': None if profile.count < 2 else profile.std(),
+                'min': None if empty else float(profile.min),
+                '25%': None if empty else float(quartiles[0, idx]),
+                '50%': None if empty else float(quartiles[1, idx]),
+                '75%': None if empty else float(quartiles[2, idx]),
+                'max': None if empty else float(profile.max)
+            }
+        return summary
+
+    def value_counts(self, col, n=20):
+        """Top ``n`` values of ``col`` with exact counts, or None once the counter was truncated"""
+        profile = self.profiler.columns.get(col)
+        if profile is None or profile.values.truncated:
+            return None
+        return dict(profile.values.most_common(n))
+
+
+def _aggregate_shard(shard, index, columns, measures, date_cols, shift):
+    return ShardAggregates.from_frame(shard, columns, measures, date_cols, shift, seed=42 + index)
+
+
+def aggregate_frame(df, columns, measures=(), date_cols=(), workers=None, min_rows=None):
+    """Profile ``columns``, correlate ``measures`` and roll them up by ``date_cols`` in one
+    map-reduce pass over row shards"""
+    measures = [col for col in measures if col in df.columns]
+    # Every shard shifts its sums by the same full-frame means, so the merge needs no rebasing
+    shift = np.nan_to_num(df[measures].mean().to_numpy(dtype=float)) if measures else np.empty(0)
+    return map_reduce(df, _aggregate_shard, (list(columns), measures, list(date_cols), shift), workers, min_rows)
+
+
+def _profile_chunk(chunk, index, sample_rows):
+    # Separate seeds keep the bottom-k sample keys of different chunks independent
+    return ChunkedProfiler(sample_rows=sample_rows, seed=42 + index).update(chunk)
+
+
+def profile_stream(chunks, sample_rows=None, workers=None):
+    """Process-parallel ``profiling.profile_chunks``: each chunk is profiled in a worker and the
+    profilers are merged in file order"""
+    sample_rows = Config.CHUNKED_SAMPLE_ROWS if sample_rows is None else sample_rows
+    if worker_count(workers) <= 1:
+        return profile_chunks(chunks, sample_rows)
+    profiler = map_reduce_chunks(chunks, _profile_chunk, (sample_rows,), workers)
+    return profiler if profiler is not None else ChunkedProfiler(sample_rows=sample_rows)
@@ -0,0 +1,393 @@
+"""
+Chunked, mergeable column profiling for datasets that should not be fully materialized
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+
+class QuantileSketch:
+    """Mergeable KLL-style quantile sketch with bounded memory.
+
+    Level ``h`` holds values of weight ``2**h``. When a level grows past ``k`` values it is
+    sorted and every other value (random offset) is promoted to the next level.
+    """
+
+    def __init__(self, k=1024, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level < len(self.levels):
+                self.levels[level] = np.concatenate([self.levels[level], values])
+            else:
+                self.levels.append(values.copy())
+        self.count += other.count
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if len(values) > self.k:
+                values = np.sort(values)
+                keep = values[:0]
+                if len(values) % 2:
+                    # Odd one out stays at this level
+                    keep, values = values[-1:], values[:-1]
+                promoted = values[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    @property
+    def is_exact(self):
+        return all(len(values) == 0 for values in self.levels[1:])
+
+    def quantiles(self, qs):
+        """Return quantiles for each q in qs (linear interpolation, like pandas)"""
+        if self.count == 0:
+            return [np.nan for _ in qs]
+        if self.is_exact:
+            return [float(v) for v in np.quantile(self.levels[0], qs)]
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2.0 ** h) for h, v in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, weights = values[order], weights[order]
+        # Position of each retained value in the (weighted) sorted sequence
+        positions = (np.cumsum(weights) - weights / 2) / weights.sum()
+        return [float(v) for v in np.interp(qs, positions, values)]
+
+
+class TopK:
+    """Bounded value counter; exact until more than ``capacity`` distinct values are seen"""
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.truncated = False
+
+    def update(self, value_counts):
+        counts = self.counts
+        for value, count in value_counts.items():
+            counts[value] = counts.get(value, 0) + int(count)
+        self._prune()
+
+    def merge(self, other):
+        self.truncated = self.truncated or other.truncated
+        self.update(other.counts)
+
+    def _prune(self):
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:self.capacity]
+            self.counts = dict(keep)
+            self.truncated = True
+
+    def distinct(self):
+        """Distinct count, or None once the counter has been truncated"""
+        return None if self.truncated else len(self.counts)
+
+    def most_common(self, n):
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+
+class ColumnProfile:
+    """Mergeable statistics for a single column"""
+
+    def __init__(self, name, kind, dtype, nulls=0):
+        self.name = name
+        self.kind = kind  # numeric, datetime, boolean or object
+        self.dtype = dtype
+        self.count = 0
+        self.nulls = nulls
+        # Numeric moments (Chan et al. parallel update)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch() if kind == 'numeric' else None
+        # Numeric columns only track distinct values while cardinality is low
+        self.values = TopK(capacity=100 if kind == 'numeric' else Config.PROFILE_TOPK_CAPACITY)
+
+    @staticmethod
+    def kind_of(series):
+        if pd.api.types.is_bool_dtype(series):
+            return 'boolean'
+        if pd.api.types.is_numeric_dtype(series):
+            return 'numeric'
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return 'datetime'
+        return 'object'
+
+    def _demote(self):
+        """Column turned out to be mixed-type; keep only counts"""
+        if self.kind == 'object':
+            return
+        self.kind = 'object'
+        self.dtype = 'object'
+        self.sketch = None
+        self.min = self.max = None
+        if self.values.truncated:
+            self.values = TopK(Config.PROFILE_TOPK_CAPACITY)
+            self.values.truncated = True
+
+    def update(self, series):
+        kind = self.kind_of(series)
+        if kind != self.kind and series.notna().any():
+            if self.count == 0:
+                self.__init__(self.name, kind, str(series.dtype), self.nulls)
+            else:
+                self._demote()
+        elif self.kind == 'numeric' and str(series.dtype) != self.dtype and series.notna().any():
+            self.dtype = 'float64'
+
+        nulls = int(series.isna().sum())
+        self.nulls += nulls
+        valid = series.dropna()
+        n = len(valid)
+        if n == 0:
+            return
+
+        if self.kind == 'numeric':
+            values = valid.to_numpy(dtype=float)
+            self._update_moments(n, float(values.mean()), float(((values - values.mean()) ** 2).sum()))
+            self._update_range(float(values.min()), float(values.max()))
+            self.sketch.update(values)
+            if not self.values.truncated:
+                self.values.update(valid.value_counts(sort=False))
+        elif self.kind == 'datetime':
+            self.count += n
+            self._update_range(valid.min(), valid.max())
+            self.values.update(valid.value_counts(sort=False))
+        else:
+            self.count += n
+            self.values.update(valid.value_counts(sort=False))
+
+    def _update_moments(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    def _update_range(self, lo, hi):
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    def merge(self, other):
+        if other.kind != self.kind and other.count:
+            if self.count == 0:
+                nulls = self.nulls
+                self.__dict__.update(other.__dict__)
+                self.nulls += nulls
+                return
+            self._demote()
+        self.nulls += other.nulls
+        if self.kind == 'numeric' and other.kind == 'numeric':
+            if other.count:
+                self._update_moments(other.count, other.mean, other.m2)
+                self._update_range(other.min, other.max)
+                self.sketch.merge(other.sketch)
+            if other.dtype != self.dtype:
+                self.dtype = 'float64'
+        else:
+            self.count += other.count
+            if self.kind == 'datetime' and other.min is not None:
+                self._update_range(other.min, other.max)
+        if not (self.kind == 'numeric' and self.values.truncated):
+            self.values.merge(other.values)
+
+    def std(self):
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else np.nan
+
+    def distinct(self):
+        return self.values.distinct()
+
+
+class ChunkedProfiler:
+    """Builds dataset statistics one chunk at a time.
+
+    Only the statistics, the first/last rows and a bounded uniform row sample are kept,
+    so arbitrarily large files can be profiled in ``CHUNK_SIZE`` pieces. Profilers built
+    over different row ranges can be combined with ``merge``.
+    """
+
+    def __init__(self, sample_rows=None, seed=42):
+        self.sample_rows = sample_rows if sample_rows is not None else Config.CHUNKED_SAMPLE_ROWS
+        self.rows = 0
+        self.columns = {}
+        self.head = None
+        self.tail = None
+        self.sample = None
+        self.sample_keys = np.empty(0)
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, df):
+        n = len(df)
+        for col in df.columns:
+            if col not in self.columns:
+                # Column first seen in this chunk: everything before it was missing
+                self.columns[col] = ColumnProfile(col, ColumnProfile.kind_of(df[col]), str(df[col].dtype), nulls=self.rows)
+            self.columns[col].update(df[col])
+        for col, profile in self.columns.items():
+            if col not in df.columns:
+                profile.nulls += n
+
+        if self.head is None or len(self.head) < 10:
+            self.head = df.head(10) if self.head is None else pd.concat([self.head, df.head(10 - len(self.head))])
+        self.tail = df.tail(10) if self.tail is None or n >= 10 else pd.concat([self.tail, df]).tail(10)
+
+        # Bottom-k sampling: a uniform sample that can be merged across chunks and shards
+        keys = self._rng.random(n)
+        self._merge_sample(df, keys)
+        self.rows += n
+        return self
+
+    def _merge_sample(self, df, keys):
+        if self.sample_rows <= 0 or len(df) == 0:
+            return
+        if len(keys) > self.sample_rows:
+            idx = np.argpartition(keys, self.sample_rows)[:self.sample_rows]
+            idx.sort()
+            df, keys = df.iloc[idx], keys[idx]
+        if self.sample is None:
+            self.sample, self.sample_keys = df, keys
+            return
+        combined = pd.concat([self.sample, df])
+        combined_keys = np.concatenate([self.sample_keys, keys])
+        if len(combined_keys) > self.sample_rows:
+            idx = np.argpartition(combined_keys, self.sample_rows)[:self.sample_rows]
+            idx.sort()
+            combined, combined_keys = combined.iloc[idx], combined_keys[idx]
+        self.sample, self.sample_keys = combined, combined_keys
+
+    def merge(self, other):
+        """Combine with a profiler built over the rows that follow this one"""
+        for col, profile in other.columns.items():
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile(col, profile.kind, profile.dtype, nulls=self.rows)
+            self.columns[col].merge(profile)
+        for col, profile in self.columns.items():
+            if col not in other.columns:
+                profile.nulls += other.rows
+
+        if other.head is not None:
+            if self.head is None:
+                self.head = other.head
+            elif len(self.head) < 10:
+                self.head = pd.concat([self.head, other.head]).head(10)
+            self.tail = other.tail if self.tail is None or len(other.tail) >= 10 else pd.concat([self.tail, other.tail]).tail(10)
+        if other.sample is not None:
+            self._merge_sample(other.sample, other.sample_keys)
+        self.rows += other.rows
+        return self
+
+    def sample_frame(self):
+        """The retained uniform row sample, in original row order"""
+        if self.sample is None:
+            return pd.DataFrame(columns=list(self.columns))
+        return self.sample.reindex(columns=list(self.columns)).reset_index(drop=True)
+
+    def column_types(self):
+        """Classify columns the same way DataAnalyst.understand_data does"""
+        types = {}
+        for col, profile in self.columns.items():
+            distinct = profile.distinct()
+            if profile.kind == 'numeric':
+                if distinct is not None and distinct < 20 and distinct / max(self.rows, 1) < 0.05:
+                    types[col] = 'categorical_numeric'
+                else:
+                    types[col] = 'numerical'
+            elif profile.kind == 'datetime':
+                types[col] = 'datetime'
+            elif profile.kind == 'boolean':
+                types[col] = 'boolean'
+            elif distinct is not None and distinct == self.rows:
+                types[col] = 'id'
+            else:
+                types[col] = 'categorical'
+        return types
+
+    def understanding(self):
+        """Full-data equivalent of DataAnalyst.understand_data()"""
+        def records(frame):
+            if frame is None:
+                return []
+            return frame.reindex(columns=list(self.columns)).replace({np.nan: None, np.inf: None, -np.inf: None}).to_dict('records')
+
+        memory = 0.0
+        if self.sample is not None and len(self.sample):
+            memory = self.sample.memory_usage(deep=True).sum() / len(self.sample) * self.rows / 1024**2
+
+        return {
+            'shape': (self.rows, len(self.columns)),
+            'columns': list(self.columns),
+            'dtypes': {col: profile.dtype for col, profile in self.columns.items()},
+            'memory_usage': float(memory),
+            'head': records(self.head),
+            'tail': records(self.tail),
+            'column_types': self.column_types()
+        }
+
+    def numerical_summary(self):
+        """Full-data equivalent of describe().to_dict() for numeric columns"""
+        summary = {}
+        for col, profile in self.columns.items():
+            if profile.kind != 'numeric':
+                continue
+            q25, q50, q75 = profile.sketch.quantiles([0.25, 0.5, 0.75])
+            summary[col] = {
+                'count': float(profile.count),
+                'mean': profile.mean if profile.count else None,
+                'std': profile.std(),
+                'min': profile.min,
+                '25%': q25,
+                '50%': q50,
+                '75%': q75,
+                'max': profile.max
+            }
+        return summary
+
+    def categorical_summary(self, columns=None, top=20):
+        """Top value counts for non-numeric columns"""
+        columns = columns if columns is not None else [col for col, p in self.columns.items() if p.kind in ('object', 'boolean')]
+        return {col: {str(k): int(v) for k, v in self.columns[col].values.most_common(top)} for col in columns if col in self.columns}
+
+    def missing_values(self):
+        return {col: profile.nulls for col, profile in self.columns.items() if profile.nulls > 0}
+
+    def to_dict(self):
+        """Full-data profile as a JSON-friendly dict"""
+        return {
+            'rows': self.rows,
+            'columns': len(self.columns),
+            'numerical_summary': self.numerical_summary(),
+            'categorical_summary': self.categorical_summary(),
+            'missing_values': self.missing_values(),
+            'approximate_quantiles': any(not p.sketch.is_exact for p in self.columns.values() if p.sketch is not None)
+        }
+
+
+def profile_chunks(chunks, sample_rows=None):
+    """Profile an iterable of DataFrame chunks"""
+    profiler = ChunkedProfiler(sample_rows=sample_rows)
+    for chunk in chunks:
+        profiler.update(chunk)
+    return profiler
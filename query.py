@@ -0,0 +1,502 @@
+"""
+Drill-down queries (filter, group-by, aggregate, sort, limit) over retained cleaned datasets
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from admission import admission_controller
+from config import Config
+from rollups import date_part
+from serialization import json_frame
+
+
+OPERATORS = ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'between', 'in', 'not_in', 'is_null', 'not_null', 'outlier')
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max', 'median', 'std', 'nunique')
+
+_RANGE_OPERATORS = ('lt', 'le', 'gt', 'ge', 'between')
+
+
+def _is_sortable(series):
+    """Numeric and datetime columns get a sorted index; everything else is coded"""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or isinstance(dtype, pd.CategoricalDtype):
+        return False
+    return pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_datetime64_any_dtype(dtype)
+
+
+def _sortable_values(series):
+    """Plain numpy values for a sorted index: float with NaN for nullable numerics, naive UTC
+    datetime64 for timezone-aware dates"""
+    if getattr(series.dtype, 'tz', None) is not None:
+        series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+    if isinstance(series.dtype, np.dtype):
+        return series.to_numpy()
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+class SortedIndex:
+    """Row positions of a numeric or datetime column in value order (missing values last).
+
+    Range and equality filters are two binary searches; sorting by the column is a pass over
+    ``order`` that keeps the matching rows.
+    """
+
+    kind = 'sorted'
+
+    def __init__(self, order, values, valid, datetime):
+        self.order = order
+        self.values = values
+        self.valid = valid
+        self.datetime = datetime
+
+    @classmethod
+    def from_series(cls, series):
+        values = _sortable_values(series)
+        # NaN and NaT sort to the end, so the first ``valid`` positions are the present values
+        order = np.argsort(values, kind='stable')
+        valid = int(len(values) - pd.isna(values).sum())
+        return cls(order, values[order[:valid]], valid, values.dtype.kind == 'M')
+
+    @property
+    def rows(self):
+        return len(self.order)
+
+    @property
+    def nbytes(self):
+        return self.order.nbytes + self.values.nbytes
+
+    def _scalar(self, value):
+        if self.datetime:
+            stamp = pd.Timestamp(value)
+            if stamp.tz is not None:
+                stamp = stamp.tz_convert('UTC').tz_localize(None)
+            return stamp.to_datetime64()
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Expected a number, got {value!r}")
+        return value
+
+    def positions(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        """Rows with ``low <= value <= high`` (either bound optional, inclusivity per bound)"""
+        start, stop = 0, self.valid
+        if low is not None:
+            start = np.searchsorted(self.values, self._scalar(low), 'left' if low_inclusive else 'right')
+        if high is not None:
+            stop = np.searchsorted(self.values, self._scalar(high), 'right' if high_inclusive else 'left')
+        return self.order[start:max(start, stop)]
+
+    def missing(self):
+        return self.order[self.valid:]
+
+    def sorted_positions(self, mask, descending=False):
+        """Positions of ``mask`` rows in value order, missing values last either way"""
+        present = self.order[:self.valid]
+        if descending and self.valid:
+            # Reverse the runs of equal values but keep row order within each run (stable)
+            runs = np.concatenate([[0], np.cumsum(self.values[1:] != self.values[:-1])])
+            present = present[np.argsort(runs[-1] - runs, kind='stable')]
+        ordered = np.concatenate([present, self.missing()])
+        return ordered if mask is None else ordered[mask[ordered]]
+
+
+class BitmapIndex:
+    """Factorized codes of a text, boolean or categorical column, plus one packed row bitmap per
+    distinct value when there are at most ``Config.QUERY_BITMAP_MAX_VALUES`` of them. Columns
+    with more values answer equality from a scan of the codes."""
+
+    kind = 'bitmap'
+
+    def __init__(self, codes, categories, bitmaps):
+        self.codes = codes
+        self.categories = categories
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def from_series(cls, series, max_values=None):
+        max_values = Config.QUERY_BITMAP_MAX_VALUES if max_values is None else max_values
+        try:
+            codes, uniques = pd.factorize(series, sort=True, use_na_sentinel=True)
+        except TypeError:
+            # Mixed types that cannot be ordered keep first-seen order
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        categories = pd.Index(uniques)
+        bitmaps = None
+        if len(categories) <= max_values:
+            bitmaps = [np.packbits(codes == code) for code in range(len(categories))]
+        return cls(codes, categories, bitmaps)
+
+    @property
+    def rows(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        bitmaps = sum(bitmap.nbytes for bitmap in self.bitmaps) if self.bitmaps is not None else 0
+        return self.codes.nbytes + bitmaps + int(self.categories.memory_usage(deep=True))
+
+    def mask(self, values):
+        """Rows equal to any of ``values`` (values not in the column match nothing)"""
+        codes = self.categories.get_indexer(pd.Index(list(values), dtype=object))
+        codes = np.unique(codes[codes >= 0])
+        if self.bitmaps is None:
+            return np.isin(self.codes, codes)
+        if not len(codes):
+            return np.zeros(self.rows, dtype=bool)
+        packed = np.bitwise_or.reduce([self.bitmaps[code] for code in codes])
+        return np.unpackbits(packed, count=self.rows).view(bool)
+
+    def missing(self):
+        return self.codes < 0
+
+    def labels(self, positions=None):
+        """Column values (for grouping and output) rebuilt from the codes"""
+        codes = self.codes if positions is None else self.codes[positions]
+        return pd.Categorical.from_codes(codes, self.categories)
+
+
+def _as_list(value, name):
+    if value is None:
+        return []
+    if isinstance(value, (str, dict)):
+        return [value]
+    if not isinstance(value, list):
+        raise ValueError(f"'{name}' must be a list")
+    return value
+
+
+def parse_query(spec):
+    """Validated query from a request body.
+
+    ``{"filters": [{"column": "Region", "op": "in", "value": ["East", "West"]}],
+    "group_by": ["Region"], "aggregates": [{"column": "Sales", "func": "sum"}],
+    "sort": [{"column": "sum_Sales", "descending": true}], "limit": 10}``
+
+    Without ``aggregates`` matching rows are returned (``columns`` picks the fields).
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("Query must be a JSON object")
+    unknown = set(spec) - {'filters', 'group_by', 'aggregates', 'columns', 'sort', 'limit'}
+    if unknown:
+        raise ValueError(f"Unknown query keys: {', '.join(sorted(unknown))}")
+
+    filters = []
+    for item in _as_list(spec.get('filters'), 'filters'):
+        if not isinstance(item, dict):
+            raise ValueError("Each filter must be an object with 'column', 'op' and 'value'")
+        op = str(item.get('op', 'eq')).lower()
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown filter op '{op}'. Use one of: {', '.join(OPERATORS)}")
+        if op != 'outlier' and not item.get('column'):
+            raise ValueError(f"Filter '{op}' needs a 'column'")
+        value = item.get('value')
+        if op == 'between' and (not isinstance(value, list) or len(value) != 2):
+            raise ValueError("'between' needs a [low, high] value")
+        if op in ('in', 'not_in') and not isinstance(value, list):
+            value = [value]
+        filters.append({'column': item.get('column'), 'op': op, 'value': value})
+
+    aggregates = []
+    for item in _as_list(spec.get('aggregates'), 'aggregates'):
+        if isinstance(item, str):
+            item = {'func': 'count'} if item == 'count' else {'column': item, 'func': 'sum'}
+        func = str(item.get('func', 'sum')).lower()
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{func}'. Use one of: {', '.join(AGGREGATES)}")
+        column = item.get('column')
+        if column is None and func != 'count':
+            raise ValueError(f"Aggregate '{func}' needs a 'column'")
+        name = item.get('as') or (f'{func}_{column}' if column is not None else 'count')
+        aggregates.append({'column': column, 'func': func, 'name': name})
+
+    sort = []
+    for item in _as_list(spec.get('sort'), 'sort'):
+        if isinstance(item, str):
+            item = {'column': item.lstrip('-'), 'descending': item.startswith('-')}
+        if not isinstance(item, dict) or not item.get('column'):
+            raise ValueError("Each sort key must be a column name or an object with 'column'")
+        sort.append({'column': item['column'], 'descending': bool(item.get('descending', False))})
+
+    limit = spec.get('limit', Config.QUERY_DEFAULT_LIMIT)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 0:
+        raise ValueError("'limit' must be a non-negative integer")
+    group_by = [str(col) for col in _as_list(spec.get('group_by'), 'group_by')]
+    if group_by and not aggregates:
+        aggregates = [{'column': None, 'func': 'count', 'name': 'count'}]
+    return {
+        'filters': filters,
+        'group_by': group_by,
+        'aggregates': aggregates,
+        'columns': [str(col) for col in _as_list(spec.get('columns'), 'columns')] or None,
+        'sort': sort,
+        'limit': min(limit, Config.QUERY_MAX_LIMIT)
+    }
+
+
+class QueryEngine:
+    """A cleaned dataset kept after its analysis, answering drill-down queries.
+
+    Each column's index is built the first time a query touches it and reused afterwards; its
+    bytes are reported to ``on_grow`` (set by the QueryStore holding the engine).
+    ``virtual`` maps date-hierarchy names (``Date_Year``) to their (datetime column, part) and
+    ``outliers`` is the analysis's OutlierResult, whose row bitmap backs the ``outlier`` filter.
+    """
+
+    def __init__(self, df, virtual=None, outliers=None):
+        self.df = df
+        self.virtual = dict(virtual or {})
+        self.outliers = outliers
+        self._indexes = {}
+        self._parts = {}
+        self._lock = threading.Lock()
+        self.on_grow = None
+
+    @property
+    def rows(self):
+        return len(self.df)
+
+    @property
+    def columns(self):
+        return list(self.df.columns) + list(self.virtual)
+
+    @property
+    def nbytes(self):
+        """The frame plus every index and date part built so far"""
+        with self._lock:
+            indexes, parts = list(self._indexes.values()), list(self._parts.values())
+        return (int(self.df.memory_usage(index=True, deep=True).sum()) + sum(index.nbytes for index in indexes)
+                + sum(int(part.memory_usage(index=False, deep=True)) for part in parts))
+
+    def _retain(self, store, key, value, nbytes):
+        """Keep ``value`` under ``key`` (first one wins) and report the bytes it adds"""
+        with self._lock:
+            kept = store.setdefault(key, value)
+        if kept is value and self.on_grow is not None:
+            self.on_grow(nbytes)
+        return kept
+
+    def series(self, column):
+        if column in self.virtual:
+            # Date parts are one or two bytes a row, so they are kept once computed
+            series = self._parts.get(column)
+            if series is None:
+                col, part = self.virtual[column]
+                series = date_part(self.df[col], part).rename(column)
+                series = self._retain(self._parts, column, series, int(series.memory_usage(index=False, deep=True)))
+            return series
+        if column not in self.df.columns:
+            raise ValueError(f"Unknown column '{column}'")
+        return self.df[column]
+
+    def index(self, column):
+        """Sorted or bitmap index for ``column``, built on first use"""
+        index = self._indexes.get(column)
+        if index is None:
+            series = self.series(column)
+            index = SortedIndex.from_series(series) if _is_sortable(series) else BitmapIndex.from_series(series)
+            index = self._retain(self._indexes, column, index, index.nbytes)
+        return index
+
+    def describe(self):
+        """Queryable columns with their index kind (``None`` until first used)"""
+        return {
+            'rows': self.rows,
+            'columns': {col: {'dtype': str(self.series(col).dtype) if col in self.df.columns else 'virtual',
+                              'index': getattr(self._indexes.get(col), 'kind', None)} for col in self.columns},
+            'outlier_columns': list(self.outliers.columns) if self.outliers is not None else [],
+            'operators': list(OPERATORS),
+            'aggregates': list(AGGREGATES)
+        }
+
+    def _positions_mask(self, positions):
+        mask = np.zeros(self.rows, dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def _filter(self, item):
+        op, value = item['op'], item['value']
+        if op == 'outlier':
+            if self.outliers is None or (item['column'] is not None and item['column'] not in self.outliers.columns):
+                raise ValueError(f"No outlier bitmap for '{item['column']}'")
+            return self.outliers.mask(item['column'])
+        index = self.index(item['column'])
+        if op in ('is_null', 'not_null'):
+            missing = self._positions_mask(index.missing()) if index.kind == 'sorted' else index.missing()
+            return missing if op == 'is_null' else ~missing
+        if index.kind == 'bitmap':
+            if op in _RANGE_OPERATORS:
+                raise ValueError(f"Filter '{op}' needs a numeric or date column; '{item['column']}' is not one")
+            matched = index.mask(value if op in ('in', 'not_in') else [value])
+            return matched if op in ('eq', 'in') else ~matched & ~index.missing()
+        if op == 'between':
+            return self._positions_mask(index.positions(value[0], value[1]))
+        if op in ('lt', 'le'):
+            return self._positions_mask(index.positions(high=value, high_inclusive=op == 'le'))
+        if op in ('gt', 'ge'):
+            return self._positions_mask(index.positions(low=value, low_inclusive=op == 'ge'))
+        values = value if op in ('in', 'not_in') else [value]
+        matched = np.zeros(self.rows, dtype=bool)
+        for v in values:
+            matched[index.positions(v, v)] = True
+        if op in ('eq', 'in'):
+            return matched
+        return ~matched & ~self._positions_mask(index.missing())
+
+    def filter_mask(self, filters):
+        """Rows matching every filter, or None (all rows) without filters"""
+        mask = None
+        for item in filters:
+            matched = self._filter(item)
+            mask = matched if mask is None else mask & matched
+        return mask
+
+    def _values(self, column, positions=None, coded=False):
+        """``column`` at ``positions`` (all rows when None); ``coded`` rebuilds text columns from
+        their bitmap index, which groups faster than the raw strings"""
+        if column in self.virtual:
+            values = self.series(column).array
+            return values if positions is None else values.take(positions)
+        series = self.series(column)
+        if coded and not _is_sortable(series):
+            return self.index(column).labels(positions)
+        return series.to_numpy() if positions is None else series.iloc[positions].to_numpy()
+
+    def _check_aggregate(self, item):
+        series = self.series(item['column'])
+        numeric = _is_sortable(series) and not pd.api.types.is_datetime64_any_dtype(series.dtype)
+        if item['func'] == 'sum' and not numeric or item['func'] in ('mean', 'median', 'std') and not _is_sortable(series):
+            raise ValueError(f"Cannot {item['func']} '{item['column']}' ({series.dtype})")
+
+    def _aggregate(self, query, positions):
+        measures = {}
+        for k, item in enumerate(query['aggregates']):
+            if item['column'] is not None:
+                self._check_aggregate(item)
+                measures[f'_m{k}'] = self._values(item['column'], positions)
+        frame = pd.DataFrame(measures)
+        if not query['group_by']:
+            length = self.rows if positions is None else len(positions)
+            return pd.DataFrame([{item['name']: length if item['column'] is None else getattr(frame[f'_m{k}'], item['func'])()
+                                  for k, item in enumerate(query['aggregates'])}])
+
+        for col in query['group_by']:
+            frame[col] = self._values(col, positions, coded=True)
+        named = {item['name']: (f'_m{k}', item['func']) if item['column'] is not None else (query['group_by'][0], 'size')
+                 for k, item in enumerate(query['aggregates'])}
+        grouped = frame.groupby(query['group_by'], observed=True, sort=True, dropna=False)
+        return grouped.agg(**named).reset_index()
+
+    def _order(self, sort, mask, positions):
+        """Matching row positions ordered by the ``sort`` keys"""
+        if len(sort) == 1 and _is_sortable(self.series(sort[0]['column'])):
+            # One numeric or date key: walk its sorted index instead of sorting the matches
+            return self.index(sort[0]['column']).sorted_positions(mask, sort[0]['descending'])
+        keys = pd.DataFrame({f'_s{k}': self._values(item['column'], positions) for k, item in enumerate(sort)})
+        order = keys.sort_values(list(keys.columns), ascending=[not item['descending'] for item in sort],
+                                 kind='stable', na_position='last').index.to_numpy()
+        return order if positions is None else positions[order]
+
+    def run(self, query):
+        """Execute a parsed query; returns the result rows with counts and timing"""
+        start = time.perf_counter()
+        indexed = set(self._indexes)
+        mask = self.filter_mask(query['filters'])
+        matched = self.rows if mask is None else int(mask.sum())
+        positions = None if mask is None else np.flatnonzero(mask)
+
+        if query['aggregates']:
+            result = self._aggregate(query, positions)
+            total = len(result)
+            for item in query['sort']:
+                if item['column'] not in result.columns:
+                    raise ValueError(f"Cannot sort by '{item['column']}': not a group or aggregate column")
+            if query['sort']:
+                result = result.sort_values([item['column'] for item in query['sort']],
+                                            ascending=[not item['descending'] for item in query['sort']],
+                                            kind='stable', na_position='last')
+            result = result.head(query['limit'])
+        else:
+            total = matched
+            if query['sort']:
+                positions = self._order(query['sort'], mask, positions)
+            if positions is None:
+                positions = np.arange(self.rows)
+            positions = positions[:query['limit']]
+            result = pd.DataFrame({col: self._values(col, positions) for col in query['columns'] or self.df.columns})
+            result.insert(0, '_row', positions)
+
+        return {
+            'columns': list(result.columns),
+            'rows': json_frame(result).to_dict(orient='records'),
+            'matched_rows': matched,
+            'total': total,
+            'returned': len(result),
+            'indexes_built': sorted(set(self._indexes) - indexed),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 3)
+        }
+
+
+class QueryStore:
+    """Thread-safe, byte-bounded map of analysis id to QueryEngine (least recently used evicted).
+
+    Engines are counted with the indexes they build after being added. The retained total is
+    reported to ``admission`` (an AdmissionController), so it comes out of the analysis budget.
+    """
+
+    def __init__(self, capacity_mb=None, admission=None):
+        self.capacity = int((Config.QUERY_STORE_MB if capacity_mb is None else capacity_mb) * 1024 * 1024)
+        self.admission = admission
+        self.nbytes = 0
+        self._engines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        # Callers hold the lock
+        while self.nbytes > self.capacity and self._engines:
+            _, (engine, evicted) = self._engines.popitem(last=False)
+            engine.on_grow = None
+            self.nbytes -= evicted
+        if self.admission is not None:
+            self.admission.retain(self.nbytes)
+
+    def add(self, engine):
+        """Retain ``engine`` and return its id, or None when the dataset alone exceeds the capacity"""
+        analysis_id = uuid.uuid4().hex
+        with self._lock:
+            size = engine.nbytes
+            if size > self.capacity:
+                return None
+            engine.on_grow = partial(self._grow, analysis_id)
+            self._engines[analysis_id] = (engine, size)
+            self.nbytes += size
+            self._evict()
+        return analysis_id
+
+    def _grow(self, analysis_id, nbytes):
+        """Count an index built by a retained engine, evicting others (or it) to stay in bounds"""
+        with self._lock:
+            entry = self._engines.get(analysis_id)
+            if entry is None:
+                return
+            self._engines[analysis_id] = (entry[0], entry[1] + nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def get(self, analysis_id):
+        with self._lock:
+            entry = self._engines.get(analysis_id)
+            if entry is None:
+                return None
+            self._engines.move_to_end(analysis_id)
+            return entry[0]
+
+    def __len__(self):
+        return len(self._engines)
+
+
+query_store = QueryStore(admission=admission_controller)
@@ -0,0 +1,108 @@
+"""
+Cheap column ranking that points the expensive stages at the most informative columns
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from correlation import CorrelationEngine
+
+
+KPI_KEYWORDS = ('sales', 'revenue', 'profit', 'amount', 'price', 'quantity', 'units', 'cost', 'income')
+
+# Score = weighted sum of components in [0, 1]; each kind is only ranked against its own kind
+WEIGHTS = {
+    'numeric': {'completeness': 0.2, 'spread': 0.25, 'cardinality': 0.15, 'kpi': 0.2, 'centrality': 0.2},
+    'categorical': {'completeness': 0.4, 'cardinality': 0.6},
+}
+
+CATEGORICAL_TYPES = ('categorical', 'categorical_numeric')
+
+
+def _sample(df, rows):
+    """Evenly spaced rows, so the ranking is deterministic and its cost bounded"""
+    if len(df) <= rows:
+        return df
+    return df.iloc[np.linspace(0, len(df) - 1, rows).astype(np.int64)]
+
+
+def _numeric_components(sample, columns):
+    values = sample[columns]
+    distinct = values.nunique()
+    # Share of the most common value; unlike the raw variance this does not depend on the units
+    mode_share = values.apply(lambda col: col.value_counts(normalize=True).max()).astype(float)
+    return pd.DataFrame({
+        # Variance gate: 0 for a constant (or mostly constant) column, 1 when values vary freely
+        'spread': (1 - mode_share).fillna(0.0),
+        # Few distinct values make a poor continuous measure
+        'cardinality': ((distinct - 1) / 20).clip(0, 1),
+    })
+
+
+def _categorical_components(sample, columns):
+    distinct = sample[columns].nunique()
+    chartable = Config.MAX_CHART_CATEGORIES
+    # Best with 2..MAX_CHART_CATEGORIES groups, decaying beyond; near-unique columns are identifiers
+    cardinality = (chartable / distinct.clip(lower=chartable)).where(distinct > 1, 0.0)
+    cardinality = cardinality.where(distinct < 0.5 * max(len(sample), 1), 0.0)
+    return pd.DataFrame({'cardinality': cardinality})
+
+
+class ColumnRanking:
+    """Per-column informativeness scores for numeric measures and categorical dimensions.
+
+    Variance, cardinality and correlation centrality are measured on an evenly spaced sample of
+    ``Config.RANKING_SAMPLE_ROWS`` rows; null rates come from the full data. ``table`` holds every
+    component with the final ``score``, best first within each kind.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def from_frame(cls, df, column_types, exclude=(), null_rates=None, sample_rows=None):
+        sample = _sample(df, Config.RANKING_SAMPLE_ROWS if sample_rows is None else sample_rows)
+        exclude = set(exclude)
+        numeric = [col for col in df.select_dtypes(include=[np.number]).columns if col not in exclude]
+        categorical = [col for col in df.columns if column_types.get(col) in CATEGORICAL_TYPES and col not in exclude]
+        if null_rates is None:
+            null_rates = df.isna().mean()
+
+        frames = []
+        if numeric:
+            parts = _numeric_components(sample, numeric)
+            parts['centrality'] = CorrelationEngine.from_frame(sample, numeric).centrality() if len(numeric) > 1 else 0.0
+            parts['kind'] = 'numeric'
+            frames.append(parts)
+        if categorical:
+            parts = _categorical_components(sample, categorical)
+            parts['kind'] = 'categorical'
+            frames.append(parts)
+        if not frames:
+            return cls(pd.DataFrame(columns=['kind', 'score']))
+
+        # A categorical_numeric column is ranked both as a measure and as a dimension
+        table = pd.concat(frames).reset_index(names='column')
+        table['completeness'] = 1 - table['column'].map(null_rates).fillna(0.0).astype(float)
+        table['kpi'] = table['column'].map(lambda col: float(any(kw in str(col).lower() for kw in KPI_KEYWORDS)))
+        table['score'] = 0.0
+        for kind, weights in WEIGHTS.items():
+            rows = table['kind'] == kind
+            for component, weight in weights.items():
+                table.loc[rows, 'score'] += weight * table.loc[rows, component].fillna(0.0)
+        table = table.sort_values(['kind', 'score'], ascending=[True, False], kind='stable').reset_index(drop=True)
+        return cls(table)
+
+    def top(self, kind, n=None):
+        """Columns of ``kind`` ('numeric' or 'categorical'), most informative first"""
+        columns = self.table.loc[self.table['kind'] == kind, 'column'].tolist()
+        return columns if n is None else columns[:n]
+
+    def to_list(self, n=None):
+        """JSON-ready ranking of the top ``n`` columns of each kind"""
+        records = []
+        for kind in WEIGHTS:
+            rows = self.table[self.table['kind'] == kind].head(n)
+            records.extend({'column': str(row['column']), 'kind': kind, 'score': round(float(row['score']), 4)} for _, row in rows.iterrows())
+        return records
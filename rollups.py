@@ -0,0 +1,246 @@
+"""
+Sort-free time rollups of numeric columns by day, week, month, quarter and year
+"""
+
+import numpy as np
+import pandas as pd
+
+
+GRAINS = ('day', 'week', 'month', 'quarter', 'year')
+AGGREGATES = ('sum', 'mean', 'count', 'min', 'max')
+GRAIN_LABELS = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly', 'quarter': 'Quarterly', 'year': 'Yearly'}
+
+# Levels of the date hierarchy offered for every detected datetime column
+HIERARCHY_PARTS = ('Year', 'Quarter', 'Month', 'MonthName', 'DayOfWeek')
+MONTH_NAMES = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+               'September', 'October', 'November', 'December')
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Dense bincount is used while the code span stays within this multiple of the row count
+DENSE_SPAN_FACTOR = 4
+
+
+def period_codes(dates, grain):
+    """Integer period number of each timestamp (NaT maps to the int64 minimum).
+
+    Codes are computed arithmetically from datetime64 values, so no sort or string
+    formatting is needed. Weeks start on Monday.
+    """
+    values = np.asarray(dates, dtype='datetime64[ns]')
+    if grain == 'day':
+        codes = values.astype('datetime64[D]').astype(np.int64)
+    elif grain == 'week':
+        # 1970-01-01 is a Thursday; shift so that weeks begin on Monday
+        days = values.astype('datetime64[D]').astype(np.int64)
+        codes = (days + 3) // 7
+    elif grain == 'month':
+        codes = values.astype('datetime64[M]').astype(np.int64)
+    elif grain == 'quarter':
+        codes = values.astype('datetime64[M]').astype(np.int64) // 3
+    elif grain == 'year':
+        codes = values.astype('datetime64[Y]').astype(np.int64)
+    else:
+        raise ValueError(f"Unknown grain '{grain}'. Use one of: {', '.join(GRAINS)}")
+    return np.where(np.isnat(values), np.iinfo(np.int64).min, codes)
+
+
+def period_starts(codes, grain):
+    """Timestamps of the first instant of each period code"""
+    codes = np.asarray(codes, dtype=np.int64)
+    if grain == 'day':
+        starts = codes.astype('datetime64[D]')
+    elif grain == 'week':
+        starts = (codes * 7 - 3).astype('datetime64[D]')
+    elif grain == 'month':
+        starts = codes.astype('datetime64[M]')
+    elif grain == 'quarter':
+        starts = (codes * 3).astype('datetime64[M]')
+    else:
+        starts = codes.astype('datetime64[Y]')
+    return pd.DatetimeIndex(starts.astype('datetime64[ns]'), name='period')
+
+
+def period_labels(codes, grain):
+    """Readable labels: 2024-03-15, 2024-W11, 2024-03, 2024-Q1, 2024"""
+    starts = period_starts(codes, grain)
+    if grain == 'day':
+        return list(starts.strftime('%Y-%m-%d'))
+    if grain == 'week':
+        iso = starts.isocalendar()
+        return [f"{y}-W{w:02d}" for y, w in zip(iso['year'], iso['week'])]
+    if grain == 'month':
+        return list(starts.strftime('%Y-%m'))
+    if grain == 'quarter':
+        return [f"{d.year}-Q{(d.month - 1) // 3 + 1}" for d in starts]
+    return [str(d.year) for d in starts]
+
+
+def _group_index(codes):
+    """Map period codes to dense group numbers without sorting the rows.
+
+    Returns (group per row, sorted unique codes, number of groups). Spans that are small
+    relative to the row count use an offset; sparse spans fall back to hash factorization.
+    """
+    low, high = codes.min(), codes.max()
+    span = int(high - low) + 1
+    if span <= DENSE_SPAN_FACTOR * len(codes) + 1024:
+        offsets = codes - low
+        present = np.bincount(offsets, minlength=span) > 0
+        # Renumber the occupied offsets so empty periods are not reported
+        renumber = np.cumsum(present) - 1
+        return renumber[offsets], np.flatnonzero(present) + low, int(present.sum())
+
+    groups, uniques = pd.factorize(codes, sort=False)
+    # Only the distinct periods are ordered, never the rows
+    order = np.argsort(uniques)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[groups], uniques[order], len(uniques)
+
+
+def _combine(size, left_at, left, right_at, right, fill, op):
+    """Per-period array of ``size`` combining two sides placed at their union positions"""
+    dtype = np.int64 if isinstance(fill, int) else float
+    combined = np.full(size, fill, dtype=dtype)
+    if left is not None:
+        combined[left_at] = left
+    if right is not None:
+        combined[right_at] = op(combined[right_at], right)
+    return combined
+
+
+class TimeRollup:
+    """Aggregates of numeric columns per period of one datetime column, for every grain.
+
+    Sums, counts, minima and maxima are kept per period so means can be derived and rollups of
+    separate batches can later be combined.
+    """
+
+    def __init__(self, date_col, value_cols):
+        self.date_col = date_col
+        self.value_cols = list(value_cols)
+        self.rows = 0
+        self.first = None
+        self.last = None
+        self.grains = {}
+
+    @classmethod
+    def from_frame(cls, df, date_col, value_cols, grains=GRAINS):
+        rollup = cls(date_col, value_cols)
+        dates = pd.to_datetime(df[date_col], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        valid = ~np.isnat(dates)
+        rollup.rows = int(valid.sum())
+        if rollup.rows == 0:
+            return rollup
+
+        dates = dates[valid]
+        rollup.first = pd.Timestamp(dates.min())
+        rollup.last = pd.Timestamp(dates.max())
+        values = {col: df[col].to_numpy(dtype=float, na_value=np.nan)[valid] for col in rollup.value_cols}
+
+        for grain in grains:
+            groups, codes, n = _group_index(period_codes(dates, grain))
+            table = {'codes': codes, 'rows': np.bincount(groups, minlength=n), 'sum': {}, 'count': {}, 'min': {}, 'max': {}}
+            for col, column in values.items():
+                present = ~np.isnan(column)
+                idx, vals = groups[present], column[present]
+                table['count'][col] = np.bincount(idx, minlength=n)
+                table['sum'][col] = np.bincount(idx, weights=vals, minlength=n)
+                mins = np.full(n, np.inf)
+                maxs = np.full(n, -np.inf)
+                np.minimum.at(mins, idx, vals)
+                np.maximum.at(maxs, idx, vals)
+                table['min'][col] = mins
+                table['max'][col] = maxs
+            rollup.grains[grain] = table
+        return rollup
+
+    def merge(self, other):
+        """Add the periods of a rollup built over other rows of the same dataset"""
+        if other.rows == 0:
+            return self
+        self.value_cols += [col for col in other.value_cols if col not in self.value_cols]
+        self.first = other.first if self.first is None else min(self.first, other.first)
+        self.last = other.last if self.last is None else max(self.last, other.last)
+        self.rows += other.rows
+        for grain, theirs in other.grains.items():
+            mine = self.grains.get(grain, {'codes': np.empty(0, dtype=np.int64), 'rows': np.empty(0, dtype=np.int64),
+                                           'sum': {}, 'count': {}, 'min': {}, 'max': {}})
+            # Periods are sorted unique codes, so both sides map onto their union by binary search
+            codes = np.union1d(mine['codes'], theirs['codes'])
+            ours, their = np.searchsorted(codes, mine['codes']), np.searchsorted(codes, theirs['codes'])
+            table = {'codes': codes, 'rows': _combine(len(codes), ours, mine['rows'], their, theirs['rows'], 0, np.add)}
+            for stat, fill, op in (('sum', 0.0, np.add), ('count', 0, np.add), ('min', np.inf, np.minimum), ('max', -np.inf, np.maximum)):
+                table[stat] = {col: _combine(len(codes), ours, mine[stat].get(col), their, theirs[stat].get(col), fill, op)
+                               for col in self.value_cols}
+            self.grains[grain] = table
+        return self
+
+    def renamed(self, names):
+        """Copy with columns renamed through the ``names`` mapping (statistics are shared)"""
+        rollup = TimeRollup(names.get(self.date_col, self.date_col), [names.get(col, col) for col in self.value_cols])
+        rollup.rows, rollup.first, rollup.last = self.rows, self.first, self.last
+        for grain, table in self.grains.items():
+            rollup.grains[grain] = {'codes': table['codes'], 'rows': table['rows']}
+            for stat in ('sum', 'count', 'min', 'max'):
+                rollup.grains[grain][stat] = {names.get(col, col): values for col, values in table[stat].items()}
+        return rollup
+
+    def periods(self, grain):
+        return len(self.grains[grain]['codes']) if grain in self.grains else 0
+
+    def frame(self, grain, value_col):
+        """DataFrame of sum, mean, count, min, max of ``value_col`` indexed by period start"""
+        if grain not in self.grains:
+            return pd.DataFrame(columns=list(AGGREGATES), index=pd.DatetimeIndex([], name='period'))
+        table = self.grains[grain]
+        count = table['count'][value_col]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = table['sum'][value_col] / count
+        empty = count == 0
+        return pd.DataFrame({
+            'sum': table['sum'][value_col],
+            'mean': mean,
+            'count': count,
+            'min': np.where(empty, np.nan, table['min'][value_col]),
+            'max': np.where(empty, np.nan, table['max'][value_col])
+        }, index=period_starts(table['codes'], grain))
+
+    def grain_for(self, max_periods=60):
+        """Finest grain with at most ``max_periods`` periods (for readable trend charts)"""
+        for grain in GRAINS:
+            if grain in self.grains and self.periods(grain) <= max_periods:
+                return grain
+        return GRAINS[-1]
+
+    def preview(self, grain, value_col, limit=12):
+        """Latest ``limit`` periods of a rollup (oldest first) as JSON-ready records"""
+        if grain not in self.grains:
+            return []
+        codes = self.grains[grain]['codes']
+        start = max(len(codes) - limit, 0)
+        table = self.frame(grain, value_col).iloc[start:]
+        labels = period_labels(codes[start:], grain)
+        return [
+            {grain: label, f'total_{value_col}': float(row['sum']), f'avg_{value_col}': None if pd.isna(row['mean']) else float(row['mean']), 'records': int(row['count'])}
+            for label, (_, row) in zip(labels, table.iterrows())
+        ]
+
+
+def date_part(dates, part):
+    """One level of a date hierarchy in a compact dtype: int16 years, int8 quarters and months
+    (nullable when dates are missing), calendar-ordered categoricals for month and day names"""
+    dt = dates.dt
+    if part in ('MonthName', 'DayOfWeek'):
+        codes = dt.month - 1 if part == 'MonthName' else dt.dayofweek
+        names = MONTH_NAMES if part == 'MonthName' else DAY_NAMES
+        codes = codes.fillna(-1).to_numpy(dtype=np.int8)
+        return pd.Series(pd.Categorical.from_codes(codes, categories=names, ordered=True), index=dates.index)
+    values = {'Year': dt.year, 'Quarter': dt.quarter, 'Month': dt.month}[part]
+    dtype = 'int16' if part == 'Year' else 'int8'
+    return values.astype(dtype.capitalize() if values.isna().any() else dtype)
+
+
+def build_time_rollups(df, date_cols, value_cols, grains=GRAINS):
+    """One TimeRollup per datetime column over all ``value_cols``"""
+    return {col: TimeRollup.from_frame(df, col, value_cols, grains) for col in date_cols}
@@ -0,0 +1,108 @@
+"""
+One-pass segment aggregation for categorical x numeric pairs
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+
+SEGMENT_STATS = ('sum', 'mean', 'count', 'min', 'max', 'var')
+
+
+def _combine_codes(codes_a, size_a, codes_b, size_b):
+    """Group number of each (a, b) combination; combinations are renumbered to those present"""
+    valid = (codes_a >= 0) & (codes_b >= 0)
+    combined = np.where(valid, codes_a.astype(np.int64) * size_b + codes_b, -1)
+    if size_a * size_b <= 4 * len(combined) + 1024:
+        present = np.bincount(combined[valid], minlength=size_a * size_b) > 0
+        renumber = np.cumsum(present) - 1
+        keys = np.flatnonzero(present)
+        groups = np.where(valid, renumber[np.where(valid, combined, 0)], -1)
+    else:
+        groups = np.full(len(combined), -1, dtype=np.int64)
+        groups[valid], keys = pd.factorize(combined[valid], sort=True)
+    return groups, keys // size_b, keys % size_b
+
+
+def _aggregate(groups, mask, column, labels):
+    n = len(labels)
+    idx, vals = groups[mask], column[mask]
+    count = np.bincount(idx, minlength=n)
+    total = np.bincount(idx, weights=vals, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        # Second pass around the group means keeps the variance numerically stable
+        m2 = np.bincount(idx, weights=(vals - mean[idx]) ** 2, minlength=n)
+        var = np.where(count > 1, m2 / (count - 1), np.nan)
+    mins = np.full(n, np.inf)
+    maxs = np.full(n, -np.inf)
+    np.minimum.at(mins, idx, vals)
+    np.maximum.at(maxs, idx, vals)
+    empty = count == 0
+    return pd.DataFrame({
+        'sum': total,
+        'mean': mean,
+        'count': count,
+        'min': np.where(empty, np.nan, mins),
+        'max': np.where(empty, np.nan, maxs),
+        'var': var
+    }, index=labels, columns=list(SEGMENT_STATS))
+
+
+class SegmentCube:
+    """Per-segment sum, mean, count, min, max and variance of every measure.
+
+    Each categorical column is factorized once; all statistics for a grouping are then
+    np.bincount / ufunc.at reductions over the integer codes, so the frame is never regrouped.
+    Groupings are each categorical column, plus every two-way combination of ``pair_cols``.
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.rows = {}
+        self.tables = {}
+
+    @classmethod
+    def from_frame(cls, df, cat_cols, value_cols, pair_cols=()):
+        cube = cls()
+        factorized = {col: pd.factorize(df[col], use_na_sentinel=True) for col in cat_cols}
+        values = {col: df[col].to_numpy(dtype=float, na_value=np.nan) for col in value_cols}
+
+        groupings = {(col,): (codes, pd.Index(uniques, name=col)) for col, (codes, uniques) in factorized.items()}
+        for col_a, col_b in combinations([col for col in pair_cols if col in factorized], 2):
+            (codes_a, uniques_a), (codes_b, uniques_b) = factorized[col_a], factorized[col_b]
+            groups, first, second = _combine_codes(codes_a, len(uniques_a), codes_b, len(uniques_b))
+            labels = pd.MultiIndex.from_arrays([np.asarray(uniques_a)[first], np.asarray(uniques_b)[second]], names=[col_a, col_b])
+            groupings[(col_a, col_b)] = (groups, labels)
+
+        for dims, (groups, labels) in groupings.items():
+            n = len(labels)
+            in_group = groups >= 0
+            cube.labels[dims] = labels
+            cube.rows[dims] = pd.Series(np.bincount(groups[in_group], minlength=n), index=labels)
+            for value_col, column in values.items():
+                cube.tables[(dims, value_col)] = _aggregate(groups, in_group & ~np.isnan(column), column, labels)
+        return cube
+
+    def dimensions(self):
+        return list(self.labels)
+
+    def table(self, dims, value_col):
+        """Statistics of ``value_col`` per segment of ``dims`` (a column name or tuple of names)"""
+        dims = (dims,) if isinstance(dims, str) else tuple(dims)
+        return self.tables.get((dims, value_col))
+
+    def top(self, dims, value_col, by='sum', n=5):
+        """Top ``n`` segments of ``dims`` ranked by one statistic of ``value_col``"""
+        table = self.table(dims, value_col)
+        if table is None:
+            return None
+        return table[table['count'] > 0].sort_values(by, ascending=False).head(n)
+
+    def frequencies(self, dims, n=None):
+        """Row count per segment, most frequent first (like value_counts)"""
+        dims = (dims,) if isinstance(dims, str) else tuple(dims)
+        counts = self.rows[dims].sort_values(ascending=False, kind='stable')
+        return counts if n is None else counts.head(n)
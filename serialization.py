@@ -0,0 +1,226 @@
+"""
+One-pass JSON serialization of analysis results with negotiated response compression
+"""
+
+import base64
+import dataclasses
+import decimal
+import gzip
+import json
+import uuid
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from werkzeug.http import http_date
+
+from artifacts import artifact_store
+from config import Config
+
+try:
+    import orjson
+except ImportError:  # stdlib json fallback
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the brotli package is installed
+    brotli = None
+
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+SCHEMA_VERSIONS = (1, 2)
+
+# Keys kept by a ``fields`` selection so the response still identifies itself
+ALWAYS_INCLUDED = ('schema_version', 'mode', 'analysis_id')
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def json_frame(df):
+    """Object copy of ``df`` with NaN, NaT and +/-Inf replaced by None, masked column-wise
+    before ``to_dict`` so nothing downstream has to walk the records looking for them"""
+    missing = df.isna()
+    numeric = df.select_dtypes(include=[np.number]).columns
+    if len(numeric):
+        missing[numeric] |= np.isinf(df[numeric].to_numpy(dtype=float, na_value=np.nan))
+    return df.astype(object).mask(missing, None)
+
+
+def _default(obj):
+    """Types neither encoder handles natively, encoded the way Flask's provider does"""
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, np.ndarray):
+        # Non-contiguous arrays; NaN in the list is still written as null
+        return obj.tolist()
+    if isinstance(obj, (np.integer, np.floating, np.bool_)):
+        return obj.item()
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def sanitize(obj):
+    """Recursively replace NaN and +/-Inf with None (only needed by the stdlib encoder)"""
+    if isinstance(obj, dict):
+        return {k: sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [sanitize(item) for item in obj]
+    if isinstance(obj, np.ndarray):
+        return sanitize(obj.tolist())
+    if isinstance(obj, (float, np.floating)):
+        return float(obj) if np.isfinite(obj) else None
+    if isinstance(obj, np.integer):
+        return int(obj)
+    return obj
+
+
+def dumps(obj):
+    """Encode ``obj`` as compact UTF-8 JSON bytes, writing NaN and +/-Inf as null.
+
+    With orjson installed this is a single pass in C (numpy scalars and arrays included);
+    otherwise the structure is sanitized once and encoded with the stdlib.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return dumps_stdlib(obj)
+
+
+def dumps_stdlib(obj):
+    return json.dumps(sanitize(obj), default=_default, separators=(',', ':'), allow_nan=False).encode()
+
+
+def negotiate_encoding(accept_encodings):
+    """Best supported content coding from a werkzeug ``Accept-Encoding`` header, or None"""
+    best, quality = None, 0
+    for encoding in ENCODINGS:
+        q = accept_encodings[encoding]
+        if q > quality:
+            best, quality = encoding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=Config.BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=Config.GZIP_LEVEL)
+    return body
+
+
+def encode_response(obj, accept_encodings):
+    """``(body, content_encoding)`` for a JSON response; small bodies are left uncompressed"""
+    body = dumps(obj)
+    encoding = negotiate_encoding(accept_encodings) if len(body) >= Config.COMPRESSION_MIN_BYTES else None
+    return compress(body, encoding), encoding
+
+
+def parse_schema_version(value):
+    """Response schema version from a request value (default ``Config.RESPONSE_SCHEMA_VERSION``)"""
+    if value is None or not str(value).strip():
+        return Config.RESPONSE_SCHEMA_VERSION
+    try:
+        version = int(value)
+    except ValueError:
+        version = None
+    if version not in SCHEMA_VERSIONS:
+        raise ValueError(f"Unsupported schema_version '{value}'. Use one of: {', '.join(map(str, SCHEMA_VERSIONS))}")
+    return version
+
+
+def parse_field_list(value):
+    """Comma-separated dotted paths (``eda.top_correlations``) from a request value, or None"""
+    if value is None or not str(value).strip():
+        return None
+    return [path.strip() for path in str(value).split(',') if path.strip()]
+
+
+def schema_v2(result, store=artifact_store):
+    """Version 2 of an analysis result: no section repeated, large artifacts referenced by id.
+
+    ``json_output`` (which re-embeds the insights and generated code) and the notebook become
+    downloadable artifacts, and each chart's PNG is replaced by an ``image`` reference.
+    """
+    if 'sheets' in result:
+        shaped = {key: value for key, value in result.items() if key != 'sheets'}
+        shaped['sheets'] = {name: schema_v2(sheet, store) for name, sheet in result['sheets'].items()}
+        shaped['schema_version'] = 2
+        return shaped
+
+    shaped = {key: value for key, value in result.items() if key not in ('json_output', 'notebook', 'charts')}
+    artifacts = {}
+    if result.get('json_output') is not None:
+        artifacts['json_output'] = store.add(dumps(result['json_output']), 'application/json', 'analysis.json')
+    if result.get('notebook') is not None:
+        artifacts['notebook'] = store.add(json.dumps(result['notebook'], indent=2).encode(), 'application/x-ipynb+json', 'analysis.ipynb')
+    charts = []
+    for number, chart in enumerate(result.get('charts') or [], 1):
+        chart = dict(chart)
+        image = chart.pop('image', None)
+        if image is not None:
+            chart['image'] = store.add(base64.b64decode(image), 'image/png', f'chart_{number}.png', attachment=False)
+        charts.append(chart)
+    shaped['charts'] = charts
+    shaped['artifacts'] = artifacts
+    shaped['schema_version'] = 2
+    return shaped
+
+
+def _lookup(obj, keys):
+    for key in keys:
+        if not isinstance(obj, dict) or key not in obj:
+            return False, None
+        obj = obj[key]
+    return True, obj
+
+
+def select_fields(result, fields=None, exclude=None):
+    """Keep only the dotted ``fields`` paths (plus ``ALWAYS_INCLUDED``), then drop the ``exclude``
+    paths. Unknown paths are ignored. Dicts along a path are copied, never modified in place.
+    Multi-sheet results apply the selection to every sheet."""
+    if 'sheets' in result:
+        shaped = dict(result)
+        shaped['sheets'] = {name: select_fields(sheet, fields, exclude) for name, sheet in result['sheets'].items()}
+        return shaped
+
+    if fields:
+        selected = {key: result[key] for key in ALWAYS_INCLUDED if key in result}
+        for path in fields:
+            keys = path.split('.')
+            found, value = _lookup(result, keys)
+            if not found:
+                continue
+            target = selected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+        result = selected
+
+    for path in exclude or ():
+        keys = path.split('.')
+        found, _ = _lookup(result, keys)
+        if not found:
+            continue
+        result = dict(result)
+        target = result
+        for key in keys[:-1]:
+            target[key] = dict(target[key])
+            target = target[key]
+        del target[keys[-1]]
+    return result
+
+
+def shape_result(result, version=1, fields=None, exclude=None):
+    """Apply the requested schema version and field selection to an analysis result"""
+    if version == 2:
+        result = schema_v2(result)
+    return select_fields(result, fields, exclude) if fields or exclude else result
@@ -0,0 +1,210 @@
+"""
+Zero-copy DataFrame handoff to worker processes through named shared-memory segments
+"""
+
+import inspect
+import os
+import pickle
+import uuid
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+# Python 3.13+ can attach without registering the segment with the attaching process's tracker
+_TRACK_PARAMETER = 'track' in inspect.signature(shared_memory.SharedMemory).parameters
+
+# Segments attached by this process, per published frame, reused by every task it runs
+_attached = {}
+
+
+def _is_raw(series):
+    """Columns whose values can be shared as a flat numpy buffer"""
+    dtype = series.dtype
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biufcmM'
+
+
+def _encode_uniques(uniques):
+    """Distinct values of a coded column as ``(kind, buffers)``: UTF-8 text as an int64 offsets
+    buffer plus a data buffer, anything else (mixed objects, extension values) as one pickle"""
+    values = np.asarray(uniques, dtype=object)
+    if pd.api.types.infer_dtype(values, skipna=False) in ('string', 'empty'):
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return 'text', {'offsets': offsets, 'data': np.frombuffer(b''.join(encoded), dtype=np.uint8)}
+    blob = pickle.dumps(uniques.array, protocol=pickle.HIGHEST_PROTOCOL)
+    return 'pickled', {'data': np.frombuffer(blob, dtype=np.uint8)}
+
+
+def _create(name, nbytes):
+    # Zero-length segments are not allowed; empty columns still get one byte
+    return shared_memory.SharedMemory(name=name, create=True, size=max(int(nbytes), 1))
+
+
+def _open(name):
+    if _TRACK_PARAMETER:
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older versions register the segment again; pool workers share the publisher's resource
+    # tracker, so the duplicate registration is a no-op and the publisher still owns cleanup
+    return shared_memory.SharedMemory(name=name)
+
+
+def _release(segments, owner_pid):
+    """Unmap every segment; the publishing process also removes them"""
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # A view is still alive; the mapping goes away with the process
+            pass
+        if os.getpid() == owner_pid:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedFrame:
+    """A DataFrame published once into shared memory and attached read-only by name.
+
+    Numeric, boolean and datetime64 columns are copied into one segment each and attached as
+    read-only numpy views, so workers never receive a pickled copy of the values. Any other
+    column (text, mixed, extension dtypes) is shared as int32/int64 codes, and its distinct
+    values go into segments too: text as UTF-8 offsets and data buffers, other values as one
+    pickle. The ``handle`` only names segments, so it stays small however wide the data is.
+    Each process decodes a column's distinct values once (missing values in object columns come
+    back as NaN). The index is not shared: attached frames are position-indexed.
+
+    The publishing process owns the segments. ``close`` (or leaving the ``with`` block) removes
+    them even when a worker has crashed, and a finalizer does the same if the object is dropped.
+    If the publisher itself dies, the multiprocessing resource tracker removes them.
+    """
+
+    def __init__(self, handle, segments, owner_pid):
+        self.handle = handle
+        self.segments = segments
+        self.owner_pid = owner_pid
+        self._by_name = {segment.name.lstrip('/'): segment for segment in segments}
+        self._uniques = {}
+        self._finalizer = weakref.finalize(self, _release, segments, owner_pid)
+
+    @classmethod
+    def publish(cls, df):
+        token = uuid.uuid4().hex[:12]
+        columns, segments = [], []
+
+        def share(name, values):
+            segment = _create(name, values.nbytes)
+            segments.append(segment)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[:] = values
+            return {'segment': segment.name, 'dtype': values.dtype.str, 'length': len(values)}
+
+        try:
+            for idx, name in enumerate(df.columns):
+                series = df.iloc[:, idx]
+                column = {'name': name, 'source_dtype': series.dtype, 'kind': 'raw'}
+                if _is_raw(series):
+                    values = series.to_numpy()
+                else:
+                    values, uniques = pd.factorize(series, use_na_sentinel=True)
+                    values = values.astype(np.int32 if len(uniques) < 2**31 else np.int64, copy=False)
+                    column['kind'], buffers = _encode_uniques(uniques)
+                    for part, buffer in buffers.items():
+                        column[part] = share(f'ada_{token}_{idx}_{part}', buffer)
+                column['values'] = share(f'ada_{token}_{idx}', values)
+                columns.append(column)
+        except BaseException:
+            _release(segments, os.getpid())
+            raise
+        handle = {'id': token, 'rows': len(df), 'columns': columns}
+        return cls(handle, segments, os.getpid())
+
+    @classmethod
+    def attach(cls, handle):
+        """Map a published frame in this process (once; later calls reuse the mapping)"""
+        shared = _attached.get(handle['id'])
+        if shared is None:
+            segments = []
+            try:
+                for column in handle['columns']:
+                    for part in ('values', 'offsets', 'data'):
+                        if part in column:
+                            segments.append(_open(column[part]['segment']))
+            except BaseException:
+                _release(segments, None)
+                raise
+            shared = cls(handle, segments, None)
+            _attached[handle['id']] = shared
+        return shared
+
+    def _buffer(self, buffer):
+        segment = self._by_name[buffer['segment'].lstrip('/')]
+        view = np.ndarray((buffer['length'],), dtype=np.dtype(buffer['dtype']), buffer=segment.buf)
+        view.flags.writeable = False
+        return view
+
+    def _values(self, idx):
+        return self._buffer(self.handle['columns'][idx]['values'])
+
+    def _distinct(self, idx):
+        """Distinct values of coded column ``idx``, decoded from shared memory once per process"""
+        uniques = self._uniques.get(idx)
+        if uniques is None:
+            column = self.handle['columns'][idx]
+            data = self._buffer(column['data'])
+            if column['kind'] == 'text':
+                offsets = self._buffer(column['offsets']).tolist()
+                raw = data.tobytes()
+                decoded = np.empty(len(offsets) - 1, dtype=object)
+                decoded[:] = [raw[begin:end].decode('utf-8', 'surrogatepass')
+                              for begin, end in zip(offsets[:-1], offsets[1:])]
+                uniques = pd.array(decoded, dtype=object)
+            else:
+                uniques = pickle.loads(data)
+            self._uniques[idx] = uniques
+        return uniques
+
+    def frame(self, start=0, stop=None, columns=None):
+        """Rows ``start:stop`` (of ``columns``, default all) as a DataFrame. Raw columns are
+        read-only views of the shared buffers; coded columns are decoded for just these rows."""
+        arrays, names = {}, []
+        for idx, column in enumerate(self.handle['columns']):
+            if columns is not None and column['name'] not in columns:
+                continue
+            values = self._values(idx)[start:stop]
+            if column['kind'] != 'raw':
+                values = pd.Series(self._distinct(idx).take(values, allow_fill=True), dtype=column['source_dtype'])
+            arrays[idx] = values
+            names.append(column['name'])
+        df = pd.DataFrame(arrays, copy=False)
+        df.columns = names
+        return df
+
+    def raw_columns(self):
+        """Columns attached as zero-copy views (numeric, boolean, datetime64)"""
+        return [column['name'] for column in self.handle['columns'] if column['kind'] == 'raw']
+
+    @property
+    def nbytes(self):
+        return sum(segment.size for segment in self.segments)
+
+    def close(self):
+        """Unmap the segments (and unlink them in the publishing process)"""
+        if self.owner_pid is None:
+            _attached.pop(self.handle['id'], None)
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def read_shared(handle, start=0, stop=None, columns=None):
+    """Worker-side helper: rows ``start:stop`` of a published frame"""
+    return SharedFrame.attach(handle).frame(start, stop, columns)
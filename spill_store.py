@@ -0,0 +1,112 @@
+"""
+Memory-mapped column store that lets the OS page cleaned datasets out to disk
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+
+def _code_dtype(categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _write(path, values):
+    """Write ``values`` as an .npy file without holding a second in-memory copy"""
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=values.dtype, shape=values.shape)
+    out[:] = values
+    out.flush()
+    del out
+
+
+class SpillStore:
+    """Cleaned columns written to .npy files in a per-analysis directory and read back as
+    memory-mapped views, so their pages can be evicted under memory pressure.
+
+    Numeric, boolean and datetime64 columns (and the index) are stored as they are. Other
+    columns with at most ``Config.SPILL_MAX_CATEGORIES`` distinct values are stored as integer
+    codes and come back as Categoricals over those codes. Higher-cardinality text stays in
+    memory. Views are copy-on-write: writing to the frame never changes the files. The directory
+    is removed by ``close`` or, failing that, when the store is garbage collected.
+    """
+
+    def __init__(self, directory, columns, index, resident):
+        self.directory = directory
+        self.columns = columns
+        self.index = index
+        self.resident = resident
+        self._finalizer = weakref.finalize(self, shutil.rmtree, directory, True)
+
+    @classmethod
+    def from_frame(cls, df, root=None):
+        directory = tempfile.mkdtemp(prefix='analysis_spill_', dir=root or Config.SPILL_DIR)
+        columns, resident = [], {}
+        try:
+            for idx, name in enumerate(df.columns):
+                series = df.iloc[:, idx]
+                path = os.path.join(directory, f'{idx}.npy')
+                dtype = series.dtype
+                if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+                    _write(path, series.to_numpy())
+                    columns.append({'name': name, 'path': path, 'categories': None})
+                    continue
+                codes, uniques = pd.factorize(series, use_na_sentinel=True)
+                if len(uniques) > Config.SPILL_MAX_CATEGORIES:
+                    resident[idx] = series
+                    columns.append({'name': name, 'path': None, 'categories': None})
+                    continue
+                _write(path, codes.astype(_code_dtype(len(uniques)), copy=False))
+                columns.append({'name': name, 'path': path, 'categories': uniques})
+            index = {'name': df.index.name, 'path': None, 'values': df.index}
+            if isinstance(df.index.dtype, np.dtype) and df.index.dtype.kind in 'iu' and not isinstance(df.index, pd.RangeIndex):
+                index['path'] = os.path.join(directory, 'index.npy')
+                _write(index['path'], df.index.to_numpy())
+                index['values'] = None
+        except BaseException:
+            shutil.rmtree(directory, True)
+            raise
+        return cls(directory, columns, index, resident)
+
+    def frame(self):
+        """The spilled DataFrame; column values are read from disk as they are touched"""
+        arrays = {}
+        for idx, column in enumerate(self.columns):
+            if column['path'] is None:
+                arrays[idx] = self.resident[idx]
+                continue
+            values = np.load(column['path'], mmap_mode='c')
+            if column['categories'] is not None:
+                values = pd.Categorical.from_codes(values, column['categories'])
+            arrays[idx] = values
+        if self.index['path'] is not None:
+            index = pd.Index(np.load(self.index['path'], mmap_mode='c'), name=self.index['name'])
+        else:
+            index = self.index['values']
+        df = pd.DataFrame(arrays, copy=False)
+        df.columns = [column['name'] for column in self.columns]
+        df.index = index
+        return df
+
+    @property
+    def nbytes(self):
+        """Bytes on disk"""
+        return sum(os.path.getsize(c['path']) for c in self.columns if c['path'] is not None)
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,214 @@
+"""
+Dialect-aware SQL for the generated queries and an embedded SQLite copy of the cleaned data to run them on
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+import pandas as pd
+
+from config import Config
+
+
+DIALECTS = ('standard', 'postgresql', 'mysql', 'bigquery', 'sqlite')
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Keywords that commonly turn up as column names and must be quoted in at least one dialect
+_RESERVED = {'all', 'and', 'as', 'asc', 'by', 'case', 'check', 'column', 'count', 'current', 'date', 'day', 'default',
+             'desc', 'distinct', 'end', 'from', 'group', 'having', 'hour', 'in', 'index', 'interval', 'is', 'join',
+             'key', 'like', 'limit', 'minute', 'month', 'not', 'null', 'or', 'order', 'partition', 'range', 'rank',
+             'rows', 'second', 'select', 'table', 'time', 'timestamp', 'to', 'union', 'user', 'value', 'values',
+             'when', 'where', 'window', 'with', 'year'}
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class SQLDialect:
+    """The few constructs that differ between the supported SQL dialects"""
+
+    def __init__(self, name=None):
+        name = str(name or Config.SQL_DIALECT).lower()
+        if name not in DIALECTS:
+            raise ValueError(f"Unknown SQL dialect '{name}'. Use one of: {', '.join(DIALECTS)}")
+        self.name = name
+
+    def quote(self, identifier):
+        """``identifier`` as written in a query; quoted only when it is not a plain name"""
+        identifier = str(identifier)
+        if _IDENTIFIER.match(identifier) and identifier.lower() not in _RESERVED:
+            return identifier
+        if self.name in ('mysql', 'bigquery'):
+            return '`' + identifier.replace('`', '``') + '`'
+        return '"' + identifier.replace('"', '""') + '"'
+
+    def periods(self, grain, column):
+        """``(expression, alias)`` pairs that bucket ``column`` by month or year. Standard SQL
+        has no truncation function, so it groups by the EXTRACTed year (and month)."""
+        col = self.quote(column)
+        if self.name == 'standard':
+            parts = [('YEAR', 'year')] + ([('MONTH', 'month')] if grain == 'month' else [])
+            return [(f"EXTRACT({part} FROM {col})", alias) for part, alias in parts]
+        if self.name == 'postgresql':
+            expression = f"DATE_TRUNC('{grain}', {col})"
+        elif self.name == 'bigquery':
+            expression = f"DATE_TRUNC(DATE({col}), {grain.upper()})"
+        else:
+            pattern = '%Y-%m-01' if grain == 'month' else '%Y-01-01'
+            expression = f"DATE_FORMAT({col}, '{pattern}')" if self.name == 'mysql' else f"strftime('{pattern}', {col})"
+        return [(expression, grain)]
+
+    def timestamp(self, value):
+        text = pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+        return f"'{text}'" if self.name in ('mysql', 'sqlite') else f"TIMESTAMP '{text}'"
+
+    def limit(self, n):
+        return f"FETCH FIRST {n} ROWS ONLY" if self.name == 'standard' else f"LIMIT {n}"
+
+
+def generate_queries(dialect, table='dataset', group_col=None, value_col=None, date_col=None, trend_col=None, since=None):
+    """The analysis's SQL queries for ``dialect``, shaped so an index can serve them: grouping
+    on a bare column, date filters as ranges on the column rather than functions of it, and
+    GROUP BY the bucketing expression itself, which every dialect accepts.
+
+    ``value_col`` is totalled per ``group_col``; ``trend_col`` per period of ``date_col``, with
+    a ``since`` lower bound for the trailing-year query.
+    """
+    q = dialect.quote
+    queries = [{"name": "Top 10 Records", "query": f"SELECT * FROM {table} {dialect.limit(10)};"}]
+
+    if group_col and value_col:
+        total = q(f'total_{value_col}')
+        queries.append({
+            "name": f"Top 10 by {value_col}",
+            "query": f"SELECT {q(group_col)}, SUM({q(value_col)}) AS {total}\nFROM {table}\nGROUP BY {q(group_col)}\nORDER BY {total} DESC\n{dialect.limit(10)};"
+        })
+
+    if date_col and trend_col:
+        for grain, name, extra in (('month', 'Monthly Trend', ''), ('year', 'Yearly Trend', f",\n       AVG({q(trend_col)}) AS {q(f'avg_{trend_col}')}")):
+            periods = dialect.periods(grain, date_col)
+            select = ',\n       '.join(f"{expression} AS {q(alias)}" for expression, alias in periods)
+            queries.append({
+                "name": name,
+                "query": f"SELECT {select},\n       SUM({q(trend_col)}) AS {q(f'total_{trend_col}')}{extra}\nFROM {table}\nGROUP BY {', '.join(e for e, _ in periods)}\nORDER BY {', '.join(q(a) for _, a in periods)};"
+            })
+        if since is not None:
+            periods = dialect.periods('month', date_col)
+            select = ',\n       '.join(f"{expression} AS {q(alias)}" for expression, alias in periods)
+            queries.append({
+                "name": "Last 12 Months",
+                "query": f"SELECT {select},\n       SUM({q(trend_col)}) AS {q(f'total_{trend_col}')}\nFROM {table}\nWHERE {q(date_col)} >= {dialect.timestamp(since)}\nGROUP BY {', '.join(e for e, _ in periods)}\nORDER BY {', '.join(q(a) for _, a in periods)};"
+            })
+
+    queries.append({
+        "name": "Data Quality Check",
+        "query": f"SELECT COUNT(*) AS total_records,\n       (SELECT COUNT(*) FROM (SELECT DISTINCT * FROM {table}) AS distinct_rows) AS unique_records\nFROM {table};"
+    })
+    return queries
+
+
+def _sql_type(series):
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _sql_values(series):
+    """Python values SQLite accepts: ints, floats, ISO timestamp text, text, and None"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = series.dt.strftime(TIMESTAMP_FORMAT)
+    values = series.to_numpy(dtype=object)
+    missing = pd.isna(values)
+    if missing.any():
+        values[missing] = None
+    return values.tolist()
+
+
+class SQLiteMirror:
+    """The cleaned frame loaded into SQLite (in memory, or a temporary file under ``directory``)
+    so generated queries can be checked and timed against the real data.
+
+    Rows are bulk-inserted in ``Config.SQL_INSERT_BATCH`` batches inside one transaction with
+    journaling off, and the indexes are created after the load. Each index leads with a
+    grouping or date column and also covers the measure the queries aggregate.
+    """
+
+    def __init__(self, connection, table, path=None):
+        self.connection = connection
+        self.table = table
+        self.path = path
+
+    @classmethod
+    def from_frame(cls, df, indexes=(), table='dataset', directory=None):
+        directory = Config.SQL_DATABASE_DIR if directory is None else directory
+        path = None
+        if directory:
+            fd, path = tempfile.mkstemp(prefix='analysis_', suffix='.sqlite', dir=directory)
+            os.close(fd)
+        connection = sqlite3.connect(path or ':memory:', check_same_thread=False)
+        mirror = cls(connection, table, path)
+        try:
+            mirror._load(df, indexes)
+        except BaseException:
+            mirror.close()
+            raise
+        return mirror
+
+    def _load(self, df, indexes):
+        quote = SQLDialect('sqlite').quote
+        for pragma in ('journal_mode = OFF', 'synchronous = OFF', 'temp_store = MEMORY'):
+            self.connection.execute(f'PRAGMA {pragma}')
+        columns = ', '.join(f'{quote(col)} {_sql_type(df[col])}' for col in df.columns)
+        self.connection.execute(f'CREATE TABLE {self.table} ({columns})')
+        insert = f"INSERT INTO {self.table} VALUES ({', '.join('?' * len(df.columns))})"
+        with self.connection:
+            for start in range(0, len(df), Config.SQL_INSERT_BATCH):
+                batch = df.iloc[start:start + Config.SQL_INSERT_BATCH]
+                self.connection.executemany(insert, zip(*(_sql_values(batch[col]) for col in batch.columns)))
+            for number, columns in enumerate(indexes):
+                columns = ', '.join(quote(col) for col in columns)
+                self.connection.execute(f'CREATE INDEX idx_{self.table}_{number} ON {self.table} ({columns})')
+        self.connection.execute('ANALYZE')
+
+    def execute(self, sql, preview_rows=None):
+        """Run ``sql`` and return ``valid``, the execution time, the row count, a preview of the
+        first rows and SQLite's query plan, or ``valid: False`` with the error"""
+        preview_rows = Config.SQL_PREVIEW_ROWS if preview_rows is None else preview_rows
+        try:
+            plan = [row[3] for row in self.connection.execute(f'EXPLAIN QUERY PLAN {sql}')]
+            start = time.perf_counter()
+            cursor = self.connection.execute(sql)
+            rows = cursor.fetchall()
+            elapsed = time.perf_counter() - start
+        except sqlite3.Error as e:
+            return {'engine': 'sqlite', 'valid': False, 'error': str(e)}
+        names = [column[0] for column in cursor.description or ()]
+        return {
+            'engine': 'sqlite',
+            'valid': True,
+            'execution_ms': round(elapsed * 1000, 3),
+            'rows': len(rows),
+            'preview': [dict(zip(names, row)) for row in rows[:preview_rows]],
+            'plan': plan
+        }
+
+    def close(self):
+        self.connection.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
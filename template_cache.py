@@ -0,0 +1,90 @@
+"""
+Generated code, SQL, DAX and notebooks cached per schema fingerprint, with the data-dependent parts left as slots
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from config import Config
+from metrics import metrics
+
+
+_SLOT = re.compile('\x00(\\w+)\x00')
+
+
+def slot(name):
+    """Marker for the data-dependent value ``name`` inside a template; replaced by ``fill``"""
+    return f'\x00{name}\x00'
+
+
+def fill(template, values):
+    """Copy of ``template`` with its slots replaced from ``values``.
+
+    A string that is exactly one slot becomes the value itself (and is dropped from a list when
+    the value is None); slots inside longer strings are replaced by the value's text. Dicts and
+    lists are always copied, so the result can be modified without touching the cached template.
+    """
+    if isinstance(template, str):
+        if '\x00' not in template:
+            return template
+        match = _SLOT.fullmatch(template)
+        if match:
+            return values[match.group(1)]
+        return _SLOT.sub(lambda m: str(values[m.group(1)]), template)
+    if isinstance(template, dict):
+        return {key: fill(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        items = [fill(item, values) for item in template]
+        return [item for item, source in zip(items, template) if item is not None or source is None]
+    return template
+
+
+def schema_fingerprint(schema):
+    """Stable hex digest of a JSON-able schema description"""
+    encoded = json.dumps(schema, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class TemplateCache:
+    """Thread-safe map of ``(fingerprint, artifact, variant)`` to a generated template, holding at
+    most ``Config.TEMPLATE_CACHE_ENTRIES`` (least recently used evicted; 0 disables caching).
+    Hits and misses are counted in the metrics registry."""
+
+    def __init__(self, capacity=None):
+        self.capacity = Config.TEMPLATE_CACHE_ENTRIES if capacity is None else capacity
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """The template cached under ``key``, or ``build()``'s (cached for the next same-shaped dataset)"""
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+        if template is not None:
+            metrics.inc('template_cache_hits')
+            return template
+        metrics.inc('template_cache_misses')
+        template = build()
+        if self.capacity > 0:
+            with self._lock:
+                self._templates[key] = template
+                while len(self._templates) > self.capacity:
+                    self._templates.popitem(last=False)
+                size = len(self._templates)
+            metrics.set_gauge('template_cache_entries', size)
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+        metrics.set_gauge('template_cache_entries', 0)
+
+    def __len__(self):
+        return len(self._templates)
+
+
+template_cache = TemplateCache()
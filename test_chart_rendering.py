@@ -0,0 +1,65 @@
+"""
+Concurrency stress test for chart rendering
+Renders the same datasets serially and from a thread pool and checks the images are byte-identical
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app import DataAnalyst
+
+THREADS = 4
+ROUNDS = 2
+
+
+def make_dataset(seed):
+    """Sample sales data; each seed gives a different dataset"""
+    rng = np.random.default_rng(seed)
+    n = 300
+    return pd.DataFrame({
+        'Product': rng.choice(['Laptop', 'Mouse', 'Keyboard', 'Monitor', 'Headphones'], n),
+        'Region': rng.choice(['North', 'South', 'East', 'West'], n),
+        'Sales': rng.uniform(100, 5000, n),
+        'Quantity': rng.integers(1, 20, n),
+        'Profit': rng.uniform(10, 500, n),
+        'Rating': rng.uniform(1, 5, n)
+    })
+
+
+def render_charts(seed):
+    analyst = DataAnalyst(make_dataset(seed))
+    analyst.understand_data()
+    analyst.clean_data()
+    return [(chart['title'], chart['image']) for chart in analyst.generate_visualizations()]
+
+
+def test_threaded_rendering_matches_serial():
+    seeds = list(range(THREADS))
+    serial = {seed: render_charts(seed) for seed in seeds}
+    assert all(serial[seed] for seed in seeds), "No charts were rendered"
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        for _ in range(ROUNDS):
+            # Every dataset is rendered by several threads at the same time
+            jobs = seeds * 2
+            results = list(pool.map(render_charts, jobs))
+            for seed, charts in zip(jobs, results):
+                assert [title for title, _ in charts] == [title for title, _ in serial[seed]]
+                for (title, image), (_, expected) in zip(charts, serial[seed]):
+                    assert image == expected, f"Chart '{title}' for dataset {seed} differs from serial rendering"
+
+
+def test_rendering_leaves_no_pyplot_figures():
+    import matplotlib.pyplot as plt
+    render_charts(0)
+    assert plt.get_fignums() == []
+
+
+if __name__ == '__main__':
+    print(f"Rendering {THREADS} datasets serially and from {THREADS} threads ({ROUNDS} rounds)...")
+    test_threaded_rendering_matches_serial()
+    print("✓ Threaded charts are byte-identical to serial rendering")
+    test_rendering_leaves_no_pyplot_figures()
+    print("✓ No pyplot figures left open")
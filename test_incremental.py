@@ -0,0 +1,93 @@
+"""
+Incremental state checks: batches appended one by one against a one-shot pass over all rows
+"""
+
+import numpy as np
+import pandas as pd
+
+from incremental import IncrementalState
+from rollups import TimeRollup
+
+
+def make_batch(rows, start, seed, discount=False):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Date': pd.date_range(start, periods=rows, freq='D'),
+        'Region': rng.choice(['North', 'South', 'East', 'West'], rows),
+        'Sales': rng.gamma(2, 100, rows).round(2),
+        'Profit': rng.normal(20, 5, rows).round(2),
+    })
+    df['Profit'] += df['Sales'] * 0.1
+    df.loc[rng.random(rows) < 0.05, 'Sales'] = np.nan
+    if discount:
+        # A numeric column the first batch did not have
+        df['Discount'] = rng.uniform(0, 0.3, rows).round(3)
+    return df
+
+
+def make_batches():
+    first = make_batch(300, '2021-01-01', 1)
+    # Five rows repeated inside the second batch's second chunk
+    second = make_batch(300, '2021-11-01', 2, discount=True)
+    second = pd.concat([second, second.iloc[200:205]], ignore_index=True)
+    # Twenty rows repeated from the first batch
+    third = pd.concat([make_batch(200, '2022-09-01', 3), first.iloc[50:70]], ignore_index=True)
+    return [first, second, third]
+
+
+def appended_state():
+    state = IncrementalState('batches.csv')
+    for batch in make_batches():
+        # Two chunks per batch, as an upload is read in CHUNK_SIZE pieces
+        state.append([batch.iloc[:150], batch.iloc[150:]])
+    return state
+
+
+def expected_rows():
+    return pd.concat(make_batches(), ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def test_repeated_rows_are_skipped():
+    state, expected = appended_state(), expected_rows()
+    assert state.rows == len(expected) == 800
+    assert state.batches == 3
+    assert state.duplicates_skipped == 5
+    assert state.hash_matches_skipped == 20
+
+
+def test_profile_matches_one_pass():
+    state, expected = appended_state(), expected_rows()
+    summary = state.profiler.numerical_summary()
+    assert sorted(summary) == ['Discount', 'Profit', 'Sales']
+    described = expected[['Sales', 'Profit', 'Discount']].describe()
+    for col, stats in summary.items():
+        for stat, value in stats.items():
+            assert np.isclose(value, described.loc[stat, col], rtol=1e-9), (col, stat)
+    assert state.profiler.missing_values() == {col: int(n) for col, n in expected.isna().sum().items() if n}
+    assert state.profiler.categorical_summary(['Region'])['Region'] == expected['Region'].value_counts().to_dict()
+
+
+def test_time_rollups_match_one_pass():
+    state, expected = appended_state(), expected_rows()
+    merged = state.time_rollups['Date']
+    assert sorted(merged.value_cols) == ['Discount', 'Profit', 'Sales']
+    direct = TimeRollup.from_frame(expected, 'Date', merged.value_cols)
+    assert merged.rows == direct.rows
+    for grain in ('month', 'year'):
+        for col in merged.value_cols:
+            pd.testing.assert_frame_equal(merged.frame(grain, col), direct.frame(grain, col), check_dtype=False, rtol=1e-9)
+
+
+def test_correlations_match_one_pass():
+    state, expected = appended_state(), expected_rows()
+    stats = state.correlation_stats
+    assert stats.rows == len(expected)
+    np.testing.assert_allclose(stats.correlations(), expected[stats.columns].corr().to_numpy(), atol=1e-9)
+
+
+if __name__ == '__main__':
+    test_repeated_rows_are_skipped()
+    test_profile_matches_one_pass()
+    test_time_rollups_match_one_pass()
+    test_correlations_match_one_pass()
+    print("All incremental checks passed")
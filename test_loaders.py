@@ -0,0 +1,57 @@
+"""
+Streaming Excel and JSON loader checks against pandas.read_excel and pandas.json_normalize
+"""
+
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+
+from loaders import flatten_nested, read_excel_sheets, read_excel_stream
+
+
+def make_workbook(sheets):
+    """.xlsx bytes with one sheet per ``{name: rows}`` entry (the first row is the header)"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def test_repeated_headers_are_renamed_like_pandas():
+    data = make_workbook({'Data': [['Sales', 'Region', 'Sales', 'Sales.1', 'Sales'], [1, 'North', 2, 3, 4], [5, 'South', 6, 7, 8]]})
+    df = read_excel_stream(BytesIO(data))
+    expected = pd.read_excel(BytesIO(data))
+    assert list(df.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_parallel_sheets_match_serial():
+    sheets = {f'Sheet{i}': [['Order_ID', 'Sales']] + [[row, row * i] for row in range(50)] for i in range(3)}
+    data = make_workbook(sheets)
+    serial = read_excel_sheets(BytesIO(data), max_workers=1)
+    parallel = read_excel_sheets(BytesIO(data), max_workers=2)
+    assert list(parallel) == list(sheets)
+    for name in sheets:
+        pd.testing.assert_frame_equal(parallel[name], serial[name])
+
+
+def test_flatten_keeps_scalars_beside_objects():
+    records = [{'id': 1, 'meta': {'a': 1, 'b': {'c': 2}}}, {'id': 2, 'meta': 'plain'}, {'id': 3, 'meta': None}]
+    df = flatten_nested(pd.DataFrame({'id': [1, 2, 3], 'meta': [r['meta'] for r in records]}, dtype=object))
+    expected = pd.json_normalize(records)
+    assert list(df.columns) == list(expected.columns)
+    assert df['meta'].tolist()[1] == 'plain'
+    assert df['meta.b.c'].tolist()[0] == 2
+
+
+if __name__ == '__main__':
+    test_repeated_headers_are_renamed_like_pandas()
+    test_parallel_sheets_match_serial()
+    test_flatten_keeps_scalars_beside_objects()
+    print("All loader checks passed")
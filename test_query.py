@@ -0,0 +1,127 @@
+"""
+Drill-down query engine checks against the equivalent pandas expressions
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from outliers import detect_outliers
+from query import QueryEngine, parse_query
+
+
+def make_frame(rows=500, seed=7):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Date': pd.date_range('2023-01-01', periods=rows, freq='17h'),
+        'Region': rng.choice(['North', 'South', 'East', 'West'], rows).astype(object),
+        # Few distinct values, so sorting has long runs of ties
+        'Score': rng.integers(0, 6, rows).astype(float),
+        'Sales': rng.gamma(2, 100, rows).round(2),
+    })
+    df.loc[rng.random(rows) < 0.1, 'Score'] = np.nan
+    df.loc[rng.random(rows) < 0.1, 'Region'] = None
+    df.loc[rng.random(rows) < 0.02, 'Date'] = pd.NaT
+    df.loc[:4, 'Sales'] = [5000.0, 4000.0, -900.0, 6000.0, 7000.0]
+    return df
+
+
+def make_engine(df):
+    virtual = {'Date_Month': ('Date', 'Month'), 'Date_Quarter': ('Date', 'Quarter')}
+    return QueryEngine(df, virtual, detect_outliers(df, ['Score', 'Sales'], method='IQR'))
+
+
+def run(engine, spec):
+    return engine.run(parse_query(dict({'limit': Config.QUERY_MAX_LIMIT}, **spec)))
+
+
+def positions(result):
+    return [row['_row'] for row in result['rows']]
+
+
+def test_descending_sort_is_stable():
+    df = make_frame()
+    engine = make_engine(df)
+    expected = df.sort_values('Score', ascending=False, kind='stable', na_position='last').index.tolist()
+    assert positions(run(engine, {'sort': [{'column': 'Score', 'descending': True}]})) == expected
+
+    east = df[df['Region'] == 'East']
+    expected = east.sort_values('Score', ascending=False, kind='stable', na_position='last').index.tolist()
+    result = run(engine, {'filters': [{'column': 'Region', 'op': 'eq', 'value': 'East'}], 'sort': ['-Score']})
+    assert positions(result) == expected
+
+
+def test_ne_and_not_in_exclude_nulls():
+    df = make_frame()
+    engine = make_engine(df)
+    result = run(engine, {'filters': [{'column': 'Score', 'op': 'ne', 'value': 2}]})
+    assert positions(result) == df.index[(df['Score'] != 2) & df['Score'].notna()].tolist()
+
+    result = run(engine, {'filters': [{'column': 'Region', 'op': 'ne', 'value': 'North'}]})
+    assert positions(result) == df.index[(df['Region'] != 'North') & df['Region'].notna()].tolist()
+
+    result = run(engine, {'filters': [{'column': 'Region', 'op': 'not_in', 'value': ['North', 'South']}]})
+    assert positions(result) == df.index[~df['Region'].isin(['North', 'South']) & df['Region'].notna()].tolist()
+
+    result = run(engine, {'filters': [{'column': 'Score', 'op': 'not_in', 'value': [0, 1]}]})
+    assert positions(result) == df.index[~df['Score'].isin([0, 1]) & df['Score'].notna()].tolist()
+
+
+def test_date_part_columns():
+    df = make_frame()
+    engine = make_engine(df)
+    result = run(engine, {'filters': [{'column': 'Date_Month', 'op': 'eq', 'value': 3}]})
+    assert positions(result) == df.index[df['Date'].dt.month == 3].tolist()
+
+    result = run(engine, {'group_by': ['Date_Quarter'], 'aggregates': [{'column': 'Sales', 'func': 'sum'}]})
+    grouped = df.groupby(df['Date'].dt.quarter)['Sales'].sum()
+    sums = {row['Date_Quarter']: row['sum_Sales'] for row in result['rows']}
+    assert sums.pop(None) == df.loc[df['Date'].isna(), 'Sales'].sum()
+    assert sums.keys() == set(grouped.index)
+    for quarter, total in grouped.items():
+        assert np.isclose(sums[quarter], total)
+
+
+def test_outlier_filter():
+    df = make_frame()
+    engine = make_engine(df)
+    q1, q3 = df['Sales'].quantile([0.25, 0.75])
+    fence = Config.IQR_MULTIPLIER * (q3 - q1)
+    flagged = (df['Sales'] < q1 - fence) | (df['Sales'] > q3 + fence)
+    assert flagged[:5].all()
+    result = run(engine, {'filters': [{'op': 'outlier', 'column': 'Sales'}]})
+    assert positions(result) == df.index[flagged].tolist()
+
+    # Without a column: rows flagged in any checked column
+    any_column = run(engine, {'filters': [{'op': 'outlier'}]})
+    assert set(positions(result)) <= set(positions(any_column))
+
+
+def test_limit_and_total_counts():
+    df = make_frame()
+    engine = make_engine(df)
+    matching = df[df['Sales'].between(100, 300)]
+    result = engine.run(parse_query({'filters': [{'column': 'Sales', 'op': 'between', 'value': [100, 300]}], 'limit': 5}))
+    assert result['matched_rows'] == result['total'] == len(matching)
+    assert result['returned'] == 5
+    assert positions(result) == matching.index[:5].tolist()
+
+    spec = {'group_by': ['Region'], 'aggregates': [{'column': 'Sales', 'func': 'mean'}, 'count'],
+            'sort': [{'column': 'mean_Sales', 'descending': True}], 'limit': 2}
+    result = engine.run(parse_query(spec))
+    grouped = df.groupby('Region', dropna=False)['Sales'].agg(['mean', 'size']).sort_values('mean', ascending=False)
+    assert result['matched_rows'] == len(df)
+    assert result['total'] == len(grouped)
+    assert result['returned'] == 2
+    for row, (_, expected) in zip(result['rows'], grouped.head(2).iterrows()):
+        assert np.isclose(row['mean_Sales'], expected['mean'])
+        assert row['count'] == expected['size']
+
+
+if __name__ == '__main__':
+    test_descending_sort_is_stable()
+    test_ne_and_not_in_exclude_nulls()
+    test_date_part_columns()
+    test_outlier_filter()
+    test_limit_and_total_counts()
+    print("All query checks passed")